@@ -0,0 +1,453 @@
+"""
+Ponto de entrada ASGI (ex.: `uvicorn api.asgi:app --workers 2`).
+
+As rotas dos quiosques e dos ecrãs são servidas diretamente no event loop:
+POST /api/feedback, POST /api/feedback/batch, GET /api/public/summary e o feed
+SSE GET /api/stream. Cada ligação SSE é só uma corrotina à espera de um
+asyncio.Event (em vez de um thread bloqueado), por isso milhares de ecrãs
+ligados não esgotam o servidor. O SQLite continua síncrono: as consultas correm
+num pool dedicado de ASGI_DB_THREADS threads (cada um com a sua ligação, ver
+get_db) e o Firestore já está fora do caminho do pedido (outbox/reconciliação).
+
+As restantes rotas (admin, exportações, ficheiros estáticos) passam pela app
+Flask através do asgiref (WsgiToAsgi), com no máximo ASGI_WSGI_THREADS pedidos
+em simultâneo, cada um no seu thread, para que uma exportação lenta não atrase
+os toques dos quiosques.
+
+O deploy na Vercel continua a usar api/index.py (WSGI).
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Ensure project root is on sys.path so we can import app.py
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from itsdangerous import BadSignature  # noqa: E402
+from werkzeug.http import parse_accept_header, parse_cookie, parse_etags  # noqa: E402
+
+import app as feedback_app  # noqa: E402
+
+ASGI_DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', '4'))
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', '16'))
+
+# Aqui cada ligação SSE é só uma corrotina: o feed fica ativo salvo LIVE_STREAM=0
+if 'LIVE_STREAM' not in os.environ:
+    feedback_app.LIVE_STREAM_ENABLED = True
+
+_db_pool = ThreadPoolExecutor(max_workers=ASGI_DB_THREADS, thread_name_prefix='asgi-db')
+
+JSON_HEADERS = [(b'content-type', b'application/json')]
+
+
+def run_db(func, *args):
+    """Corre `func(conn, *args)` no pool SQLite (a ligação é a do thread, ver get_db)."""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_db_pool, lambda: func(feedback_app.get_db(), *args))
+
+
+def dump_json(payload):
+    # Mesmo formato do jsonify (app.json.compact, chaves ordenadas)
+    return json.dumps(payload, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+async def send_response(send, status, body=b'', headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': list(headers) + [(b'content-length', str(len(body)).encode('latin-1'))],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(scope, send, payload, status=200, headers=()):
+    body, headers = compress_body(scope, dump_json(payload), JSON_HEADERS + list(headers))
+    await send_response(send, status, body, headers)
+
+
+def compress_body(scope, body, headers):
+    """Mesma regra do compress_response do Flask, para o mesmo URL responder igual nos dois modos.
+
+    Vary: Accept-Encoding sempre; gzip/brotli só acima de COMPRESS_MIN_BYTES e
+    nesse caso o ETag passa a fraco.
+    """
+    headers = list(headers) + [(b'vary', b'Accept-Encoding')]
+    if len(body) < feedback_app.COMPRESS_MIN_BYTES:
+        return body, headers
+    encodings = ['br', 'gzip'] if feedback_app.get_brotli() else ['gzip']
+    encoding = parse_accept_header(header(scope, b'accept-encoding')).best_match(encodings)
+    if not encoding:
+        return body, headers
+    compress, flush = feedback_app.new_compressor(encoding)
+    headers = [
+        (name, b'W/' + value if name == b'etag' and not value.startswith(b'W/') else value)
+        for name, value in headers
+    ]
+    return compress(body) + flush(), headers + [(b'content-encoding', encoding.encode('latin-1'))]
+
+
+async def read_body(receive):
+    """Corpo completo do pedido (None se o cliente desligar antes)."""
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def is_admin(scope):
+    """Lê a sessão Flask (cookie assinado) para saber se o pedido vem de um admin."""
+    raw = header(scope, b'cookie')
+    if not raw:
+        return False
+    flask_app = feedback_app.app
+    # Mesmo parser do Flask: não falha com cookies malformados (outros sites, extensões)
+    value = parse_cookie(raw).get(flask_app.config['SESSION_COOKIE_NAME'])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if value is None or serializer is None:
+        return False
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        data = serializer.loads(value, max_age=max_age)
+    except BadSignature:
+        return False
+    return bool(data.get('admin_logged_in'))
+
+
+async def wait_group_commit(future):
+    """Como em record_feedback: no timeout só desiste se o registo ainda não estiver a ser gravado."""
+    result = asyncio.wrap_future(future)
+    try:
+        return await asyncio.wait_for(asyncio.shield(result), feedback_app.GROUP_COMMIT_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        if future.cancel():
+            raise
+        return await result
+
+
+# Rotas nativas
+
+async def post_feedback(scope, receive, send):
+    body = await read_body(receive)
+    if body is None:
+        return 200
+    try:
+        data = json.loads(body)
+        grau_satisfacao = data.get('grau_satisfacao')
+    except (ValueError, AttributeError):
+        await send_json(scope, send, {'error': 'JSON inválido'}, 400)
+        return 400
+
+    if grau_satisfacao not in feedback_app.GRAUS_SATISFACAO:
+        await send_json(scope, send, {'error': 'Grau de satisfação inválido'}, 400)
+        return 400
+
+    try:
+        if feedback_app.FEEDBACK_GROUP_COMMIT:
+            # Espera pelo commit no event loop: um thread do pool por pedido limitaria os lotes a ASGI_DB_THREADS
+            future = feedback_app.submit_feedback_group_commit(grau_satisfacao)
+            feedback_id = await wait_group_commit(future)
+        else:
+            feedback_id = await run_db(feedback_app.record_feedback, grau_satisfacao)
+    except Exception as e:
+        await send_json(scope, send, {'error': str(e)}, 500)
+        return 500
+
+    await send_json(scope, send, {
+        'success': True,
+        'message': 'Obrigado pelo seu feedback!',
+        'id': feedback_id
+    })
+    return 200
+
+
+async def post_feedback_batch(scope, receive, send):
+    body = await read_body(receive)
+    if body is None:
+        return 200
+    try:
+        data = json.loads(body) or {}
+        events = data.get('events')
+    except (ValueError, AttributeError):
+        events = None
+
+    error = feedback_app.feedback_batch_error(events)
+    if error:
+        await send_json(scope, send, {'error': error[0]}, error[1])
+        return error[1]
+
+    try:
+        payload = await run_db(feedback_app.record_feedback_batch, events)
+    except Exception as e:
+        await send_json(scope, send, {'error': str(e)}, 500)
+        return 500
+    await send_json(scope, send, payload)
+    return 200
+
+
+def public_summary(conn, if_none_match):
+    feedback_app.wait_for_reconcile('/api/public/summary')
+    # Como na rota Flask: o worker do outbox inicializa o Firebase em background
+    if feedback_app.firebase_configured():
+        feedback_app.start_sync_worker()
+    hoje = datetime.now().strftime('%Y-%m-%d')
+    version = feedback_app.feedback_version(conn)
+    etag = feedback_app.public_summary_etag(conn, hoje, version)
+    if parse_etags(if_none_match).contains_weak(etag):
+        return etag, None
+    return etag, feedback_app.public_summary_payload(conn, hoje, version)
+
+
+async def get_public_summary(scope, receive, send):
+    try:
+        etag, payload = await run_db(public_summary, header(scope, b'if-none-match'))
+    except Exception as e:
+        await send_json(scope, send, {'error': str(e)}, 500)
+        return 500
+
+    headers = [(b'etag', f'"{etag}"'.encode('latin-1')), (b'cache-control', b'no-cache')]
+    if payload is None:
+        await send_response(send, 304, headers=headers)
+        return 304
+    await send_json(scope, send, payload, headers=headers)
+    return 200
+
+
+class LiveHub:
+    """Liga publish_live_update (chamado em qualquer thread) às ligações SSE de um event loop.
+
+    Um único ouvinte por loop, registado enquanto houver ligações; cada publicação
+    acorda todas as corrotinas de uma vez. O fallback multi-processo (MAX(id)) é
+    partilhado: as ligações que acordam juntas fazem uma só consulta.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.connections = 0
+        self.version = 0
+        self.snapshot = None
+        self.changed = asyncio.Event()
+        self._poll = None
+        self._events = {}
+
+    def publish(self, snapshot):
+        self.loop.call_soon_threadsafe(self._set, snapshot)
+
+    def _set(self, snapshot):
+        self.version += 1
+        self.snapshot = snapshot
+        self._events = {}
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def join(self):
+        if not self.connections:
+            feedback_app.add_live_listener(self.publish)
+        self.connections += 1
+
+    def leave(self):
+        self.connections -= 1
+        if not self.connections:
+            feedback_app.remove_live_listener(self.publish)
+
+    def event(self, snapshot, include_totals):
+        """Evento SSE codificado uma vez por publicação (e não uma vez por ligação)."""
+        if snapshot is not self.snapshot:
+            return feedback_app.live_event(snapshot, include_totals).encode('utf-8')
+        chunk = self._events.get(include_totals)
+        if chunk is None:
+            chunk = self._events[include_totals] = feedback_app.live_event(snapshot, include_totals).encode('utf-8')
+        return chunk
+
+    def poll(self):
+        if self._poll is None or self._poll.done():
+            # sent_id=-1: devolve sempre o resumo atual (em cache por último id)
+            self._poll = asyncio.ensure_future(run_db(feedback_app.live_poll_snapshot, -1, None))
+        return self._poll
+
+
+_hubs = {}
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = LiveHub(loop)
+    return hub
+
+
+def initial_snapshot(conn):
+    feedback_app.wait_for_reconcile('/api/stream')
+    return feedback_app.live_snapshot(conn)
+
+
+async def live_stream(scope, receive, send):
+    """Feed SSE: mesma sequência de eventos de iter_live_updates, sem ocupar um thread."""
+    if not feedback_app.LIVE_STREAM_ENABLED:
+        await send_json(scope, send, {'error': 'Feed em tempo real desativado'}, 404)
+        return 404
+    include_totals = is_admin(scope)
+    hub = get_hub()
+    hub.join()
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        seen_version = hub.version
+        try:
+            snapshot = await run_db(initial_snapshot)
+        except Exception as e:
+            await send_json(scope, send, {'error': str(e)}, 500)
+            return 500
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        first = f"retry: {feedback_app.SSE_RETRY_MS}\n\n" + feedback_app.live_event(snapshot, include_totals)
+        await send({'type': 'http.response.body', 'body': first.encode('utf-8'), 'more_body': True})
+        sent_id, sent_date = snapshot['lastId'] or 0, snapshot['date']
+
+        started = last_write = time.monotonic()
+        while time.monotonic() - started < feedback_app.SSE_MAX_SECONDS:
+            changed = asyncio.ensure_future(hub.changed.wait()) if hub.version == seen_version else None
+            if changed is not None:
+                await asyncio.wait({changed, disconnected}, timeout=feedback_app.SSE_POLL_SECONDS,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                changed.cancel()
+            if disconnected.done():
+                return 200
+
+            published = hub.snapshot if hub.version != seen_version else None
+            seen_version = hub.version
+            if published is None:
+                published = await asyncio.shield(hub.poll())
+
+            # Os resumos publicados por pedidos concorrentes podem chegar fora de ordem
+            if published is not None and ((published['lastId'] or 0) > sent_id or published['date'] != sent_date):
+                sent_id, sent_date = published['lastId'] or 0, published['date']
+                last_write = time.monotonic()
+                chunk = hub.event(published, include_totals)
+            elif time.monotonic() - last_write >= feedback_app.SSE_KEEPALIVE_SECONDS:
+                last_write = time.monotonic()
+                chunk = b": ping\n\n"
+            else:
+                continue
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+        await send({'type': 'http.response.body', 'body': b''})
+        return 200
+    finally:
+        disconnected.cancel()
+        hub.leave()
+
+
+ROUTES = {
+    ('POST', '/api/feedback'): post_feedback,
+    ('POST', '/api/feedback/batch'): post_feedback_batch,
+    ('GET', '/api/public/summary'): get_public_summary,
+    ('GET', '/api/stream'): live_stream,
+}
+
+
+# Ponte WSGI (restantes rotas)
+# asgiref.wsgi.WsgiToAsgi traduz o pedido; o ThreadSensitiveContext dá um thread
+# próprio a cada pedido (sem ele o asgiref corre tudo num único thread partilhado)
+# e o semáforo limita-os a ASGI_WSGI_THREADS.
+
+_wsgi_bridge = None
+_wsgi_slots = weakref.WeakKeyDictionary()
+
+
+def closing_wsgi_app(environ, start_response):
+    """A app Flask, garantindo o close() da resposta (o WsgiToAsgi não o chama).
+
+    É no close() que o Flask corre os call_on_close e fecha os geradores das
+    exportações em streaming.
+    """
+    result = feedback_app.app(environ, start_response)
+    try:
+        yield from result
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+def get_wsgi_bridge():
+    """Aplicação ASGI do asgiref à volta da app Flask (importação tardia)."""
+    global _wsgi_bridge
+    if _wsgi_bridge is None:
+        from asgiref.wsgi import WsgiToAsgi
+        _wsgi_bridge = WsgiToAsgi(closing_wsgi_app)
+    return _wsgi_bridge
+
+
+async def wsgi_bridge(scope, receive, send):
+    from asgiref.sync import ThreadSensitiveContext
+
+    loop = asyncio.get_running_loop()
+    slots = _wsgi_slots.get(loop)
+    if slots is None:
+        slots = _wsgi_slots.setdefault(loop, asyncio.Semaphore(ASGI_WSGI_THREADS))
+    async with slots:
+        async with ThreadSensitiveContext():
+            await get_wsgi_bridge()(scope, receive, send)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _db_pool.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        await wsgi_bridge(scope, receive, send)
+        return
+
+    # As rotas nativas não passam pelos hooks do Flask: regista aqui as métricas
+    started = time.perf_counter()
+    status = 500
+    try:
+        status = await handler(scope, receive, send)
+    finally:
+        if feedback_app.METRICS_ENABLED and scope['path'] != '/api/stream':
+            feedback_app.observe_route(scope['method'], scope['path'], time.perf_counter() - started, status)
@@ -1,18 +1,29 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
-from datetime import datetime
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, g, has_app_context, has_request_context, after_this_request, Response, stream_with_context
+from datetime import datetime, timedelta
 import sqlite3
 import os
 import csv
 import io
+import tempfile
 from typing import Optional
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
 import sys
 import json
+import hashlib
+import hmac
+import calendar
+import re
+import uuid
+import threading
+import time
+import queue
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 app = Flask(__name__)
+# JSON sem espaços/indentação também em modo debug (respostas de polling mais pequenas)
+app.json.compact = True
 
 # Em produção, configure SECRET_KEY como variável de ambiente.
 app.secret_key = os.environ.get('SECRET_KEY', 'sua_chave_secreta_aqui_mude_para_producao')
@@ -63,22 +74,43 @@ def _is_admin_email_allowed(email: Optional[str]) -> bool:
     # Se não houver restrição configurada, aceita qualquer conta autenticada
     return True
 
-# Inicializar Firebase
+# Inicializar Firebase (lazy)
+# O firebase_admin/Firestore só são importados e inicializados na primeira
+# utilização (worker do outbox, login admin, health/system). Assim o arranque
+# a frio no Vercel e as rotas públicas não pagam esse custo.
 firebase_db = None
 firebase_init_error = None
 firebase_cred_source = None
 firebase_cred_tried_paths = []
-try:
-    if not firebase_admin._apps:
+
+_firebase_lock = threading.RLock()
+_firebase_app_ready = False
+_firebase_init_attempted = False
+_firebase_credentials = None  # ('json', conteúdo) | ('file', caminho) | None
+_firebase_credentials_resolved = False
+
+
+def _find_firebase_credentials():
+    """Localiza as credenciais (sem as ler). Resultado guardado em cache."""
+    global _firebase_credentials, _firebase_credentials_resolved
+    global firebase_cred_source, firebase_cred_tried_paths
+
+    if _firebase_credentials_resolved:
+        return _firebase_credentials
+
+    with _firebase_lock:
+        if _firebase_credentials_resolved:
+            return _firebase_credentials
+
         # Preferir credenciais por variável de ambiente em produção (Vercel/Preview)
         # - FIREBASE_SERVICE_ACCOUNT_JSON: conteúdo JSON completo do service account
         # - GOOGLE_APPLICATION_CREDENTIALS: path para um ficheiro com credenciais
         # - FIREBASE_SERVICE_ACCOUNT_FILE: path alternativo para um ficheiro de credenciais
         env_json = os.environ.get('FIREBASE_SERVICE_ACCOUNT_JSON', '').strip()
 
-        cred_obj = None
+        found = None
         if env_json:
-            cred_obj = credentials.Certificate(json.loads(env_json))
+            found = ('json', env_json)
             firebase_cred_source = 'FIREBASE_SERVICE_ACCOUNT_JSON'
         else:
             base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -126,7 +158,7 @@ try:
                         break
 
             if chosen:
-                cred_obj = credentials.Certificate(chosen)
+                found = ('file', chosen)
                 if firebase_service_account_file:
                     firebase_cred_source = 'FIREBASE_SERVICE_ACCOUNT_FILE'
                 elif google_app_credentials:
@@ -134,31 +166,522 @@ try:
                 else:
                     firebase_cred_source = 'LOCAL_JSON_FILE'
 
-        if not cred_obj:
-            msg = 'Credenciais Firebase não encontradas (defina FIREBASE_SERVICE_ACCOUNT_JSON ou configure um ficheiro via FIREBASE_SERVICE_ACCOUNT_FILE/GOOGLE_APPLICATION_CREDENTIALS).'
-            if os.environ.get('DEBUG_DIAGNOSTICS'):
-                msg += f" cwd={os.getcwd()} base_dir={base_dir} tried={firebase_cred_tried_paths}"
-            raise RuntimeError(msg)
+        _firebase_credentials = found
+        _firebase_credentials_resolved = True
+        return found
 
-        firebase_admin.initialize_app(cred_obj, {
-            'databaseURL': os.environ.get('FIREBASE_DATABASE_URL', 'https://studio-7634777517-713ea.firebaseio.com')
-        })
-        firebase_db = firestore.client()
-        print("✓ Firebase inicializado com sucesso")
-except Exception as e:
-    firebase_init_error = str(e)
-    print(f"⚠ Aviso: Firebase não está disponível: {e}")
-    print("  A aplicação continuará funcionando apenas com SQLite")
 
-def get_db():
-    """Conecta ao banco de dados SQLite"""
-    conn = sqlite3.connect(DATABASE)
+def firebase_configured():
+    """True se existem credenciais Firebase (não inicializa nem importa o SDK)."""
+    return _find_firebase_credentials() is not None
+
+
+def ensure_firebase_app():
+    """Inicializa a app firebase_admin na primeira chamada. Devolve True se disponível."""
+    global _firebase_app_ready, _firebase_init_attempted, firebase_init_error
+
+    if _firebase_app_ready or _firebase_init_attempted:
+        return _firebase_app_ready
+
+    with _firebase_lock:
+        if _firebase_app_ready or _firebase_init_attempted:
+            return _firebase_app_ready
+
+        try:
+            import firebase_admin
+            from firebase_admin import credentials
+
+            if not firebase_admin._apps:
+                found = _find_firebase_credentials()
+                if not found:
+                    msg = 'Credenciais Firebase não encontradas (defina FIREBASE_SERVICE_ACCOUNT_JSON ou configure um ficheiro via FIREBASE_SERVICE_ACCOUNT_FILE/GOOGLE_APPLICATION_CREDENTIALS).'
+                    if os.environ.get('DEBUG_DIAGNOSTICS'):
+                        msg += f" cwd={os.getcwd()} tried={firebase_cred_tried_paths}"
+                    raise RuntimeError(msg)
+
+                kind, value = found
+                cred_obj = credentials.Certificate(json.loads(value) if kind == 'json' else value)
+                firebase_admin.initialize_app(cred_obj, {
+                    'databaseURL': os.environ.get('FIREBASE_DATABASE_URL', 'https://studio-7634777517-713ea.firebaseio.com')
+                })
+                print("✓ Firebase inicializado com sucesso")
+            _firebase_app_ready = True
+        except Exception as e:
+            firebase_init_error = str(e)
+            print(f"⚠ Aviso: Firebase não está disponível: {e}")
+            print("  A aplicação continuará funcionando apenas com SQLite")
+        finally:
+            _firebase_init_attempted = True
+
+    return _firebase_app_ready
+
+
+def get_firebase_db():
+    """Cliente Firestore (criado na primeira utilização, thread-safe) ou None se indisponível."""
+    global firebase_db, firebase_init_error
+
+    if firebase_db is not None or not ensure_firebase_app():
+        return firebase_db
+
+    with _firebase_lock:
+        if firebase_db is None and firebase_init_error is None:
+            try:
+                from firebase_admin import firestore
+                firebase_db = firestore.client()
+            except Exception as e:
+                firebase_init_error = str(e)
+                print(f"⚠ Aviso: Firestore não está disponível: {e}")
+    return firebase_db
+
+
+def use_firebase_client(client):
+    """Define explicitamente o cliente Firestore (ex.: stub em testes/benchmarks; None desativa)."""
+    global firebase_db, _firebase_init_attempted, _firebase_credentials, _firebase_credentials_resolved
+    with _firebase_lock:
+        firebase_db = client
+        _firebase_init_attempted = True
+        _firebase_credentials = ('stub', None) if client is not None else None
+        _firebase_credentials_resolved = True
+
+
+# Verificação de Firebase ID tokens (login admin)
+# As chaves públicas da Google ficam em memória (já convertidas) até ao max-age
+# do Cache-Control e também em sync_state, para os outros workers que partilham
+# a base não as voltarem a pedir. Um kid desconhecido (rotação de chaves) força
+# nova leitura, no máximo a cada FIREBASE_CERTS_MIN_REFRESH_SECONDS. Sem max-age (ou
+# max-age=0) as chaves ficam FIREBASE_CERTS_MIN_TTL_SECONDS. O pedido HTTP é feito fora
+# do lock do estado e por um só thread de cada vez; enquanto decorre, os outros usam as
+# chaves antigas se conhecerem o kid. As consultas auth.get_user (token sem email)
+# ficam em cache FIREBASE_USER_CACHE_SECONDS.
+FIREBASE_CERTS_URL = os.environ.get(
+    'FIREBASE_CERTS_URL',
+    'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+)
+FIREBASE_TOKEN_ISSUER = 'https://securetoken.google.com/'
+FIREBASE_TOKEN_LEEWAY_SECONDS = int(os.environ.get('FIREBASE_TOKEN_LEEWAY_SECONDS', '5'))
+FIREBASE_CERTS_MIN_REFRESH_SECONDS = 60
+FIREBASE_CERTS_MIN_TTL_SECONDS = float(os.environ.get('FIREBASE_CERTS_MIN_TTL_SECONDS', '300'))
+FIREBASE_USER_CACHE_SECONDS = float(os.environ.get('FIREBASE_USER_CACHE_SECONDS', '300'))
+FIREBASE_HTTP_TIMEOUT_SECONDS = 10
+
+_firebase_certs_lock = threading.Lock()
+_firebase_certs_fetch_lock = threading.Lock()
+_firebase_certs = {'keys': {}, 'expires': 0.0, 'fetched': 0.0}
+_firebase_user_cache = {}
+
+
+def reset_firebase_token_cache():
+    """Esquece as chaves e utilizadores em cache (só memória; ex.: testes/benchmarks)."""
+    with _firebase_certs_lock:
+        _firebase_certs.update(keys={}, expires=0.0, fetched=0.0)
+    _firebase_user_cache.clear()
+
+
+def cache_control_max_age(value):
+    match = re.search(r'max-age=(\d+)', value or '')
+    return int(match.group(1)) if match else 0
+
+
+def fetch_firebase_certs():
+    """GET dos certificados X.509 da Google; devolve ({kid: PEM}, max-age em segundos)."""
+    from urllib.request import urlopen
+
+    started = time.perf_counter()
+    failed = False
+    try:
+        with urlopen(FIREBASE_CERTS_URL, timeout=FIREBASE_HTTP_TIMEOUT_SECONDS) as resp:
+            return json.loads(resp.read()), cache_control_max_age(resp.headers.get('Cache-Control'))
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_firestore_call('auth_certs', time.perf_counter() - started, failed)
+
+
+def _fresh_firebase_keys(kid, now):
+    """Chaves em memória se ainda servirem para `kid` (senão None)."""
+    with _firebase_certs_lock:
+        if now < _firebase_certs['expires'] and (
+                kid in _firebase_certs['keys'] or now - _firebase_certs['fetched'] < FIREBASE_CERTS_MIN_REFRESH_SECONDS):
+            return _firebase_certs['keys']
+        return None
+
+
+def get_firebase_keys(kid):
+    """Chaves públicas por kid (memória -> sync_state -> rede), válidas até ao max-age."""
+    from cryptography import x509
+
+    keys = _fresh_firebase_keys(kid, time.time())
+    if keys is not None:
+        return keys
+
+    if not _firebase_certs_fetch_lock.acquire(blocking=False):
+        # Outro thread já está a atualizar: as chaves antigas servem se conhecerem o kid
+        with _firebase_certs_lock:
+            if kid in _firebase_certs['keys']:
+                return _firebase_certs['keys']
+        _firebase_certs_fetch_lock.acquire()
+    try:
+        now = time.time()
+        keys = _fresh_firebase_keys(kid, now)
+        if keys is not None:
+            return keys
+
+        # Outro worker pode já ter guardado certificados válidos na base
+        conn = get_db()
+        stored = get_sync_value(conn, 'firebase_certs')
+        stored = json.loads(stored) if stored else None
+        if stored and now < stored['expires'] and (
+                kid in stored['certs'] or now - stored['fetched'] < FIREBASE_CERTS_MIN_REFRESH_SECONDS):
+            certs, expires, fetched = stored['certs'], stored['expires'], stored['fetched']
+        else:
+            certs, max_age = fetch_firebase_certs()
+            expires, fetched = now + max(max_age, FIREBASE_CERTS_MIN_TTL_SECONDS), now
+            with conn:
+                set_sync_value(conn, 'firebase_certs', json.dumps({'certs': certs, 'expires': expires, 'fetched': fetched}))
+
+        keys = {k: x509.load_pem_x509_certificate(pem.encode('utf-8')).public_key() for k, pem in certs.items()}
+        with _firebase_certs_lock:
+            _firebase_certs.update(keys=keys, expires=expires, fetched=fetched)
+        return keys
+    finally:
+        _firebase_certs_fetch_lock.release()
+
+
+def verify_firebase_id_token(id_token, project_id=None):
+    """Verifica um Firebase ID token (RS256, aud/iss do projeto, exp/iat); devolve as claims.
+
+    Faz o mesmo que auth.verify_id_token, sem pedir os certificados em cada
+    chamada nem inicializar a app firebase_admin. ValueError se for inválido.
+    """
+    import jwt
+
+    project_id = project_id or FIREBASE_WEB_CONFIG['projectId']
+    try:
+        header = jwt.get_unverified_header(id_token)
+    except jwt.PyJWTError as e:
+        raise ValueError(f'ID token inválido: {e}')
+    if header.get('alg') != 'RS256' or not header.get('kid'):
+        raise ValueError('ID token inválido: algoritmo ou kid inesperado')
+
+    key = get_firebase_keys(header['kid']).get(header['kid'])
+    if key is None:
+        raise ValueError('ID token inválido: chave de assinatura desconhecida')
+
+    try:
+        claims = jwt.decode(
+            id_token, key, algorithms=['RS256'],
+            audience=project_id, issuer=FIREBASE_TOKEN_ISSUER + project_id,
+            leeway=FIREBASE_TOKEN_LEEWAY_SECONDS,
+            options={'require': ['exp', 'iat', 'sub']},
+        )
+    except jwt.ExpiredSignatureError:
+        raise ValueError('ID token expirado')
+    except jwt.PyJWTError as e:
+        raise ValueError(f'ID token inválido: {e}')
+
+    subject = claims['sub']
+    if not isinstance(subject, str) or not subject or len(subject) > 128:
+        raise ValueError('ID token inválido: claim "sub"')
+    if claims.get('auth_time', 0) > time.time() + FIREBASE_TOKEN_LEEWAY_SECONDS:
+        raise ValueError('ID token inválido: claim "auth_time" no futuro')
+
+    claims['uid'] = subject
+    return claims
+
+
+def get_firebase_user_email(uid):
+    """Email da conta (auth.get_user), em cache por FIREBASE_USER_CACHE_SECONDS."""
+    now = time.monotonic()
+    hit = _firebase_user_cache.get(uid)
+    if hit is not None and hit[0] > now:
+        return hit[1]
+
+    from firebase_admin import auth
+
+    started = time.perf_counter()
+    failed = False
+    try:
+        email = auth.get_user(uid).email
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_firestore_call('auth_get_user', time.perf_counter() - started, failed)
+
+    if len(_firebase_user_cache) >= 1000:
+        _firebase_user_cache.clear()
+    _firebase_user_cache[uid] = (now + FIREBASE_USER_CACHE_SECONDS, email)
+    return email
+
+
+# Métricas (latência por rota, consultas SQLite, chamadas ao Firestore)
+# Histogramas com buckets fixos (só contadores, sem guardar amostras); as
+# consultas SQLite são contadas por thread pela ligação (TracedConnection) e
+# somadas à rota no fim de cada pedido. Expostas em /api/admin/metrics.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') not in ['0', 'false', 'False']
+# Permite ao Prometheus ler /api/admin/metrics com "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+METRICS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics_lock = threading.Lock()
+_route_metrics = {}
+_firestore_metrics = {}
+_query_local = threading.local()
+
+
+def new_histogram():
+    return {'buckets': [0] * (len(METRICS_BUCKETS) + 1), 'count': 0, 'sum': 0.0}
+
+
+def observe(histogram, seconds):
+    histogram['buckets'][bisect_left(METRICS_BUCKETS, seconds)] += 1
+    histogram['count'] += 1
+    histogram['sum'] += seconds
+
+
+def histogram_quantile(histogram, q):
+    """Quantil estimado (interpolação linear dentro do bucket), em segundos."""
+    rank = q * histogram['count']
+    cumulative = 0
+    for index, n in enumerate(histogram['buckets']):
+        if n and cumulative + n >= rank:
+            lower = METRICS_BUCKETS[index - 1] if index else 0.0
+            if index == len(METRICS_BUCKETS):
+                return lower
+            return lower + (METRICS_BUCKETS[index] - lower) * (rank - cumulative) / n
+        cumulative += n
+    return 0.0
+
+
+class TracedConnection(sqlite3.Connection):
+    """Ligação SQLite que conta as consultas (execute) e o tempo gasto por thread."""
+
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _record_query(time.perf_counter() - started)
+
+    def executemany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _record_query(time.perf_counter() - started)
+
+
+def _record_query(seconds):
+    stats = _query_local.__dict__
+    stats['count'] = stats.get('count', 0) + 1
+    stats['seconds'] = stats.get('seconds', 0.0) + seconds
+
+
+def record_firestore_call(operation, seconds, failed=False):
+    with _metrics_lock:
+        entry = _firestore_metrics.get(operation)
+        if entry is None:
+            entry = _firestore_metrics[operation] = dict(new_histogram(), errors=0)
+        observe(entry, seconds)
+        if failed:
+            entry['errors'] += 1
+
+
+# O início do pedido fica no thread-local (e não em `g`): cada acesso a um
+# proxy do Flask custa ~1 µs e estes hooks correm em todos os pedidos.
+@app.before_request
+def start_request_metrics():
+    if METRICS_ENABLED:
+        stats = _query_local.__dict__
+        stats['count'] = 0
+        stats['seconds'] = 0.0
+        stats['started'] = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    stats = _query_local.__dict__
+    started = stats.pop('started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    req = request._get_current_object()
+    rule = req.url_rule.rule if req.url_rule is not None else '<sem rota>'
+    observe_route(req.method, rule, elapsed, response.status_code, stats['count'], stats['seconds'])
+    return response
+
+
+def observe_route(method, rule, seconds, status_code, queries=0, query_seconds=0.0):
+    """Regista um pedido nas métricas da rota (usado também pela camada ASGI)."""
+    key = (method, rule)
+    with _metrics_lock:
+        entry = _route_metrics.get(key)
+        if entry is None:
+            entry = _route_metrics[key] = dict(new_histogram(), errors=0, queries=0, querySeconds=0.0)
+        observe(entry, seconds)
+        if status_code >= 500:
+            entry['errors'] += 1
+        entry['queries'] += queries
+        entry['querySeconds'] += query_seconds
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _route_metrics.clear()
+        _firestore_metrics.clear()
+
+
+def metrics_payload():
+    """Métricas em JSON (tempos em ms)."""
+    def summary(entry):
+        count = entry['count']
+        return {
+            'count': count,
+            'errors': entry['errors'],
+            'meanMs': round(entry['sum'] / count * 1000, 3) if count else 0,
+            'p50Ms': round(histogram_quantile(entry, 0.50) * 1000, 3),
+            'p95Ms': round(histogram_quantile(entry, 0.95) * 1000, 3),
+            'p99Ms': round(histogram_quantile(entry, 0.99) * 1000, 3),
+        }
+
+    with _metrics_lock:
+        routes = []
+        for (method, rule), entry in sorted(_route_metrics.items(), key=lambda item: item[0][1]):
+            route = {'method': method, 'route': rule, **summary(entry)}
+            route['sqlite'] = {
+                'queries': entry['queries'],
+                'seconds': round(entry['querySeconds'], 6),
+                'queriesPerRequest': round(entry['queries'] / entry['count'], 2),
+            }
+            routes.append(route)
+        firestore = {operation: summary(entry) for operation, entry in sorted(_firestore_metrics.items())}
+    return {'routes': routes, 'firestore': firestore, 'bucketsSeconds': list(METRICS_BUCKETS)}
+
+
+def _prometheus_histogram(lines, name, labels, entry):
+    cumulative = 0
+    for bound, n in zip(METRICS_BUCKETS + (float('inf'),), entry['buckets']):
+        cumulative += n
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {entry["sum"]}')
+    lines.append(f'{name}_count{{{labels}}} {entry["count"]}')
+
+
+def metrics_prometheus():
+    """Métricas no formato de texto do Prometheus (0.0.4)."""
+    lines = []
+    with _metrics_lock:
+        routes = sorted(_route_metrics.items(), key=lambda item: item[0][1])
+        lines.append('# HELP feedback_http_request_duration_seconds Latência dos pedidos por rota.')
+        lines.append('# TYPE feedback_http_request_duration_seconds histogram')
+        for (method, rule), entry in routes:
+            _prometheus_histogram(lines, 'feedback_http_request_duration_seconds',
+                                  f'method="{method}",route="{rule}"', entry)
+        for metric, field, help_text in [
+            ('feedback_http_request_errors_total', 'errors', 'Respostas 5xx por rota.'),
+            ('feedback_sqlite_queries_total', 'queries', 'Consultas SQLite feitas nos pedidos, por rota.'),
+            ('feedback_sqlite_query_seconds_total', 'querySeconds', 'Tempo em consultas SQLite, por rota.'),
+        ]:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for (method, rule), entry in routes:
+                lines.append(f'{metric}{{method="{method}",route="{rule}"}} {entry[field]}')
+
+        lines.append('# HELP feedback_firestore_call_duration_seconds Duração das chamadas ao Firestore.')
+        lines.append('# TYPE feedback_firestore_call_duration_seconds histogram')
+        for operation, entry in sorted(_firestore_metrics.items()):
+            _prometheus_histogram(lines, 'feedback_firestore_call_duration_seconds',
+                                  f'operation="{operation}"', entry)
+        lines.append('# HELP feedback_firestore_errors_total Chamadas ao Firestore com erro.')
+        lines.append('# TYPE feedback_firestore_errors_total counter')
+        for operation, entry in sorted(_firestore_metrics.items()):
+            lines.append(f'feedback_firestore_errors_total{{operation="{operation}"}} {entry["errors"]}')
+    return '\n'.join(lines) + '\n'
+
+
+# Ligações SQLite
+# Cada thread (worker) mantém uma ligação reutilizável em vez de abrir uma nova
+# por pedido. Os PRAGMAs podem ser ajustados por variáveis de ambiente.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    # Valor negativo = KiB (aqui ~20 MB de page cache por ligação)
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-20000')),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+}
+
+_db_local = threading.local()
+
+
+def _open_db_connection(path):
+    """Abre uma ligação SQLite nova e aplica os PRAGMAs configurados."""
+    conn = sqlite3.connect(path, timeout=SQLITE_PRAGMAS['busy_timeout'] / 1000,
+                           factory=TracedConnection if METRICS_ENABLED else sqlite3.Connection)
     conn.row_factory = sqlite3.Row
+    for name, value in SQLITE_PRAGMAS.items():
+        if value is None or value == '':
+            continue
+        conn.execute(f'PRAGMA {name} = {value}')
     return conn
 
-def init_db():
-    """Inicializa o banco de dados"""
-    conn = get_db()
+
+def _thread_db_connection():
+    """Devolve a ligação do thread atual, abrindo-a na primeira utilização."""
+    conn = getattr(_db_local, 'conn', None)
+    # Reabrir se o caminho mudou (testes/benchmarks) ou após fork (gunicorn)
+    if conn is not None and (_db_local.path != DATABASE or _db_local.pid != os.getpid()):
+        if _db_local.pid == os.getpid():
+            conn.close()
+        conn = None
+
+    if conn is None:
+        conn = _open_db_connection(DATABASE)
+        _db_local.conn = conn
+        _db_local.path = DATABASE
+        _db_local.pid = os.getpid()
+    return conn
+
+
+def get_db():
+    """Conecta ao banco de dados SQLite (ligação reutilizada por thread).
+
+    Dentro de um pedido a ligação fica associada ao app context e é libertada
+    em ``release_db``; não deve ser fechada pelas rotas.
+    """
+    if not has_app_context():
+        return _thread_db_connection()
+
+    if 'db' not in g:
+        g.db = _thread_db_connection()
+    return g.db
+
+
+def close_db_connection():
+    """Fecha a ligação do thread atual (ex.: antes de apagar o ficheiro)."""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _db_local.conn = None
+
+
+@app.teardown_appcontext
+def release_db(exception=None):
+    """Devolve a ligação ao thread, descartando transações deixadas abertas."""
+    conn = g.pop('db', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+
+# Migrações do esquema
+# Cada migração corre uma única vez, por ordem; a versão aplicada fica guardada
+# em PRAGMA user_version. Devem ser idempotentes (bases criadas antes deste
+# mecanismo têm user_version = 0 mas já podem ter parte do esquema).
+
+def _migration_feedback(conn):
+    """v1: tabela principal de feedback."""
     conn.execute('''
         CREATE TABLE IF NOT EXISTS feedback (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -169,11 +692,2029 @@ def init_db():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    conn.commit()
-    conn.close()
 
-# Inicializar banco de dados ao iniciar a aplicação
-init_db()
+
+def _migration_sync_outbox(conn):
+    """v2: outbox de sincronização com o Firestore (preenchido na mesma transação do INSERT)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            collection TEXT NOT NULL,
+            doc_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _migration_daily_counts(conn):
+    """v3: contadores diários pré-agregados, mantidos por triggers.
+
+    As estatísticas somam `feedback_daily_counts` (uma linha por dia e grau)
+    em vez de fazer COUNT/GROUP BY sobre toda a tabela `feedback`.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS feedback_daily_counts (
+            data TEXT NOT NULL,
+            grau_satisfacao TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (data, grau_satisfacao)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS feedback_daily_counts_insert
+        AFTER INSERT ON feedback
+        BEGIN
+            INSERT INTO feedback_daily_counts (data, grau_satisfacao, total)
+            VALUES (NEW.data, NEW.grau_satisfacao, 1)
+            ON CONFLICT (data, grau_satisfacao) DO UPDATE SET total = total + 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS feedback_daily_counts_delete
+        AFTER DELETE ON feedback
+        BEGIN
+            UPDATE feedback_daily_counts SET total = total - 1
+            WHERE data = OLD.data AND grau_satisfacao = OLD.grau_satisfacao;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS feedback_daily_counts_update
+        AFTER UPDATE OF data, grau_satisfacao ON feedback
+        BEGIN
+            UPDATE feedback_daily_counts SET total = total - 1
+            WHERE data = OLD.data AND grau_satisfacao = OLD.grau_satisfacao;
+            INSERT INTO feedback_daily_counts (data, grau_satisfacao, total)
+            VALUES (NEW.data, NEW.grau_satisfacao, 1)
+            ON CONFLICT (data, grau_satisfacao) DO UPDATE SET total = total + 1;
+        END
+    ''')
+
+    # Backfill (reconstrução completa, para ser idempotente)
+    conn.execute('DELETE FROM feedback_daily_counts')
+    conn.execute('''
+        INSERT INTO feedback_daily_counts (data, grau_satisfacao, total)
+        SELECT data, grau_satisfacao, COUNT(*)
+        FROM feedback
+        GROUP BY data, grau_satisfacao
+    ''')
+
+
+def _migration_feedback_indexes(conn):
+    """v4: índices para o histórico (filtros por data/grau + ORDER BY data, hora) e exportações."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_feedback_data_hora ON feedback (data, hora)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_feedback_grau_data_hora ON feedback (grau_satisfacao, data, hora)')
+
+
+def _migration_feedback_client_key(conn):
+    """v5: chave de idempotência enviada pelo cliente (fila offline do quiosque)."""
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(feedback)')}
+    if 'client_key' not in columns:
+        conn.execute('ALTER TABLE feedback ADD COLUMN client_key TEXT')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_feedback_client_key
+        ON feedback (client_key) WHERE client_key IS NOT NULL
+    ''')
+
+
+def _migration_feedback_compact(conn):
+    """v6: armazenamento compacto (`ts` + código do grau) com a view `feedback` por cima.
+
+    `feedback_compact.ts` é a data/hora local em segundos desde 1970 (sem fuso:
+    date(ts, 'unixepoch') devolve a data local) e `grau` o índice em
+    GRAUS_SATISFACAO. As colunas antigas (grau_satisfacao, data, hora,
+    dia_semana, timestamp) são calculadas pela view; INSERT/DELETE na view
+    continuam a funcionar (triggers INSTEAD OF).
+    """
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = 'feedback'").fetchone()
+    if kind and kind['type'] == 'view':
+        return
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS feedback_compact (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            grau INTEGER NOT NULL CHECK (grau IN (0, 1, 2)),
+            client_key TEXT
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO feedback_compact (id, ts, grau, client_key)
+        SELECT id,
+               CAST(strftime('%s', data || ' ' || hora) AS INTEGER),
+               CASE grau_satisfacao WHEN 'muito_satisfeito' THEN 0 WHEN 'satisfeito' THEN 1 ELSE 2 END,
+               client_key
+        FROM feedback
+        ORDER BY id
+    ''')
+    # Mantém a sequência do AUTOINCREMENT (ids de registos apagados não são reutilizados)
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'feedback'").fetchone()
+    if seq:
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = 'feedback_compact'")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('feedback_compact', ?)", (seq['seq'],))
+
+    # Remove a tabela antiga (com os seus índices e triggers)
+    conn.execute('DROP TABLE feedback')
+    conn.execute('''
+        CREATE VIEW feedback AS
+        SELECT id,
+               CASE grau WHEN 0 THEN 'muito_satisfeito' WHEN 1 THEN 'satisfeito' WHEN 2 THEN 'insatisfeito' END
+                   AS grau_satisfacao,
+               date(ts, 'unixepoch') AS data,
+               time(ts, 'unixepoch') AS hora,
+               CASE CAST(strftime('%w', ts, 'unixepoch') AS INTEGER)
+                   WHEN 1 THEN 'Segunda-feira' WHEN 2 THEN 'Terça-feira' WHEN 3 THEN 'Quarta-feira'
+                   WHEN 4 THEN 'Quinta-feira' WHEN 5 THEN 'Sexta-feira' WHEN 6 THEN 'Sábado'
+                   ELSE 'Domingo' END AS dia_semana,
+               datetime(ts, 'unixepoch') AS timestamp,
+               client_key,
+               ts,
+               grau
+        FROM feedback_compact
+    ''')
+    conn.execute('''
+        CREATE TRIGGER feedback_insert
+        INSTEAD OF INSERT ON feedback
+        BEGIN
+            INSERT INTO feedback_compact (id, ts, grau, client_key)
+            VALUES (
+                NEW.id,
+                CAST(strftime('%s', NEW.data || ' ' || NEW.hora) AS INTEGER),
+                CASE NEW.grau_satisfacao WHEN 'muito_satisfeito' THEN 0 WHEN 'satisfeito' THEN 1
+                    WHEN 'insatisfeito' THEN 2 END,
+                NEW.client_key
+            );
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER feedback_delete
+        INSTEAD OF DELETE ON feedback
+        BEGIN
+            DELETE FROM feedback_compact WHERE id = OLD.id;
+        END
+    ''')
+
+    # Contadores diários (v3), agora sobre a tabela compacta
+    grau_texto = "CASE {0}.grau WHEN 0 THEN 'muito_satisfeito' WHEN 1 THEN 'satisfeito' ELSE 'insatisfeito' END"
+    conn.execute(f'''
+        CREATE TRIGGER feedback_daily_counts_insert
+        AFTER INSERT ON feedback_compact
+        BEGIN
+            INSERT INTO feedback_daily_counts (data, grau_satisfacao, total)
+            VALUES (date(NEW.ts, 'unixepoch'), {grau_texto.format('NEW')}, 1)
+            ON CONFLICT (data, grau_satisfacao) DO UPDATE SET total = total + 1;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER feedback_daily_counts_delete
+        AFTER DELETE ON feedback_compact
+        BEGIN
+            UPDATE feedback_daily_counts SET total = total - 1
+            WHERE data = date(OLD.ts, 'unixepoch') AND grau_satisfacao = {grau_texto.format('OLD')};
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER feedback_daily_counts_update
+        AFTER UPDATE OF ts, grau ON feedback_compact
+        BEGIN
+            UPDATE feedback_daily_counts SET total = total - 1
+            WHERE data = date(OLD.ts, 'unixepoch') AND grau_satisfacao = {grau_texto.format('OLD')};
+            INSERT INTO feedback_daily_counts (data, grau_satisfacao, total)
+            VALUES (date(NEW.ts, 'unixepoch'), {grau_texto.format('NEW')}, 1)
+            ON CONFLICT (data, grau_satisfacao) DO UPDATE SET total = total + 1;
+        END
+    ''')
+
+    # Índices (substituem os da v4/v5)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_feedback_ts ON feedback_compact (ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_feedback_grau_ts ON feedback_compact (grau, ts)')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_feedback_client_key
+        ON feedback_compact (client_key) WHERE client_key IS NOT NULL
+    ''')
+
+
+def _migration_sync_state(conn):
+    """v7: estado da reconciliação com o Firestore + chave única para todos os registos.
+
+    Os registos antigos sem `client_key` ficam com o id do documento para o qual
+    foram enviados (feedback_{id}), para a reconciliação não os duplicar.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    conn.execute("UPDATE feedback_compact SET client_key = 'feedback_' || id WHERE client_key IS NULL")
+
+
+def _migration_feedback_view_keys(conn):
+    """v8: INSERT na view gera `client_key` e `timestamp` volta a ser UTC.
+
+    Registos inseridos pela view (scripts, testes) ficavam sem `client_key` e a
+    reconciliação voltava a importá-los do Firestore. `timestamp` é a data/hora
+    do registo convertida para UTC (como o antigo DEFAULT CURRENT_TIMESTAMP);
+    `data`/`hora` continuam em hora local.
+    """
+    conn.execute('DROP VIEW IF EXISTS feedback')
+    conn.execute('''
+        CREATE VIEW feedback AS
+        SELECT id,
+               CASE grau WHEN 0 THEN 'muito_satisfeito' WHEN 1 THEN 'satisfeito' WHEN 2 THEN 'insatisfeito' END
+                   AS grau_satisfacao,
+               date(ts, 'unixepoch') AS data,
+               time(ts, 'unixepoch') AS hora,
+               CASE CAST(strftime('%w', ts, 'unixepoch') AS INTEGER)
+                   WHEN 1 THEN 'Segunda-feira' WHEN 2 THEN 'Terça-feira' WHEN 3 THEN 'Quarta-feira'
+                   WHEN 4 THEN 'Quinta-feira' WHEN 5 THEN 'Sexta-feira' WHEN 6 THEN 'Sábado'
+                   ELSE 'Domingo' END AS dia_semana,
+               datetime(ts, 'unixepoch', 'utc') AS timestamp,
+               client_key,
+               ts,
+               grau
+        FROM feedback_compact
+    ''')
+    conn.execute('''
+        CREATE TRIGGER feedback_insert
+        INSTEAD OF INSERT ON feedback
+        BEGIN
+            INSERT INTO feedback_compact (id, ts, grau, client_key)
+            VALUES (
+                NEW.id,
+                CAST(strftime('%s', NEW.data || ' ' || NEW.hora) AS INTEGER),
+                CASE NEW.grau_satisfacao WHEN 'muito_satisfeito' THEN 0 WHEN 'satisfeito' THEN 1
+                    WHEN 'insatisfeito' THEN 2 END,
+                COALESCE(NEW.client_key, lower(hex(randomblob(16))))
+            );
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER feedback_delete
+        INSTEAD OF DELETE ON feedback
+        BEGIN
+            DELETE FROM feedback_compact WHERE id = OLD.id;
+        END
+    ''')
+    # Registos inseridos pela view desde a v7 (mesma regra da v7)
+    conn.execute("UPDATE feedback_compact SET client_key = 'feedback_' || id WHERE client_key IS NULL")
+
+
+def _migration_database_id(conn):
+    """v9: identificador aleatório desta base (sync_state `database_id`).
+
+    Uma base recriada (ex.: /tmp após um arranque a frio no Vercel) tem outro
+    identificador: os clientes das exportações incrementais detetam assim que os
+    ids recomeçaram e o seu since_id deixou de ser válido.
+    """
+    conn.execute(
+        "INSERT OR IGNORE INTO sync_state (name, value) VALUES ('database_id', ?)", (uuid.uuid4().hex,)
+    )
+
+
+MIGRATIONS = [
+    (1, _migration_feedback),
+    (2, _migration_sync_outbox),
+    (3, _migration_daily_counts),
+    (4, _migration_feedback_indexes),
+    (5, _migration_feedback_client_key),
+    (6, _migration_feedback_compact),
+    (7, _migration_sync_state),
+    (8, _migration_feedback_view_keys),
+    (9, _migration_database_id),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Versão do esquema aplicada a esta base de dados."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def init_db():
+    """Inicializa o banco de dados, aplicando as migrações pendentes."""
+    conn = get_db()
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return
+
+    # BEGIN IMMEDIATE: se vários processos arrancarem juntos, só um migra
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = get_schema_version(conn)
+        for number, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            migrate(conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+            print(f"✓ Migração {number} aplicada ({migrate.__name__})")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# Inicializar banco de dados ao iniciar a aplicação
+init_db()
+
+
+GRAUS_SATISFACAO = ['muito_satisfeito', 'satisfeito', 'insatisfeito']
+# Código guardado em feedback_compact.grau
+GRAU_CODES = {grau: code for code, grau in enumerate(GRAUS_SATISFACAO)}
+DAY_SECONDS = 86400
+
+
+def feedback_ts(when):
+    """Data/hora local -> `feedback_compact.ts` (segundos desde 1970, sem fuso)."""
+    return calendar.timegm(when.timetuple())
+
+
+def date_ts(data_str):
+    """'YYYY-MM-DD' -> `ts` do início desse dia (ValueError se inválida)."""
+    return feedback_ts(datetime.strptime(data_str, '%Y-%m-%d'))
+
+
+def count_feedback_by_grau(conn, data_inicio=None, data_fim=None):
+    """Totais por grau de satisfação a partir de `feedback_daily_counts`.
+
+    Sem datas devolve os totais gerais; com uma só data (data_fim=None) devolve
+    os totais desse dia; com as duas devolve o intervalo (inclusivo).
+    """
+    if data_inicio and data_fim:
+        where_sql, params = ' WHERE data BETWEEN ? AND ?', (data_inicio, data_fim)
+    elif data_inicio:
+        where_sql, params = ' WHERE data = ?', (data_inicio,)
+    else:
+        where_sql, params = '', ()
+
+    rows = conn.execute(f'''
+        SELECT grau_satisfacao, SUM(total) as total
+        FROM feedback_daily_counts{where_sql}
+        GROUP BY grau_satisfacao
+    ''', params).fetchall()
+
+    resultado = {grau: 0 for grau in GRAUS_SATISFACAO}
+    for row in rows:
+        resultado[row['grau_satisfacao']] = row['total']
+    return resultado
+
+
+# Cache em memória (TTL + LRU) para resumos/estatísticas
+# As entradas ficam associadas a uma "geração"; cada escrita em `feedback` incrementa
+# a geração (invalidate_cache), invalidando tudo de uma vez. Escritas feitas por outros
+# processos não passam por aqui: as rotas com ETag incluem a versão dos dados
+# (feedback_version) na chave, as restantes ficam limitadas pelo TTL.
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '15'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '256'))
+
+_cache = OrderedDict()  # chave -> (geração, expira_em, valor)
+_cache_lock = threading.Lock()
+_cache_generation = 0
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+
+def cached(key, compute):
+    """Devolve o valor em cache para `key` ou calcula-o com `compute()` e guarda-o."""
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == _cache_generation and entry[1] > now:
+            _cache.move_to_end(key)
+            _cache_stats['hits'] += 1
+            return entry[2]
+        _cache_stats['misses'] += 1
+        generation = _cache_generation
+
+    # Calculado fora do lock; se entretanto houver uma escrita, a entrada já nasce inválida
+    value = compute()
+    if CACHE_TTL_SECONDS <= 0:
+        return value
+
+    with _cache_lock:
+        _cache[key] = (generation, now + CACHE_TTL_SECONDS, value)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+            _cache_stats['evictions'] += 1
+    return value
+
+
+def invalidate_cache():
+    """Invalida todas as entradas (chamar após escrever em `feedback`)."""
+    global _cache_generation
+    with _cache_lock:
+        _cache_generation += 1
+        _cache.clear()
+        _cache_stats['invalidations'] += 1
+
+
+def get_cache_stats():
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats['entries'] = len(_cache)
+    lookups = stats['hits'] + stats['misses']
+    stats['hitRatio'] = round(stats['hits'] / lookups, 3) if lookups else None
+    stats['ttlSeconds'] = CACHE_TTL_SECONDS
+    return stats
+
+
+def cached_feedback_counts(conn, data_inicio=None, data_fim=None, version=None):
+    """count_feedback_by_grau com cache (devolve uma cópia, pode ser alterada)."""
+    if version is None:
+        version = feedback_version(conn)
+    counts = cached(('counts', version, data_inicio, data_fim),
+                    lambda: count_feedback_by_grau(conn, data_inicio, data_fim))
+    return dict(counts)
+
+
+# Respostas condicionais (ETag / If-None-Match) para os endpoints consultados em polling.
+# A versão dos dados é o último id de `feedback` (os registos não são alterados nem
+# apagados), combinada com o que mais a resposta depender (data do dia, filtros, ...).
+# As rotas que servem valores de `cached()` usam a mesma versão na chave da cache:
+# escritas de outros processos não invalidam a cache local, mas mudam a versão.
+def feedback_version(conn):
+    """Último id de `feedback` (0 se vazia)."""
+    return conn.execute('SELECT MAX(id) as last_id FROM feedback').fetchone()['last_id'] or 0
+
+
+def feedback_etag(conn, *parts, version=None):
+    """ETag forte para o estado atual de `feedback` (ou `version`) + `parts`."""
+    if version is None:
+        version = feedback_version(conn)
+    raw = '|'.join(str(part) for part in (version,) + parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+def with_etag(response, etag, private=False):
+    """Anexa o ETag; `no-cache` obriga o browser a revalidar em cada pedido."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+    return response
+
+
+def not_modified(etag, private=False):
+    response = with_etag(Response(status=304), etag, private)
+    # O cliente tem a versão comprimida (ETag fraco): o 304 repete esse ETag
+    if not request.if_none_match.contains(etag):
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# Compressão das respostas (gzip, ou brotli se o módulo `brotli` estiver instalado)
+# JSON/texto acima de COMPRESS_MIN_BYTES é comprimido conforme o Accept-Encoding;
+# as exportações em streaming são comprimidas bloco a bloco. O ETag da resposta
+# comprimida passa a fraco (W/"..."): identifica o estado dos dados, não os bytes.
+# Por isso o If-None-Match é comparado com contains_weak. Vai com Vary: Accept-Encoding.
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+COMPRESS_MIMETYPES = {
+    'application/json', 'text/csv', 'text/plain', 'text/html',
+    'text/css', 'text/javascript', 'application/javascript',
+}
+
+_brotli = None
+_brotli_checked = False
+
+
+def get_brotli():
+    """Módulo `brotli` (importação tardia), ou None se não estiver instalado."""
+    global _brotli, _brotli_checked
+    if not _brotli_checked:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = None
+        _brotli_checked = True
+    return _brotli
+
+
+def new_compressor(encoding):
+    """Compressor incremental com a interface (compress, flush) do zlib."""
+    if encoding == 'br':
+        compressor = get_brotli().Compressor(quality=min(COMPRESS_LEVEL, 11))
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # 31: cabeçalho gzip
+    return compressor.compress, compressor.flush
+
+
+def iter_compressed(chunks, encoding):
+    """Comprime um iterável de blocos de bytes sem o ler todo para memória."""
+    compress, flush = new_compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compress(chunk)
+            if data:
+                yield data
+        yield flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+@app.after_request
+def compress_response(response):
+    if (
+        response.status_code < 200 or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESS_MIMETYPES
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return response
+
+    encodings = ['br', 'gzip'] if get_brotli() else ['gzip']
+    encoding = request.accept_encodings.best_match(encodings)
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = iter_compressed(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        compress, flush = new_compressor(encoding)
+        response.set_data(compress(data) + flush())
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# Sincronização SQLite -> Firestore (outbox)
+# O pedido só grava no SQLite; um worker em background envia o outbox para o
+# Firestore em lotes (WriteBatch, máx. 500 escritas por commit) com backoff
+# exponencial em caso de falha.
+SYNC_BATCH_SIZE = max(1, min(int(os.environ.get('SYNC_BATCH_SIZE', '500')), 500))
+SYNC_BACKOFF_BASE_SECONDS = float(os.environ.get('SYNC_BACKOFF_BASE_SECONDS', '1'))
+SYNC_BACKOFF_MAX_SECONDS = float(os.environ.get('SYNC_BACKOFF_MAX_SECONDS', '300'))
+SYNC_IDLE_POLL_SECONDS = float(os.environ.get('SYNC_IDLE_POLL_SECONDS', '30'))
+# No Vercel a instância congela assim que a resposta termina (o worker em
+# background pára com ela): com SYNC_DRAIN_ON_REQUEST (ativo por omissão no
+# Vercel) o pedido que escreveu tenta enviar um lote ao fechar a resposta.
+SYNC_DRAIN_ON_REQUEST = os.environ.get('SYNC_DRAIN_ON_REQUEST', '1' if IS_VERCEL else '0') not in ['0', 'false', 'False']
+
+_sync_wakeup = threading.Event()
+# Um envio de cada vez (worker ou fim de pedido), para não repetir o mesmo lote
+_sync_drain_lock = threading.Lock()
+_sync_retry_after = 0.0
+_sync_state_lock = threading.Lock()
+_sync_thread = None
+_sync_state = {
+    'synced': 0,
+    'batches': 0,
+    'failures': 0,
+    'consecutiveFailures': 0,
+    'lastSyncAt': None,
+    'lastError': None,
+    'lastErrorAt': None,
+    'nextRetryAt': None,
+}
+
+
+def enqueue_firestore_write(conn, collection, doc_id, payload):
+    """Regista uma escrita pendente no outbox (na transação aberta de `conn`)."""
+    conn.execute(
+        'INSERT INTO sync_outbox (collection, doc_id, payload) VALUES (?, ?, ?)',
+        (collection, doc_id, json.dumps(payload, ensure_ascii=False))
+    )
+
+
+def drain_sync_outbox(conn, client):
+    """Envia um lote do outbox para o Firestore. Devolve o nº de documentos enviados."""
+    rows = conn.execute(
+        'SELECT id, collection, doc_id, payload FROM sync_outbox ORDER BY id LIMIT ?',
+        (SYNC_BATCH_SIZE,)
+    ).fetchall()
+    if not rows:
+        return 0
+
+    # `updatedAt` (epoch) é a marca usada pela reconciliação incremental noutras instâncias
+    updated_at = time.time()
+    batch = client.batch()
+    for row in rows:
+        payload = json.loads(row['payload'])
+        payload['updatedAt'] = updated_at
+        batch.set(client.collection(row['collection']).document(row['doc_id']), payload)
+
+    last_id = rows[-1]['id']
+    started = time.perf_counter()
+    try:
+        batch.commit()
+    except Exception as e:
+        record_firestore_call('batch_commit', time.perf_counter() - started, failed=True)
+        with conn:
+            conn.execute(
+                'UPDATE sync_outbox SET attempts = attempts + 1, last_error = ? WHERE id <= ?',
+                (str(e)[:500], last_id)
+            )
+        raise
+    record_firestore_call('batch_commit', time.perf_counter() - started)
+
+    # Os ids são crescentes (AUTOINCREMENT): tudo até ao último id do lote foi enviado
+    with conn:
+        conn.execute('DELETE FROM sync_outbox WHERE id <= ?', (last_id,))
+    return len(rows)
+
+
+def sync_outbox_once(conn, client):
+    """Envia um lote e atualiza o estado do sync.
+
+    Devolve (nº enviado, espera em segundos antes da próxima tentativa): em caso
+    de falha a espera cresce exponencialmente com as falhas consecutivas.
+    """
+    global _sync_retry_after
+    with _sync_drain_lock:
+        try:
+            sent = drain_sync_outbox(conn, client)
+        except Exception as e:
+            with _sync_state_lock:
+                failures = _sync_state['consecutiveFailures'] + 1
+                delay = min(SYNC_BACKOFF_BASE_SECONDS * (2 ** (failures - 1)), SYNC_BACKOFF_MAX_SECONDS)
+                _sync_state['failures'] += 1
+                _sync_state['consecutiveFailures'] = failures
+                _sync_state['lastError'] = str(e)
+                _sync_state['lastErrorAt'] = datetime.now().isoformat()
+                _sync_state['nextRetryAt'] = datetime.fromtimestamp(time.time() + delay).isoformat()
+                _sync_retry_after = time.time() + delay
+            print(f"⚠ Aviso: Erro ao sincronizar com o Firebase (nova tentativa em {delay:.0f}s): {e}")
+            return 0, delay
+
+    if sent:
+        with _sync_state_lock:
+            _sync_state['synced'] += sent
+            _sync_state['batches'] += 1
+            _sync_state['consecutiveFailures'] = 0
+            _sync_state['lastSyncAt'] = datetime.now().isoformat()
+            _sync_state['nextRetryAt'] = None
+    return sent, 0
+
+
+def drain_sync_outbox_on_close():
+    """Fim de pedido (SYNC_DRAIN_ON_REQUEST): tenta enviar um lote se o worker não estiver a enviar."""
+    client = get_firebase_db()
+    # Em backoff não insiste a cada pedido
+    if client is None or _sync_drain_lock.locked() or time.time() < _sync_retry_after:
+        return
+    sync_outbox_once(get_db(), client)
+
+
+def _sync_worker_loop():
+    """Loop do worker: drena o outbox e espera por novas escritas."""
+    conn = get_db()
+    while True:
+        _sync_wakeup.clear()
+        # Inicializa o Firebase aqui (em background) na primeira passagem
+        client = get_firebase_db()
+        if client is None:
+            _sync_wakeup.wait(SYNC_IDLE_POLL_SECONDS)
+            continue
+
+        sent, delay = sync_outbox_once(conn, client)
+        if delay:
+            # Durante o backoff não acordamos com novas escritas
+            time.sleep(delay)
+            continue
+        if sent:
+            continue
+
+        # Outbox vazio: esperar por notificação (ou poll, para escritas de outros processos)
+        _sync_wakeup.wait(SYNC_IDLE_POLL_SECONDS)
+
+
+def start_sync_worker():
+    """Arranca o worker de sincronização (uma vez por processo)."""
+    global _sync_thread
+    with _sync_state_lock:
+        if _sync_thread is not None and _sync_thread.is_alive():
+            return
+        _sync_thread = threading.Thread(target=_sync_worker_loop, name='firestore-sync', daemon=True)
+        _sync_thread.start()
+
+
+def notify_sync_worker():
+    """Acorda o worker após novas escritas no outbox."""
+    start_sync_worker()
+    _sync_wakeup.set()
+    if SYNC_DRAIN_ON_REQUEST and has_request_context() and not g.get('sync_drain_scheduled'):
+        g.sync_drain_scheduled = True
+
+        @after_this_request
+        def drain_on_close(response):
+            response.call_on_close(drain_sync_outbox_on_close)
+            return response
+
+
+def get_sync_status(conn):
+    """Estado do outbox + worker para diagnóstico."""
+    row = conn.execute('''
+        SELECT COUNT(*) AS pending, MIN(created_at) AS oldest, MAX(attempts) AS max_attempts
+        FROM sync_outbox
+    ''').fetchone()
+    with _sync_state_lock:
+        status = dict(_sync_state)
+    status['running'] = bool(_sync_thread and _sync_thread.is_alive())
+    status['pending'] = row['pending']
+    status['oldestPendingAt'] = row['oldest']
+    status['maxAttempts'] = row['max_attempts'] or 0
+    status['batchSize'] = SYNC_BATCH_SIZE
+    status['firestoreAvailable'] = bool(firebase_db)
+    with _reconcile_lock:
+        status['reconcile'] = dict(_reconcile_state)
+    status['reconcile']['highWaterMark'] = get_sync_value(conn, 'feedback_hwm')
+    return status
+
+
+# Reconciliação Firestore -> SQLite
+# Numa base local nova (cold start no Vercel, /tmp vazio) a primeira passagem lê
+# toda a coleção `feedback` (páginas ordenadas pelo id do documento, só com os
+# campos necessários). As passagens seguintes só leem os documentos com
+# `updatedAt` acima da marca guardada em sync_state (menos uma margem para
+# lotes confirmados fora de ordem). Os registos são identificados pela
+# `client_key`, pelo que reler um documento nunca o duplica.
+FIRESTORE_RECONCILE = os.environ.get('FIRESTORE_RECONCILE', '1') not in ['0', 'false', 'False']
+RECONCILE_PAGE_SIZE = int(os.environ.get('RECONCILE_PAGE_SIZE', '1000'))
+RECONCILE_INTERVAL_SECONDS = float(os.environ.get('RECONCILE_INTERVAL_SECONDS', '300'))
+RECONCILE_OVERLAP_SECONDS = float(os.environ.get('RECONCILE_OVERLAP_SECONDS', '120'))
+# Quanto tempo um pedido de estatísticas espera pela primeira passagem
+RECONCILE_WAIT_SECONDS = float(os.environ.get('RECONCILE_WAIT_SECONDS', '5'))
+RECONCILE_FIELDS = ['grau_satisfacao', 'data', 'hora', 'client_key', 'updatedAt']
+
+_reconcile_lock = threading.Lock()
+_reconcile_ready = threading.Event()
+_reconcile_thread = None
+_reconcile_state = {
+    'runs': 0,
+    'scanned': 0,
+    'inserted': 0,
+    'lastRunAt': None,
+    'lastFull': None,
+    'lastError': None,
+}
+
+
+def get_sync_value(conn, name):
+    row = conn.execute('SELECT value FROM sync_state WHERE name = ?', (name,)).fetchone()
+    return row['value'] if row else None
+
+
+def set_sync_value(conn, name, value):
+    conn.execute(
+        'INSERT INTO sync_state (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value',
+        (name, str(value))
+    )
+
+
+def iter_firestore_feedback(client, since=None):
+    """Percorre a coleção `feedback` em páginas de RECONCILE_PAGE_SIZE documentos.
+
+    Sem `since` lê tudo por ordem do id do documento (inclui documentos antigos
+    sem `updatedAt`); com `since` só os documentos com `updatedAt` > since.
+    """
+    collection = client.collection('feedback')
+    if since is None:
+        query = collection.order_by('__name__')
+    else:
+        query = collection.where('updatedAt', '>', since).order_by('updatedAt')
+    query = query.select(RECONCILE_FIELDS).limit(RECONCILE_PAGE_SIZE)
+
+    last = None
+    while True:
+        page = query.start_after(last) if last is not None else query
+        started = time.perf_counter()
+        try:
+            docs = list(page.stream())
+        except Exception:
+            record_firestore_call('query', time.perf_counter() - started, failed=True)
+            raise
+        record_firestore_call('query', time.perf_counter() - started)
+        if docs:
+            yield docs
+        if len(docs) < RECONCILE_PAGE_SIZE:
+            return
+        last = docs[-1]
+
+
+def firestore_feedback_rows(docs):
+    """Documentos -> linhas (ts, grau, client_key) + maior `updatedAt` da página."""
+    rows = []
+    high_water = None
+    for doc in docs:
+        data = doc.to_dict() or {}
+        grau = data.get('grau_satisfacao')
+        try:
+            when = datetime.strptime(f"{data.get('data')} {data.get('hora')}", '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+        if grau not in GRAU_CODES:
+            continue
+        # Documentos antigos não têm client_key: o id do documento é a chave (ver migração v7)
+        rows.append((feedback_ts(when), GRAU_CODES[grau], data.get('client_key') or doc.id))
+        updated_at = data.get('updatedAt')
+        if isinstance(updated_at, (int, float)):
+            high_water = updated_at if high_water is None else max(high_water, updated_at)
+    return rows, high_water
+
+
+def reconcile_feedback(conn, client, full=False):
+    """Traz do Firestore os registos que faltam no SQLite. Devolve {scanned, inserted, full}."""
+    stored = get_sync_value(conn, 'feedback_hwm')
+    full = full or stored is None
+    high_water = 0.0 if full else float(stored)
+    since = None if full else high_water - RECONCILE_OVERLAP_SECONDS
+
+    scanned = inserted = 0
+    for docs in iter_firestore_feedback(client, since):
+        rows, page_high_water = firestore_feedback_rows(docs)
+        scanned += len(docs)
+        if page_high_water is not None:
+            high_water = max(high_water, page_high_water)
+        with conn:
+            cursor = conn.executemany(
+                'INSERT OR IGNORE INTO feedback_compact (ts, grau, client_key) VALUES (?, ?, ?)', rows
+            )
+            inserted += max(cursor.rowcount, 0)
+            # Na passagem completa (ordem do id do documento) a marca só é gravada no fim
+            if not full:
+                set_sync_value(conn, 'feedback_hwm', high_water)
+    with conn:
+        set_sync_value(conn, 'feedback_hwm', high_water)
+
+    if inserted:
+        invalidate_cache()
+        publish_live_update(conn)
+
+    with _reconcile_lock:
+        _reconcile_state['runs'] += 1
+        _reconcile_state['scanned'] += scanned
+        _reconcile_state['inserted'] += inserted
+        _reconcile_state['lastRunAt'] = datetime.now().isoformat()
+        _reconcile_state['lastFull'] = full
+        _reconcile_state['lastError'] = None
+    return {'scanned': scanned, 'inserted': inserted, 'full': full}
+
+
+def _reconcile_worker_loop():
+    """Loop da reconciliação: primeira passagem no arranque, depois incremental."""
+    conn = get_db()
+    while True:
+        client = get_firebase_db()
+        if client is not None:
+            try:
+                result = reconcile_feedback(conn, client)
+                if result['inserted']:
+                    print(f"✓ Reconciliação: {result['inserted']} registos trazidos do Firestore")
+            except Exception as e:
+                with _reconcile_lock:
+                    _reconcile_state['lastError'] = str(e)
+                print(f"⚠ Aviso: Erro na reconciliação com o Firestore: {e}")
+        _reconcile_ready.set()
+        if RECONCILE_INTERVAL_SECONDS <= 0:
+            return
+        time.sleep(RECONCILE_INTERVAL_SECONDS)
+
+
+def start_reconcile_worker():
+    """Arranca a reconciliação em background (uma vez por processo)."""
+    global _reconcile_thread
+    with _reconcile_lock:
+        if _reconcile_thread is not None:
+            return
+        _reconcile_thread = threading.Thread(target=_reconcile_worker_loop, name='firestore-reconcile', daemon=True)
+        _reconcile_thread.start()
+
+
+def wait_for_reconcile(path):
+    # Arranque lazy (no primeiro pedido) para não atrasar o import; as leituras de
+    # estatísticas esperam um pouco pela primeira passagem numa base vazia.
+    if not FIRESTORE_RECONCILE or _reconcile_ready.is_set() or not firebase_configured():
+        return
+    start_reconcile_worker()
+    if path.startswith(('/api/admin/', '/api/public/', '/api/stream')):
+        _reconcile_ready.wait(RECONCILE_WAIT_SECONDS)
+
+
+@app.before_request
+def ensure_reconciled():
+    wait_for_reconcile(request.path)
+
+
+# Se ficaram escritas pendentes de uma execução anterior, retomar o envio
+if firebase_configured() and get_db().execute('SELECT 1 FROM sync_outbox LIMIT 1').fetchone():
+    start_sync_worker()
+
+
+# Ingestão de feedback
+DIAS_SEMANA = ['Segunda-feira', 'Terça-feira', 'Quarta-feira',
+               'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
+FEEDBACK_BATCH_MAX = int(os.environ.get('FEEDBACK_BATCH_MAX', '1000'))
+# Máximo de parâmetros por IN (...): o SQLite anterior a 3.32 só aceita 999 variáveis
+SQLITE_IN_CHUNK = 500
+# Tolerância para relógios de quiosques adiantados (timestamps no futuro passam a "agora")
+FEEDBACK_MAX_CLOCK_SKEW_SECONDS = float(os.environ.get('FEEDBACK_MAX_CLOCK_SKEW_SECONDS', '300'))
+
+
+def feedback_row(grau_satisfacao, when, client_key=None):
+    """Valores de uma linha de `feedback` (data/hora locais) + payload do Firestore."""
+    feedback_data = {
+        'grau_satisfacao': grau_satisfacao,
+        'data': when.strftime('%Y-%m-%d'),
+        'hora': when.strftime('%H:%M:%S'),
+        'dia_semana': DIAS_SEMANA[when.weekday()],
+        'timestamp': when.isoformat()
+    }
+    if client_key:
+        feedback_data['client_key'] = client_key
+    return feedback_data
+
+
+_DOC_ID_SAFE = re.compile(r'[A-Za-z0-9_-]{1,100}')
+
+
+def new_feedback_key():
+    return uuid.uuid4().hex
+
+
+def feedback_doc_id(client_key):
+    """Id do documento no Firestore, derivado da chave única do registo.
+
+    O id local não serve: numa base nova (ex.: /tmp no Vercel) os ids recomeçam
+    e os documentos antigos seriam reescritos.
+    """
+    if not _DOC_ID_SAFE.fullmatch(client_key):
+        client_key = uuid.uuid5(uuid.NAMESPACE_URL, client_key).hex
+    return f'feedback_{client_key}'
+
+
+def parse_client_timestamp(value, now):
+    """Converte o `createdAt` (ISO 8601) do cliente para hora local; inválido/ausente -> `now`."""
+    if not isinstance(value, str) or not value:
+        return now
+    try:
+        when = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return now
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+    if (when - now).total_seconds() > FEEDBACK_MAX_CLOCK_SKEW_SECONDS:
+        return now
+    return when
+
+
+def insert_feedback_batch(conn, events, sync_enabled=False):
+    """Insere vários feedbacks numa só transação (executemany).
+
+    Eventos com `clientKey` já registado (ou repetido no lote) são ignorados;
+    os eventos sem `clientKey` recebem uma chave nova.
+    Devolve (linhas inseridas, nº de duplicados, lista de rejeitados).
+    """
+    now = datetime.now()
+    rows, rejected, keys = [], [], set()
+    duplicates = 0
+    for index, event in enumerate(events):
+        if not isinstance(event, dict) or event.get('grau_satisfacao') not in GRAUS_SATISFACAO:
+            rejected.append({'index': index, 'error': 'Grau de satisfação inválido'})
+            continue
+        client_key = event.get('clientKey')
+        if client_key is not None:
+            client_key = str(client_key)[:100]
+            if client_key in keys:
+                duplicates += 1
+                continue
+            keys.add(client_key)
+        else:
+            client_key = new_feedback_key()
+        when = parse_client_timestamp(event.get('createdAt'), now)
+        rows.append((feedback_row(event['grau_satisfacao'], when, client_key), feedback_ts(when)))
+
+    # BEGIN IMMEDIATE: a verificação das chaves e o INSERT ficam sob o mesmo lock de escrita
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if keys:
+            keys = list(keys)
+            existing = set()
+            for start in range(0, len(keys), SQLITE_IN_CHUNK):
+                chunk = keys[start:start + SQLITE_IN_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                existing.update(row['client_key'] for row in conn.execute(
+                    f'SELECT client_key FROM feedback_compact WHERE client_key IN ({placeholders})', chunk
+                ))
+            if existing:
+                duplicates += len(existing)
+                rows = [(row, ts) for row, ts in rows if row['client_key'] not in existing]
+
+        rows = insert_feedback_rows(conn, rows, sync_enabled)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows, duplicates, rejected
+
+
+def insert_feedback_rows(conn, rows, sync_enabled=False):
+    """INSERT de [(payload, ts), ...] na transação aberta (com o lock de escrita).
+
+    Preenche o `id` de cada payload e, com `sync_enabled`, o outbox do Firestore.
+    Devolve a lista de payloads.
+    """
+    if not rows:
+        return []
+    conn.executemany(
+        'INSERT INTO feedback_compact (ts, grau, client_key) VALUES (?, ?, ?)',
+        [(ts, GRAU_CODES[row['grau_satisfacao']], row['client_key']) for row, ts in rows]
+    )
+    rows = [row for row, ts in rows]
+    # AUTOINCREMENT com o lock de escrita: os ids do lote são consecutivos
+    first_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0] - len(rows) + 1
+    for offset, row in enumerate(rows):
+        row['id'] = first_id + offset
+    if sync_enabled:
+        conn.executemany(
+            'INSERT INTO sync_outbox (collection, doc_id, payload) VALUES (?, ?, ?)',
+            [('feedback', feedback_doc_id(row['client_key']), json.dumps(row, ensure_ascii=False))
+             for row in rows]
+        )
+    return rows
+
+
+def record_feedback(conn, grau_satisfacao):
+    """Grava um feedback (+ outbox do Firestore) e notifica cache/ecrãs. Devolve o id.
+
+    Partilhado pela rota Flask e pela camada ASGI (api/asgi.py).
+    """
+    if FEEDBACK_GROUP_COMMIT:
+        # O thread escritor grava, invalida a cache e notifica os ecrãs
+        future = submit_feedback_group_commit(grau_satisfacao)
+        try:
+            return future.result(GROUP_COMMIT_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            # Só falha se o registo não chegar a ser gravado; se o lote já estiver a
+            # ser escrito, um erro aqui levaria o quiosque a reenviá-lo (duplicado)
+            if future.cancel():
+                raise
+            return future.result()
+
+    # Preparar dados do feedback (data, hora e dia da semana em português)
+    now = datetime.now()
+    client_key = new_feedback_key()
+    feedback_data = feedback_row(grau_satisfacao, now, client_key)
+
+    # Guardar no SQLite (+ outbox do Firestore na mesma transação)
+    sync_enabled = firebase_configured()
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO feedback_compact (ts, grau, client_key) VALUES (?, ?, ?)',
+            (feedback_ts(now), GRAU_CODES[grau_satisfacao], client_key)
+        )
+        feedback_id = cursor.lastrowid
+
+        # Adicionar id ao payload (útil para Firestore e integrações)
+        feedback_data['id'] = feedback_id
+
+        if sync_enabled:
+            enqueue_firestore_write(conn, 'feedback', feedback_doc_id(client_key), feedback_data)
+
+    # O envio para o Firebase (Firestore) é feito em background pelo worker do outbox
+    if sync_enabled:
+        notify_sync_worker()
+
+    # Invalida a cache e atualiza os ecrãs ligados a /api/stream
+    invalidate_cache()
+    publish_live_update(conn)
+    return feedback_id
+
+
+def feedback_batch_error(events):
+    """(mensagem, status HTTP) se a lista de eventos do lote for inválida, senão None."""
+    if not isinstance(events, list) or not events:
+        return 'Lista de eventos inválida', 400
+    if len(events) > FEEDBACK_BATCH_MAX:
+        return f'Máximo de {FEEDBACK_BATCH_MAX} eventos por pedido', 413
+    return None
+
+
+def record_feedback_batch(conn, events):
+    """Grava um lote (ver insert_feedback_batch) e devolve a resposta de /api/feedback/batch."""
+    sync_enabled = firebase_configured()
+    rows, duplicates, rejected = insert_feedback_batch(conn, events, sync_enabled)
+
+    if rows:
+        if sync_enabled:
+            notify_sync_worker()
+        invalidate_cache()
+        publish_live_update(conn)
+
+    return {
+        'success': True,
+        'inserted': len(rows),
+        'duplicates': duplicates,
+        'rejected': rejected,
+        'ids': [row['id'] for row in rows]
+    }
+
+
+# Group commit (opcional, FEEDBACK_GROUP_COMMIT=1)
+# Em picos de toques, cada POST /api/feedback faria o seu próprio commit. Com
+# group commit os pedidos entram numa fila e um único thread grava-os em
+# micro-lotes (até GROUP_COMMIT_MAX_ROWS linhas ou GROUP_COMMIT_MAX_DELAY_MS
+# após o primeiro), com um commit por lote. Cada pedido só responde depois do
+# commit do seu lote, com o id atribuído.
+FEEDBACK_GROUP_COMMIT = os.environ.get('FEEDBACK_GROUP_COMMIT', '0') in ['1', 'true', 'True']
+GROUP_COMMIT_MAX_ROWS = int(os.environ.get('GROUP_COMMIT_MAX_ROWS', '200'))
+GROUP_COMMIT_MAX_DELAY_MS = float(os.environ.get('GROUP_COMMIT_MAX_DELAY_MS', '5'))
+GROUP_COMMIT_TIMEOUT_SECONDS = float(os.environ.get('GROUP_COMMIT_TIMEOUT_SECONDS', '30'))
+
+_group_commit_queue = queue.Queue()
+_group_commit_lock = threading.Lock()
+_group_commit_thread = None
+_group_commit_stats = {'commits': 0, 'rows': 0, 'maxBatch': 0}
+
+
+def _group_commit_loop():
+    """Thread escritor: junta os pedidos pendentes e grava-os num só commit."""
+    while True:
+        pending = [_group_commit_queue.get()]
+        deadline = time.monotonic() + GROUP_COMMIT_MAX_DELAY_MS / 1000
+        while len(pending) < GROUP_COMMIT_MAX_ROWS:
+            remaining = deadline - time.monotonic()
+            try:
+                pending.append(_group_commit_queue.get(timeout=remaining) if remaining > 0
+                               else _group_commit_queue.get_nowait())
+            except queue.Empty:
+                break
+        # Pedidos que desistiram entretanto (timeout na camada ASGI) não são gravados
+        pending = [item for item in pending if item[2].set_running_or_notify_cancel()]
+        if not pending:
+            continue
+
+        # Qualquer erro (ligação, firebase_configured, escrita) falha só este lote:
+        # os pedidos recebem a exceção e a thread continua para o lote seguinte
+        try:
+            # Ligação aberta a cada lote: os testes/benchmarks podem trocar DATABASE
+            conn = get_db()
+            sync_enabled = firebase_configured()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                insert_feedback_rows(conn, [(row, ts) for row, ts, future in pending], sync_enabled)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        except Exception as e:
+            for row, ts, future in pending:
+                future.set_exception(e)
+            continue
+
+        with _group_commit_lock:
+            _group_commit_stats['commits'] += 1
+            _group_commit_stats['rows'] += len(pending)
+            _group_commit_stats['maxBatch'] = max(_group_commit_stats['maxBatch'], len(pending))
+        for row, ts, future in pending:
+            future.set_result(row['id'])
+
+        try:
+            if sync_enabled:
+                notify_sync_worker()
+            invalidate_cache()
+            publish_live_update(conn)
+        except Exception as e:
+            # Os registos já estão gravados; a cache expira pelo TTL e o feed volta a consultar MAX(id)
+            print(f"⚠ Aviso: Erro após o group commit: {e}")
+
+
+def submit_group_commit(feedback_data, ts):
+    """Enfileira um feedback para o próximo group commit; devolve um Future com o id."""
+    global _group_commit_thread
+    with _group_commit_lock:
+        if _group_commit_thread is None or not _group_commit_thread.is_alive():
+            _group_commit_thread = threading.Thread(target=_group_commit_loop, name='group-commit', daemon=True)
+            _group_commit_thread.start()
+    future = Future()
+    _group_commit_queue.put((feedback_data, ts, future))
+    return future
+
+
+def submit_feedback_group_commit(grau_satisfacao):
+    """Prepara um feedback e enfileira-o para o group commit (não bloqueia; ver api/asgi.py)."""
+    now = datetime.now()
+    return submit_group_commit(feedback_row(grau_satisfacao, now, new_feedback_key()), feedback_ts(now))
+
+
+def get_group_commit_stats():
+    with _group_commit_lock:
+        stats = dict(_group_commit_stats)
+    stats['enabled'] = FEEDBACK_GROUP_COMMIT
+    stats['avgBatch'] = round(stats['rows'] / stats['commits'], 2) if stats['commits'] else 0
+    return stats
+
+
+# Feed em tempo real (Server-Sent Events)
+# registrar_feedback publica um resumo após cada commit; cada ligação /api/stream
+# espera por essa notificação (mesmo processo) ou, ao fim de SSE_POLL_SECONDS,
+# compara MAX(id) na base de dados (escritas feitas por outros processos/workers).
+SSE_POLL_SECONDS = float(os.environ.get('SSE_POLL_SECONDS', '5'))
+SSE_KEEPALIVE_SECONDS = float(os.environ.get('SSE_KEEPALIVE_SECONDS', '20'))
+SSE_MAX_SECONDS = float(os.environ.get('SSE_MAX_SECONDS', '300'))
+SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', '3000'))
+# Num servidor WSGI (Vercel, servidor de desenvolvimento) cada ligação ocupa um thread ou
+# uma invocação durante até SSE_MAX_SECONDS, o que pode deixar /api/feedback sem workers.
+# Por isso o feed só está ativo por omissão na camada ASGI (api/asgi.py); LIVE_STREAM=1/0
+# força-o. O resumo público e o dashboard indicam-no em `liveStream` e os ecrãs ficam em
+# polling quando está desativado.
+LIVE_STREAM_ENABLED = os.environ.get('LIVE_STREAM', '0') in ['1', 'true', 'True']
+
+_live_cond = threading.Condition()
+_live_version = 0
+_live_snapshot = None
+_live_subscribers = 0
+# Callbacks chamados a cada publicação (ex.: a camada ASGI acorda as suas ligações)
+_live_listeners = []
+
+
+def live_snapshot(conn):
+    """Resumo enviado pelo feed: totais de hoje, totais gerais e último id."""
+    hoje = datetime.now().strftime('%Y-%m-%d')
+    today = count_feedback_by_grau(conn, hoje)
+    totals = count_feedback_by_grau(conn)
+    last_id = conn.execute('SELECT MAX(id) as last_id FROM feedback').fetchone()['last_id']
+    return {
+        'date': hoje,
+        'today': today,
+        'todayTotal': sum(today.values()),
+        'totals': totals,
+        'total': sum(totals.values()),
+        'lastId': last_id,
+        'firebaseAvailable': bool(firebase_db),
+    }
+
+
+def publish_live_update(conn):
+    """Notifica as ligações /api/stream deste processo (só calcula o resumo se houver ouvintes)."""
+    global _live_version, _live_snapshot
+    if not _live_subscribers:
+        return
+    snapshot = live_snapshot(conn)
+    with _live_cond:
+        _live_version += 1
+        _live_snapshot = snapshot
+        _live_cond.notify_all()
+        listeners = list(_live_listeners)
+    for listener in listeners:
+        listener(snapshot)
+
+
+def add_live_listener(listener):
+    """Regista `listener(snapshot)`; conta como um ouvinte enquanto estiver registado."""
+    global _live_subscribers
+    with _live_cond:
+        _live_listeners.append(listener)
+        _live_subscribers += 1
+
+
+def remove_live_listener(listener):
+    global _live_subscribers
+    with _live_cond:
+        _live_listeners.remove(listener)
+        _live_subscribers -= 1
+
+
+def live_event(snapshot, include_totals=False):
+    """Evento SSE `summary` (os totais por grau só vão para admin)."""
+    if not include_totals:
+        snapshot = {k: v for k, v in snapshot.items() if k != 'totals'}
+    data = json.dumps(snapshot, ensure_ascii=False, separators=(',', ':'))
+    return f"id: {snapshot['lastId'] or 0}\nevent: summary\ndata: {data}\n\n"
+
+
+def live_poll_snapshot(conn, sent_id, sent_date):
+    """Fallback multi-processo: novo resumo se houver novos registos (ou mudar o dia), senão None."""
+    last_id = conn.execute('SELECT MAX(id) as last_id FROM feedback').fetchone()['last_id'] or 0
+    hoje = datetime.now().strftime('%Y-%m-%d')
+    if last_id != sent_id or hoje != sent_date:
+        # Chave com o último id: as várias ligações partilham o mesmo cálculo
+        return cached(('live_snapshot', hoje, last_id), lambda: live_snapshot(conn))
+    return None
+
+
+def iter_live_updates(conn, include_totals=False):
+    """Gera os eventos SSE de uma ligação até SSE_MAX_SECONDS (o browser volta a ligar)."""
+    global _live_subscribers
+
+    def event(snapshot):
+        return live_event(snapshot, include_totals)
+
+    with _live_cond:
+        _live_subscribers += 1
+        seen_version = _live_version
+    try:
+        snapshot = live_snapshot(conn)
+        sent_id, sent_date = snapshot['lastId'] or 0, snapshot['date']
+        yield f"retry: {SSE_RETRY_MS}\n\n" + event(snapshot)
+
+        started = last_write = time.monotonic()
+        while time.monotonic() - started < SSE_MAX_SECONDS:
+            with _live_cond:
+                _live_cond.wait_for(lambda: _live_version != seen_version, timeout=SSE_POLL_SECONDS)
+                published = _live_snapshot if _live_version != seen_version else None
+                seen_version = _live_version
+
+            if published is None:
+                published = live_poll_snapshot(conn, sent_id, sent_date)
+
+            # Os resumos publicados por pedidos concorrentes podem chegar fora de ordem
+            if published is not None and ((published['lastId'] or 0) > sent_id or published['date'] != sent_date):
+                sent_id, sent_date = published['lastId'] or 0, published['date']
+                last_write = time.monotonic()
+                yield event(published)
+            elif time.monotonic() - last_write >= SSE_KEEPALIVE_SECONDS:
+                last_write = time.monotonic()
+                yield ": ping\n\n"
+    finally:
+        with _live_cond:
+            _live_subscribers -= 1
+
+
+def build_historico_filters(grau, data_inicio, data_fim, q, after=None):
+    """Monta o WHERE (e parâmetros) dos filtros opcionais do histórico.
+
+    As datas filtram a coluna `ts` (ValueError se inválidas). Com um cursor
+    `after` e outros filtros ativos, o limite superior é reduzido ao `ts` do
+    cursor para a pesquisa no índice começar nesse ponto.
+    """
+    where = []
+    params = []
+
+    ts_inicio = date_ts(data_inicio) if data_inicio else None
+    ts_fim = date_ts(data_fim) + DAY_SECONDS if data_fim else None
+
+    if after is not None and (grau in GRAUS_SATISFACAO or data_inicio or data_fim):
+        ts_fim = min(ts_fim, after[0] + 1) if ts_fim is not None else after[0] + 1
+
+    if grau in GRAUS_SATISFACAO:
+        where.append('grau = ?')
+        params.append(GRAU_CODES[grau])
+
+    if ts_inicio is not None:
+        where.append('ts >= ?')
+        params.append(ts_inicio)
+    if ts_fim is not None:
+        where.append('ts < ?')
+        params.append(ts_fim)
+
+    if q.isdigit():
+        where.append('id = ?')
+        params.append(int(q))
+
+    where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
+    return where_sql, params
+
+
+def historico_page_query(where_sql, params, per_page, offset=0, after=None):
+    """SELECT paginado do histórico (usa idx_feedback_ts / idx_feedback_grau_ts).
+
+    Com `after` (cursor (ts, id) da última linha da página anterior) a página é
+    obtida por keyset em vez de OFFSET, com custo constante em qualquer
+    profundidade.
+    """
+    params = list(params)
+    if after is not None:
+        keyset_sql = '(ts, id) < (?, ?)'
+        where_sql = f'{where_sql} AND {keyset_sql}' if where_sql else f' WHERE {keyset_sql}'
+        params.extend(after)
+        limit_sql = 'LIMIT ?'
+        params.append(per_page)
+    else:
+        limit_sql = 'LIMIT ? OFFSET ?'
+        params.extend([per_page, offset])
+
+    sql = f'''
+        SELECT id, grau_satisfacao, data, hora, dia_semana
+        FROM feedback
+        {where_sql}
+        ORDER BY ts DESC, id DESC
+        {limit_sql}
+    '''
+    return sql, tuple(params)
+
+
+def count_historico(conn, grau, data_inicio, data_fim, q):
+    """Total de registos do histórico com os filtros dados.
+
+    Sem filtro por id o total vem de `feedback_daily_counts`, pelo que não
+    depende do nº de linhas.
+    """
+    if q.isdigit():
+        where_sql, params = build_historico_filters(grau, data_inicio, data_fim, q)
+        return conn.execute(f'SELECT COUNT(*) as total FROM feedback{where_sql}', tuple(params)).fetchone()['total']
+
+    where, params = [], []
+    if grau in GRAUS_SATISFACAO:
+        where.append('grau_satisfacao = ?')
+        params.append(grau)
+    if data_inicio:
+        where.append('data >= ?')
+        params.append(data_inicio)
+    if data_fim:
+        where.append('data <= ?')
+        params.append(data_fim)
+    where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
+    return conn.execute(
+        f'SELECT COALESCE(SUM(total), 0) as total FROM feedback_daily_counts{where_sql}', tuple(params)
+    ).fetchone()['total']
+
+
+def parse_historico_cursor(value):
+    """Converte o cursor "data,hora,id" no tuplo (ts, id) (ValueError se inválido)."""
+    data_str, hora_str, id_str = value.split(',')
+    when = datetime.strptime(f'{data_str} {hora_str}', '%Y-%m-%d %H:%M:%S')
+    return feedback_ts(when), int(id_str)
+
+
+def export_dates(data_inicio, data_fim):
+    """Filtro de datas das exportações: só se aplica com as duas datas.
+
+    Devolve (data_inicio, data_fim) ou (None, None); ValueError se inválidas.
+    As rotas validam antes de começar a resposta (a exportação é gerada em streaming).
+    """
+    if not (data_inicio and data_fim):
+        return None, None
+    try:
+        date_ts(data_inicio)
+        date_ts(data_fim)
+    except ValueError:
+        raise ValueError('Datas inválidas')
+    return data_inicio, data_fim
+
+
+def export_query(data_inicio=None, data_fim=None, id_range=None):
+    """SELECT (e parâmetros) usado pelas exportações, por ordem cronológica.
+
+    Com `id_range` (since_id, until_id) é uma exportação incremental: só os ids
+    nesse intervalo (pesquisa na chave primária), por ordem de id.
+    """
+    if id_range:
+        where, params = ['id > ? AND id <= ?'], list(id_range)
+        if data_inicio and data_fim:
+            where.append('ts >= ? AND ts < ?')
+            params += [date_ts(data_inicio), date_ts(data_fim) + DAY_SECONDS]
+        return f'''
+            SELECT id, grau_satisfacao, data, hora, dia_semana
+            FROM feedback
+            WHERE {' AND '.join(where)}
+            ORDER BY id
+        ''', tuple(params)
+    if data_inicio and data_fim:
+        return '''
+            SELECT id, grau_satisfacao, data, hora, dia_semana
+            FROM feedback
+            WHERE ts >= ? AND ts < ?
+            ORDER BY ts, id
+        ''', (date_ts(data_inicio), date_ts(data_fim) + DAY_SECONDS)
+    return '''
+        SELECT id, grau_satisfacao, data, hora, dia_semana
+        FROM feedback
+        ORDER BY ts, id
+    ''', ()
+
+# Exportações em streaming
+# As linhas são lidas do cursor em blocos (fetchmany) e enviadas à medida que
+# são geradas, pelo que a memória usada não depende do tamanho do histórico.
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '1000'))
+
+GRAU_LABELS = {
+    'muito_satisfeito': 'Muito Satisfeito',
+    'satisfeito': 'Satisfeito',
+    'insatisfeito': 'Insatisfeito'
+}
+
+
+def iter_export_rows(conn, data_inicio=None, data_fim=None, progress=None, id_range=None):
+    """Percorre o resultado da exportação em blocos de EXPORT_CHUNK_SIZE linhas.
+
+    `progress(n)` (opcional) é chamado com o nº de linhas de cada bloco.
+    """
+    sql, params = export_query(data_inicio, data_fim, id_range)
+    cursor = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            if progress:
+                progress(len(rows))
+            yield rows
+    finally:
+        cursor.close()
+
+
+def export_id_range(conn, since_id):
+    """(since_id, último id) de uma exportação incremental, ou None sem `since_id`.
+
+    O último id é fixado antes de ler as linhas, para o cabeçalho X-Next-Since-Id
+    (enviado antes do corpo em streaming) corresponder ao que é exportado.
+    ValueError se `since_id` não for um inteiro >= 0.
+    """
+    if since_id is None or since_id == '':
+        return None
+    if not str(since_id).isdigit():
+        raise ValueError('since_id inválido')
+    since_id = int(since_id)
+    last_id = conn.execute('SELECT MAX(id) as last_id FROM feedback').fetchone()['last_id'] or 0
+    return since_id, max(since_id, last_id)
+
+
+def with_next_since_id(response, id_range, conn):
+    """X-Next-Since-Id + X-Database-Id: o since_id só vale para a mesma base (ids recomeçam numa base nova)."""
+    if id_range:
+        response.headers['X-Next-Since-Id'] = str(id_range[1])
+        response.headers['X-Database-Id'] = get_sync_value(conn, 'database_id') or ''
+    return response
+
+
+def generate_csv_export(conn, data_inicio=None, data_fim=None, progress=None, id_range=None):
+    """Gera o CSV em blocos de bytes (UTF-8)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['id', 'grau_satisfacao', 'data', 'hora', 'dia_semana'])
+    yield buffer.getvalue().encode('utf-8')
+
+    for rows in iter_export_rows(conn, data_inicio, data_fim, progress, id_range):
+        buffer.seek(0)
+        buffer.truncate(0)
+        for row in rows:
+            writer.writerow([
+                row['id'],
+                GRAU_LABELS.get(row['grau_satisfacao'], row['grau_satisfacao']),
+                row['data'],
+                row['hora'],
+                row['dia_semana'],
+            ])
+        yield buffer.getvalue().encode('utf-8')
+
+
+def generate_txt_export(conn, data_inicio=None, data_fim=None, progress=None, id_range=None):
+    """Gera o relatório TXT em blocos de bytes (UTF-8)."""
+    header = '=' * 80 + '\n'
+    header += 'RELATÓRIO DE FEEDBACK DE SATISFAÇÃO\n'
+    header += '=' * 80 + '\n\n'
+    yield header.encode('utf-8')
+
+    separator = '-' * 80 + '\n\n'
+    total = 0
+    for rows in iter_export_rows(conn, data_inicio, data_fim, progress, id_range):
+        parts = []
+        for row in rows:
+            parts.append(
+                f"ID: {row['id']}\n"
+                f"Grau de Satisfação: {GRAU_LABELS.get(row['grau_satisfacao'], row['grau_satisfacao'])}\n"
+                f"Data: {row['data']}\n"
+                f"Hora: {row['hora']}\n"
+                f"Dia da Semana: {row['dia_semana']}\n"
+                + separator
+            )
+        total += len(rows)
+        yield ''.join(parts).encode('utf-8')
+
+    footer = f"\nTotal de registros: {total}\n"
+    footer += f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n"
+    yield footer.encode('utf-8')
+
+
+XLSX_COLUMN_WIDTHS = {'A': 8, 'B': 20, 'C': 12, 'D': 12, 'E': 18}
+
+
+def write_xlsx_export(fileobj, conn, data_inicio=None, data_fim=None, progress=None, id_range=None):
+    """Escreve o Excel em modo write-only, com as linhas lidas do cursor em blocos.
+
+    O modo write-only não mantém as células em memória (são escritas para um
+    ficheiro temporário à medida que são adicionadas).
+    """
+    # Importação tardia: o openpyxl só é necessário nas exportações
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Feedback")
+
+    # Em write-only as larguras têm de ser definidas antes das linhas
+    for column, width in XLSX_COLUMN_WIDTHS.items():
+        ws.column_dimensions[column].width = width
+
+    # Cabeçalho com formatação
+    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    header = []
+    for title in ['ID', 'Grau de Satisfação', 'Data', 'Hora', 'Dia da Semana']:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.fill = header_fill
+        cell.font = header_font
+        header.append(cell)
+    ws.append(header)
+
+    try:
+        for rows in iter_export_rows(conn, data_inicio, data_fim, progress, id_range):
+            for row in rows:
+                ws.append([
+                    row['id'],
+                    GRAU_LABELS.get(row['grau_satisfacao'], row['grau_satisfacao']),
+                    row['data'],
+                    row['hora'],
+                    row['dia_semana']
+                ])
+    except Exception:
+        # Termina a folha já, e não quando o gerador for recolhido (com o ficheiro fechado)
+        ws.close()
+        raise
+
+    wb.save(fileobj)
+
+
+# Exportações em background (POST /api/admin/exports)
+# Um pool de EXPORT_WORKERS threads gera o ficheiro em EXPORT_CACHE_DIR, com um
+# nome derivado do formato, intervalo e versão dos dados (MAX(id), como nos
+# ETags). Um pedido igual, sem novos registos entretanto, é servido do ficheiro
+# já gerado sem voltar a ler a tabela. Os jobs vivem em memória (por processo).
+# No Vercel a instância congela quando a resposta termina (o pool pararia a meio) e
+# o estado/ficheiro só existem nessa instância: com EXPORT_JOBS_INLINE (ativo por
+# omissão no Vercel) o job corre até ao fim no próprio pedido POST, que responde já
+# com o download pronto, dentro do limite de duração da função.
+EXPORT_CACHE_DIR = os.path.abspath(os.environ.get('EXPORT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'feedback_exports'))
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', '2'))
+EXPORT_CACHE_MAX_FILES = int(os.environ.get('EXPORT_CACHE_MAX_FILES', '20'))
+EXPORT_JOBS_MAX = 100
+EXPORT_JOBS_INLINE = os.environ.get('EXPORT_JOBS_INLINE', '1' if IS_VERCEL else '0') not in ['0', 'false', 'False']
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', generate_csv_export),
+    'txt': ('text/plain; charset=utf-8', generate_txt_export),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', None),
+}
+
+_export_lock = threading.Lock()
+_export_jobs = OrderedDict()
+_export_pool = None
+
+
+def export_cache_path(conn, export_format, data_inicio=None, data_fim=None):
+    """Ficheiro em cache para este formato/intervalo no estado atual dos dados.
+
+    Além do MAX(id), a chave inclui o total de registos (remoções) e o inode da
+    base (um feedback.db recriado não reutiliza ficheiros da base anterior).
+    """
+    try:
+        inode = os.stat(DATABASE).st_ino
+    except OSError:
+        inode = 0
+    total = count_historico(conn, '', '', '', '')
+    key = feedback_etag(conn, 'export', DATABASE, inode, total, export_format, data_inicio or '', data_fim or '')
+    return os.path.join(EXPORT_CACHE_DIR, f'feedback_{key}.{export_format}')
+
+
+def write_export_file(path, conn, export_format, data_inicio=None, data_fim=None, progress=None):
+    """Gera a exportação para `path` (via ficheiro temporário + rename atómico)."""
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=EXPORT_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            generate = EXPORT_FORMATS[export_format][1]
+            if generate is None:
+                write_xlsx_export(output, conn, data_inicio, data_fim, progress)
+            else:
+                for chunk in generate(conn, data_inicio, data_fim, progress):
+                    output.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    prune_export_cache()
+
+
+def prune_export_cache():
+    """Mantém só os EXPORT_CACHE_MAX_FILES ficheiros usados mais recentemente."""
+    try:
+        names = [name for name in os.listdir(EXPORT_CACHE_DIR) if name.startswith('feedback_')]
+        paths = sorted((os.path.join(EXPORT_CACHE_DIR, name) for name in names), key=os.path.getmtime, reverse=True)
+        with _export_lock:
+            active = {job['path'] for job in _export_jobs.values() if job['status'] in ('queued', 'running')}
+        for path in paths[EXPORT_CACHE_MAX_FILES:]:
+            if path not in active:
+                os.unlink(path)
+    except OSError:
+        pass
+
+
+def export_job_payload(job):
+    payload = {key: value for key, value in job.items() if key != 'path'}
+    if job['status'] == 'done':
+        payload['downloadUrl'] = f"/api/admin/exports/{job['id']}/download"
+    return payload
+
+
+def create_export_job(conn, export_format, data_inicio=None, data_fim=None):
+    """Cria (ou reutiliza) um job de exportação; devolve o payload do job.
+
+    ValueError se o formato ou as datas forem inválidos.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError('Formato inválido (csv, xlsx ou txt)')
+    # Como em export_query: sem as duas datas exporta tudo
+    data_inicio, data_fim = export_dates(data_inicio, data_fim)
+    if data_inicio and data_inicio > data_fim:
+        raise ValueError('Datas inválidas')
+
+    global _export_pool
+    path = export_cache_path(conn, export_format, data_inicio, data_fim)
+    with _export_lock:
+        # Um job igual ainda em curso (ou já concluído) serve este pedido
+        for job in reversed(_export_jobs.values()):
+            if job['path'] == path and job['status'] != 'error' and (job['status'] != 'done' or os.path.exists(path)):
+                return export_job_payload(job)
+
+        total = count_historico(conn, '', data_inicio or '', data_fim or '', '')
+        job = {
+            'id': uuid.uuid4().hex,
+            'format': export_format,
+            'dataInicio': data_inicio,
+            'dataFim': data_fim,
+            'status': 'queued',
+            'rows': 0,
+            'totalRows': total,
+            'progress': 0.0,
+            'cached': False,
+            'size': None,
+            'error': None,
+            'createdAt': datetime.now().isoformat(timespec='seconds'),
+            'finishedAt': None,
+            'path': path,
+        }
+        if os.path.exists(path):
+            os.utime(path)
+            job.update(status='done', rows=total, progress=1.0, cached=True, size=os.path.getsize(path),
+                       finishedAt=job['createdAt'])
+
+        _export_jobs[job['id']] = job
+        while len(_export_jobs) > EXPORT_JOBS_MAX:
+            _export_jobs.popitem(last=False)
+
+        if job['status'] == 'queued' and not EXPORT_JOBS_INLINE:
+            if _export_pool is None:
+                _export_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='export')
+            _export_pool.submit(run_export_job, job)
+
+    if job['status'] == 'queued':
+        # EXPORT_JOBS_INLINE: no pedido, com a ligação deste thread
+        run_export_job(job)
+    return export_job_payload(job)
+
+
+def run_export_job(job):
+    """Corre no pool de exportações (ligação SQLite própria do thread)."""
+    def progress(rows):
+        job['rows'] += rows
+        job['progress'] = round(min(job['rows'] / job['totalRows'], 1.0), 4) if job['totalRows'] else 0.0
+
+    job['status'] = 'running'
+    try:
+        write_export_file(job['path'], get_db(), job['format'], job['dataInicio'], job['dataFim'], progress)
+        job.update(status='done', progress=1.0, size=os.path.getsize(job['path']))
+    except Exception as e:
+        job.update(status='error', error=str(e))
+    finally:
+        job['finishedAt'] = datetime.now().isoformat(timespec='seconds')
+
+
+def get_export_job(job_id):
+    with _export_lock:
+        return _export_jobs.get(job_id)
+
+
+def stats_payload(stats):
+    """Totais por grau + total geral + percentagens (formato de /api/admin/stats)."""
+    total_geral = sum(stats.values())
+
+    resultado = {
+        'muito_satisfeito': 0,
+        'satisfeito': 0,
+        'insatisfeito': 0,
+        'total': total_geral
+    }
+
+    percentagens = {
+        'muito_satisfeito': 0,
+        'satisfeito': 0,
+        'insatisfeito': 0
+    }
+
+    for grau, total in stats.items():
+        resultado[grau] = total
+        if total_geral > 0:
+            percentagens[grau] = round((total / total_geral) * 100, 2)
+
+    resultado['percentagens'] = percentagens
+    return resultado
+
+
+def dashboard_counts(conn, hoje):
+    """Totais gerais, totais do dia e último id numa única consulta.
+
+    Um só SELECT corre numa só transação de leitura: os três valores são
+    consistentes entre si mesmo com escritas concorrentes.
+    """
+    rows = conn.execute('''
+        SELECT 'total' AS scope, grau_satisfacao, SUM(total) AS total
+        FROM feedback_daily_counts
+        GROUP BY grau_satisfacao
+        UNION ALL
+        SELECT 'today', grau_satisfacao, total
+        FROM feedback_daily_counts
+        WHERE data = ?
+        UNION ALL
+        SELECT 'last_id', NULL, MAX(id)
+        FROM feedback
+    ''', (hoje,)).fetchall()
+
+    totals = {grau: 0 for grau in GRAUS_SATISFACAO}
+    today = {grau: 0 for grau in GRAUS_SATISFACAO}
+    last_id = None
+    for row in rows:
+        if row['scope'] == 'total':
+            totals[row['grau_satisfacao']] = row['total']
+        elif row['scope'] == 'today':
+            today[row['grau_satisfacao']] = row['total']
+        else:
+            last_id = row['total']
+    return {'totals': totals, 'today': today, 'lastId': last_id}
+
+
+# Séries temporais (/api/admin/stats/series)
+# bucket -> (tabela, expressão do bucket, contagem). Dia/semana/dia da semana usam os
+# contadores diários; a hora precisa da tabela `feedback`.
+SERIES_BUCKETS = {
+    'hour': ('feedback', "strftime('%Y-%m-%d %H:00', ts, 'unixepoch')", 'COUNT(*)'),
+    'day': ('feedback_daily_counts', 'data', 'SUM(total)'),
+    # Segunda-feira da semana (ISO) de cada dia
+    'week': ('feedback_daily_counts', "date(data, '-6 days', 'weekday 1')", 'SUM(total)'),
+    # 0 = Domingo ... 6 = Sábado
+    'weekday': ('feedback_daily_counts', "CAST(strftime('%w', data) AS INTEGER)", 'SUM(total)'),
+}
+SERIES_DEFAULT_DAYS = 30
+PERIODS_MAX = int(os.environ.get('PERIODS_MAX', '200'))
+SERIES_MAX_POINTS = int(os.environ.get('SERIES_MAX_POINTS', '5000'))
+
+
+def series_labels(bucket, data_inicio, data_fim):
+    """Lista densa de buckets (e respetivas etiquetas) entre as duas datas (inclusivo)."""
+    start = datetime.strptime(data_inicio, '%Y-%m-%d')
+    end = datetime.strptime(data_fim, '%Y-%m-%d')
+    days = (end - start).days + 1
+
+    if bucket == 'weekday':
+        # Segunda-feira primeiro, como em DIAS_SEMANA
+        return [(weekday + 1) % 7 for weekday in range(7)], list(DIAS_SEMANA)
+    if bucket == 'day':
+        keys = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+    elif bucket == 'week':
+        monday = start - timedelta(days=start.weekday())
+        keys = []
+        while monday <= end:
+            keys.append(monday.strftime('%Y-%m-%d'))
+            monday += timedelta(days=7)
+    else:
+        keys = [
+            f"{(start + timedelta(days=i)).strftime('%Y-%m-%d')} {hour:02d}:00"
+            for i in range(days) for hour in range(24)
+        ]
+    return keys, keys
+
+
+def feedback_series(conn, bucket, data_inicio, data_fim):
+    """Contagens por bucket e grau num só GROUP BY, em formato de colunas (zeros incluídos)."""
+    table, expression, aggregate = SERIES_BUCKETS[bucket]
+    if table == 'feedback':
+        where_sql, params = 'ts >= ? AND ts < ?', (date_ts(data_inicio), date_ts(data_fim) + DAY_SECONDS)
+    else:
+        where_sql, params = 'data BETWEEN ? AND ?', (data_inicio, data_fim)
+    rows = conn.execute(f'''
+        SELECT {expression} AS bucket, grau_satisfacao, {aggregate} AS total
+        FROM {table}
+        WHERE {where_sql}
+        GROUP BY bucket, grau_satisfacao
+    ''', params).fetchall()
+
+    keys, labels = series_labels(bucket, data_inicio, data_fim)
+    position = {key: i for i, key in enumerate(keys)}
+    series = {grau: [0] * len(keys) for grau in GRAUS_SATISFACAO}
+    for row in rows:
+        i = position.get(row['bucket'])
+        if i is not None and row['grau_satisfacao'] in series:
+            series[row['grau_satisfacao']][i] = row['total']
+
+    return {
+        'bucket': bucket,
+        'from': data_inicio,
+        'to': data_fim,
+        'labels': labels,
+        'series': series,
+        'total': [sum(values) for values in zip(*series.values())],
+    }
+
+
+def count_feedback_by_periods(conn, periodos):
+    """Totais por grau para N períodos [(inicio, fim), ...] (inclusivos) numa só consulta.
+
+    Os períodos entram como uma tabela VALUES juntada aos contadores diários (pesquisa
+    pela chave primária por período); podem sobrepor-se.
+    """
+    values = ', '.join('(?, ?, ?)' for _ in periodos)
+    params = [value for i, (inicio, fim) in enumerate(periodos) for value in (i, inicio, fim)]
+    rows = conn.execute(f'''
+        WITH periodos(idx, inicio, fim) AS (VALUES {values})
+        SELECT p.idx, c.grau_satisfacao, SUM(c.total) as total
+        FROM periodos p
+        JOIN feedback_daily_counts c ON c.data BETWEEN p.inicio AND p.fim
+        GROUP BY p.idx, c.grau_satisfacao
+    ''', params).fetchall()
+
+    resultado = [{grau: 0 for grau in GRAUS_SATISFACAO} for _ in periodos]
+    for row in rows:
+        resultado[row['idx']][row['grau_satisfacao']] = row['total']
+    return resultado
+
+
+def variacao_percentual(val1, val2):
+    """Variação (%) de val1 para val2; de 0 para >0 conta como 100%."""
+    if val1 == 0:
+        return 100 if val2 > 0 else 0
+    return round(((val2 - val1) / val1) * 100, 2)
+
+
+def compare_periods(conn, periodos, version=None):
+    """Totais de cada período + variação por grau face ao período anterior."""
+    if version is None:
+        version = feedback_version(conn)
+    counts = cached(('periods', version, tuple(periodos)), lambda: count_feedback_by_periods(conn, periodos))
+    resultado = []
+    anterior = None
+    for (inicio, fim), stats in zip(periodos, counts):
+        periodo = dict(stats, inicio=inicio, fim=fim, total=sum(stats.values()))
+        periodo['variacao'] = None if anterior is None else {
+            grau: variacao_percentual(anterior[grau], stats[grau]) for grau in GRAUS_SATISFACAO
+        }
+        resultado.append(periodo)
+        anterior = stats
+    return resultado
+
+
+def database_size():
+    try:
+        if os.path.exists(DATABASE):
+            return os.path.getsize(DATABASE)
+    except Exception:
+        pass
+    return None
+
+
+def system_payload(total, last_id, db_size, firestore_available):
+    """Formato de /api/admin/system."""
+    return {
+        'time': datetime.now().isoformat(),
+        'python': sys.version.split(' ')[0],
+        'total': total,
+        'lastId': last_id,
+        'db': {
+            'path': DATABASE,
+            'sizeBytes': db_size,
+        },
+        'firebase': {
+            'initialized': _firebase_app_ready,
+            'firestoreAvailable': firestore_available,
+            'projectId': FIREBASE_WEB_CONFIG.get('projectId') or None,
+        },
+        'admin': {
+            'email': session.get('admin_email'),
+        },
+        'cache': get_cache_stats(),
+    }
+
+
+def streaming_download(chunks, mimetype, extension):
+    """Resposta em streaming com Content-Disposition de anexo."""
+    filename = f'feedback_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 
 @app.route('/')
 def index():
@@ -186,15 +2727,18 @@ def health_check():
     """Health check simples (SQLite + Firebase init)."""
     sqlite_ok = False
     sqlite_error = None
+    sync_status = None
     try:
         conn = get_db()
         conn.execute('SELECT 1').fetchone()
-        conn.close()
         sqlite_ok = True
+        sync_status = get_sync_status(conn)
     except Exception as e:
         sqlite_error = str(e)
 
-    firebase_ok = bool(firebase_db and firebase_admin._apps)
+    # O health check força a inicialização (lazy) para reportar o estado real
+    get_firebase_db()
+    firebase_ok = bool(firebase_db and _firebase_app_ready)
 
     diagnostics_enabled = bool(os.environ.get('DEBUG_DIAGNOSTICS'))
 
@@ -208,16 +2752,25 @@ def health_check():
             'error': sqlite_error,
         },
         'firebase': {
-            'initialized': bool(firebase_admin._apps),
+            'initialized': _firebase_app_ready,
             'firestoreAvailable': bool(firebase_db),
             'ok': firebase_ok,
             'projectId': FIREBASE_WEB_CONFIG.get('projectId') or None,
             'credSource': firebase_cred_source,
             'error': firebase_init_error,
-        }
+        },
+        'sync': {
+            'pending': sync_status['pending'] if sync_status else None,
+            'running': sync_status['running'] if sync_status else False,
+            'lastSyncAt': sync_status['lastSyncAt'] if sync_status else None,
+            'lastError': sync_status['lastError'] if sync_status else None,
+        },
+        'cache': get_cache_stats(),
+        'groupCommit': get_group_commit_stats(),
     }
 
     if diagnostics_enabled:
+        _find_firebase_credentials()
         payload['firebase']['triedPaths'] = firebase_cred_tried_paths
         payload['server'] = {
             'cwd': os.getcwd(),
@@ -227,44 +2780,69 @@ def health_check():
     return jsonify(payload)
 
 
-@app.route('/api/public/summary', methods=['GET'])
-def public_summary():
-    """Resumo público para o ecrã principal (sem auth)."""
-    try:
-        hoje = datetime.now().strftime('%Y-%m-%d')
-        conn = get_db()
+def public_summary_etag(conn, hoje, version):
+    return feedback_etag(conn, 'public_summary', hoje, bool(firebase_db), version=version)
 
-        # Totais de hoje
-        rows_hoje = conn.execute('''
-            SELECT grau_satisfacao, COUNT(*) as total
-            FROM feedback
-            WHERE data = ?
-            GROUP BY grau_satisfacao
-        ''', (hoje,)).fetchall()
+
+def public_summary_payload(conn, hoje, version):
+    """Resumo do dia + total geral (partilhado pela rota Flask e pela camada ASGI)."""
+    def compute():
+        # Totais de hoje (contadores diários)
+        hoje_result = count_feedback_by_grau(conn, hoje)
 
         # Total geral + último id
-        total_geral = conn.execute('SELECT COUNT(*) as total FROM feedback').fetchone()['total']
+        total_geral = conn.execute('SELECT COALESCE(SUM(total), 0) as total FROM feedback_daily_counts').fetchone()['total']
         last_id_row = conn.execute('SELECT MAX(id) as last_id FROM feedback').fetchone()
         last_id = last_id_row['last_id'] if last_id_row else None
 
-        conn.close()
-
-        hoje_result = {
-            'muito_satisfeito': 0,
-            'satisfeito': 0,
-            'insatisfeito': 0,
-        }
-        for r in rows_hoje:
-            hoje_result[r['grau_satisfacao']] = r['total']
-
-        return jsonify({
+        return {
             'date': hoje,
             'today': hoje_result,
             'todayTotal': sum(hoje_result.values()),
             'total': total_geral,
             'lastId': last_id,
-            'firebaseAvailable': bool(firebase_db),
-        })
+        }
+
+    # Em cache até ao próximo feedback (ou CACHE_TTL_SECONDS)
+    summary = cached(('public_summary', hoje, version), compute)
+    return dict(summary, firebaseAvailable=bool(firebase_db), liveStream=LIVE_STREAM_ENABLED)
+
+
+@app.route('/api/public/summary', methods=['GET'])
+def public_summary():
+    """Resumo público para o ecrã principal (sem auth)."""
+    try:
+        hoje = datetime.now().strftime('%Y-%m-%d')
+        conn = get_db()
+
+        # Não inicializa o Firebase neste pedido: o worker do outbox fá-lo em background
+        if firebase_configured():
+            start_sync_worker()
+
+        version = feedback_version(conn)
+        etag = public_summary_etag(conn, hoje, version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+        return with_etag(jsonify(public_summary_payload(conn, hoje, version)), etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stream', methods=['GET'])
+def live_stream():
+    """Feed SSE com o resumo atualizado a cada novo feedback (totais por grau só para admin)."""
+    if not LIVE_STREAM_ENABLED:
+        return jsonify({'error': 'Feed em tempo real desativado'}), 404
+    try:
+        include_totals = bool(session.get('admin_logged_in'))
+        conn = get_db()
+        response = Response(
+            stream_with_context(iter_live_updates(conn, include_totals)),
+            mimetype='text/event-stream'
+        )
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -278,47 +2856,8 @@ def registrar_feedback():
         if grau_satisfacao not in ['muito_satisfeito', 'satisfeito', 'insatisfeito']:
             return jsonify({'error': 'Grau de satisfação inválido'}), 400
         
-        now = datetime.now()
-        data_str = now.strftime('%Y-%m-%d')
-        hora_str = now.strftime('%H:%M:%S')
-        timestamp_str = now.isoformat()
-        
-        # Dias da semana em português
-        dias_semana = ['Segunda-feira', 'Terça-feira', 'Quarta-feira', 
-                       'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
-        dia_semana = dias_semana[now.weekday()]
-        
-        # Preparar dados do feedback
-        feedback_data = {
-            'grau_satisfacao': grau_satisfacao,
-            'data': data_str,
-            'hora': hora_str,
-            'dia_semana': dia_semana,
-            'timestamp': timestamp_str
-        }
-        
-        # Guardar no SQLite
-        conn = get_db()
-        cursor = conn.execute(
-            'INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)',
-            (grau_satisfacao, data_str, hora_str, dia_semana)
-        )
-        conn.commit()
-        feedback_id = cursor.lastrowid
-        conn.close()
+        feedback_id = record_feedback(get_db(), grau_satisfacao)
 
-        # Adicionar id ao payload (útil para Firestore e integrações)
-        feedback_data['id'] = feedback_id
-        
-        # Guardar no Firebase (Firestore)
-        if firebase_db:
-            try:
-                firebase_db.collection('feedback').document(f'feedback_{feedback_id}').set(feedback_data)
-                print(f"✓ Feedback {feedback_id} sincronizado com Firebase")
-            except Exception as firebase_error:
-                # Log do erro mas não falha a resposta
-                print(f"⚠ Aviso: Erro ao guardar no Firebase: {firebase_error}")
-        
         return jsonify({
             'success': True,
             'message': 'Obrigado pelo seu feedback!',
@@ -328,6 +2867,26 @@ def registrar_feedback():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/feedback/batch', methods=['POST'])
+def registrar_feedback_batch():
+    """Regista vários feedbacks (fila offline do quiosque) numa só transação.
+
+    Corpo: {"events": [{"grau_satisfacao", "createdAt", "clientKey"}, ...]}.
+    O `createdAt` do cliente define a data/hora; `clientKey` torna o reenvio idempotente.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        events = data.get('events')
+
+        error = feedback_batch_error(events)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        return jsonify(record_feedback_batch(get_db(), events))
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/admin_rocha', methods=['GET', 'POST'])
 def admin_login():
     """Página de login do admin"""
@@ -397,16 +2956,22 @@ def admin_login_firebase():
         if not id_token:
             return jsonify({'error': 'idToken ausente'}), 400
 
-        if not firebase_admin._apps:
-            return jsonify({'error': 'Firebase não inicializado'}), 503
-
-        decoded = auth.verify_id_token(id_token)
+        if os.environ.get('FIREBASE_AUTH_EMULATOR_HOST'):
+            # Tokens do emulador não são assinados: só o firebase_admin os aceita
+            if not ensure_firebase_app():
+                return jsonify({'error': 'Firebase não inicializado'}), 503
+            from firebase_admin import auth
+            decoded = auth.verify_id_token(id_token)
+        else:
+            # Chaves públicas em cache (não precisa da app firebase_admin)
+            decoded = verify_firebase_id_token(id_token)
         uid = decoded.get('uid')
         email = decoded.get('email')
 
         if not email and uid:
-            user = auth.get_user(uid)
-            email = user.email
+            if not ensure_firebase_app():
+                return jsonify({'error': 'Firebase não inicializado'}), 503
+            email = get_firebase_user_email(uid)
 
         if not _is_admin_email_allowed(email):
             return jsonify({'error': 'Conta não autorizada para admin'}), 403
@@ -416,6 +2981,8 @@ def admin_login_firebase():
         session['admin_email'] = email
 
         return jsonify({'success': True, 'email': email})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -435,43 +3002,15 @@ def get_stats():
     
     try:
         conn = get_db()
+        version = feedback_version(conn)
+        etag = feedback_etag(conn, 'stats', version=version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag, private=True)
         
-        # Total por tipo de satisfação
-        stats = conn.execute('''
-            SELECT grau_satisfacao, COUNT(*) as total
-            FROM feedback
-            GROUP BY grau_satisfacao
-        ''').fetchall()
-        
-        # Total geral
-        total_geral = conn.execute('SELECT COUNT(*) as total FROM feedback').fetchone()['total']
-        
-        conn.close()
-        
-        # Calcular percentagens
-        resultado = {
-            'muito_satisfeito': 0,
-            'satisfeito': 0,
-            'insatisfeito': 0,
-            'total': total_geral
-        }
-        
-        percentagens = {
-            'muito_satisfeito': 0,
-            'satisfeito': 0,
-            'insatisfeito': 0
-        }
-        
-        for row in stats:
-            grau = row['grau_satisfacao']
-            total = row['total']
-            resultado[grau] = total
-            if total_geral > 0:
-                percentagens[grau] = round((total / total_geral) * 100, 2)
-        
-        resultado['percentagens'] = percentagens
+        # Total por tipo de satisfação (contadores diários, em cache)
+        resultado = stats_payload(cached_feedback_counts(conn, version=version))
         
-        return jsonify(resultado)
+        return with_etag(jsonify(resultado), etag, private=True)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -487,39 +3026,95 @@ def get_daily_stats():
         
         conn = get_db()
         
-        if data_filtro:
-            stats = conn.execute('''
-                SELECT grau_satisfacao, COUNT(*) as total
-                FROM feedback
-                WHERE data = ?
-                GROUP BY grau_satisfacao
-            ''', (data_filtro,)).fetchall()
-        else:
-            # Retorna o dia atual
-            hoje = datetime.now().strftime('%Y-%m-%d')
-            stats = conn.execute('''
-                SELECT grau_satisfacao, COUNT(*) as total
-                FROM feedback
-                WHERE data = ?
-                GROUP BY grau_satisfacao
-            ''', (hoje,)).fetchall()
-        
-        conn.close()
-        
-        resultado = {
-            'muito_satisfeito': 0,
-            'satisfeito': 0,
-            'insatisfeito': 0
-        }
-        
-        for row in stats:
-            resultado[row['grau_satisfacao']] = row['total']
+        # Sem filtro retorna o dia atual
+        dia = data_filtro or datetime.now().strftime('%Y-%m-%d')
+        version = feedback_version(conn)
+        etag = feedback_etag(conn, 'stats_daily', dia, version=version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag, private=True)
+
+        resultado = cached_feedback_counts(conn, dia, version=version)
         
-        return jsonify(resultado)
+        return with_etag(jsonify(resultado), etag, private=True)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/stats/series')
+def get_series_stats():
+    """Série temporal por hora/dia/semana/dia da semana (?from=&to=&bucket=)."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    try:
+        bucket = request.args.get('bucket', 'day')
+        if bucket not in SERIES_BUCKETS:
+            return jsonify({'error': 'Bucket inválido (hour, day, week, weekday)'}), 400
+
+        # Por omissão: últimos 30 dias
+        try:
+            fim = datetime.strptime(request.args.get('to') or datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d')
+            inicio = request.args.get('from')
+            inicio = datetime.strptime(inicio, '%Y-%m-%d') if inicio else fim - timedelta(days=SERIES_DEFAULT_DAYS - 1)
+        except ValueError:
+            return jsonify({'error': 'Datas inválidas'}), 400
+
+        days = (fim - inicio).days + 1
+        if days < 1:
+            return jsonify({'error': 'Datas inválidas'}), 400
+        points = {'hour': days * 24, 'day': days, 'week': days // 7 + 2, 'weekday': 7}[bucket]
+        if points > SERIES_MAX_POINTS:
+            return jsonify({'error': f'Intervalo demasiado grande (máximo {SERIES_MAX_POINTS} pontos)'}), 400
+
+        data_inicio, data_fim = inicio.strftime('%Y-%m-%d'), fim.strftime('%Y-%m-%d')
+        conn = get_db()
+        version = feedback_version(conn)
+        etag = feedback_etag(conn, 'stats_series', bucket, data_inicio, data_fim, version=version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag, private=True)
+
+        resultado = cached(('series', version, bucket, data_inicio, data_fim),
+                           lambda: feedback_series(conn, bucket, data_inicio, data_fim))
+        return with_etag(jsonify(resultado), etag, private=True)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/stats/periods')
+def get_periods_stats():
+    """Compara N períodos (?periodo=inicio,fim repetido), cada um face ao anterior."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    try:
+        periodos = []
+        for value in request.args.getlist('periodo'):
+            try:
+                inicio, fim = value.split(',')
+                datetime.strptime(inicio, '%Y-%m-%d')
+                datetime.strptime(fim, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({'error': f'Período inválido: {value}'}), 400
+            if inicio > fim:
+                return jsonify({'error': f'Período inválido: {value}'}), 400
+            periodos.append((inicio, fim))
+
+        if not periodos:
+            return jsonify({'error': 'Indique pelo menos um período (?periodo=inicio,fim)'}), 400
+        if len(periodos) > PERIODS_MAX:
+            return jsonify({'error': f'Máximo de {PERIODS_MAX} períodos'}), 400
+
+        conn = get_db()
+        version = feedback_version(conn)
+        etag = feedback_etag(conn, 'stats_periods', *periodos, version=version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag, private=True)
+
+        return with_etag(jsonify({'periodos': compare_periods(conn, periodos, version)}), etag, private=True)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/admin/stats/comparison')
 def get_comparison_stats():
     """Retorna comparação entre dois períodos"""
@@ -537,61 +3132,16 @@ def get_comparison_stats():
         
         conn = get_db()
         
-        # Período 1
-        stats1 = conn.execute('''
-            SELECT grau_satisfacao, COUNT(*) as total
-            FROM feedback
-            WHERE data BETWEEN ? AND ?
-            GROUP BY grau_satisfacao
-        ''', (data1_inicio, data1_fim)).fetchall()
-        
-        # Período 2
-        stats2 = conn.execute('''
-            SELECT grau_satisfacao, COUNT(*) as total
-            FROM feedback
-            WHERE data BETWEEN ? AND ?
-            GROUP BY grau_satisfacao
-        ''', (data2_inicio, data2_fim)).fetchall()
-        
-        conn.close()
+        # Períodos 1 e 2 numa só consulta (contadores diários, em cache)
+        periodo1, periodo2 = compare_periods(conn, [(data1_inicio, data1_fim), (data2_inicio, data2_fim)])
         
         # Formatar resultado
         resultado = {
-            'periodo1': {
-                'muito_satisfeito': 0,
-                'satisfeito': 0,
-                'insatisfeito': 0,
-                'total': 0
-            },
-            'periodo2': {
-                'muito_satisfeito': 0,
-                'satisfeito': 0,
-                'insatisfeito': 0,
-                'total': 0
-            }
+            'periodo1': {key: periodo1[key] for key in GRAUS_SATISFACAO + ['total']},
+            'periodo2': {key: periodo2[key] for key in GRAUS_SATISFACAO + ['total']},
+            'variacao': periodo2['variacao'],
         }
         
-        for row in stats1:
-            resultado['periodo1'][row['grau_satisfacao']] = row['total']
-            resultado['periodo1']['total'] += row['total']
-        
-        for row in stats2:
-            resultado['periodo2'][row['grau_satisfacao']] = row['total']
-            resultado['periodo2']['total'] += row['total']
-        
-        # Calcular variações percentuais
-        resultado['variacao'] = {}
-        for key in ['muito_satisfeito', 'satisfeito', 'insatisfeito']:
-            val1 = resultado['periodo1'][key]
-            val2 = resultado['periodo2'][key]
-            
-            if val1 == 0:
-                variacao = 100 if val2 > 0 else 0
-            else:
-                variacao = round(((val2 - val1) / val1) * 100, 2)
-            
-            resultado['variacao'][key] = variacao
-        
         return jsonify(resultado)
     
     except Exception as e:
@@ -616,48 +3166,50 @@ def get_historico():
         
         conn = get_db()
         
-        where = []
-        params = []
-
-        if grau in ['muito_satisfeito', 'satisfeito', 'insatisfeito']:
-            where.append('grau_satisfacao = ?')
-            params.append(grau)
-
-        if data_inicio and data_fim:
-            where.append('data BETWEEN ? AND ?')
-            params.extend([data_inicio, data_fim])
-        elif data_inicio:
-            where.append('data >= ?')
-            params.append(data_inicio)
-        elif data_fim:
-            where.append('data <= ?')
-            params.append(data_fim)
-
-        if q.isdigit():
-            where.append('id = ?')
-            params.append(int(q))
+        # Modo cursor (opt-in): ?after= (vazio na 1ª página) ou ?after=<data,hora,id>
+        cursor_mode = 'after' in request.args
+        after = None
+        if cursor_mode and request.args.get('after'):
+            try:
+                after = parse_historico_cursor(request.args['after'])
+            except ValueError:
+                return jsonify({'error': 'Cursor inválido'}), 400
 
-        where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
+        try:
+            where_sql, params = build_historico_filters(grau, data_inicio, data_fim, q, after)
+        except ValueError:
+            return jsonify({'error': 'Datas inválidas'}), 400
 
-        # Total de registros (com filtros)
-        total = conn.execute(f'SELECT COUNT(*) as total FROM feedback{where_sql}', tuple(params)).fetchone()['total']
+        # Total de registros (com filtros); opcional com ?count=0
+        with_count = request.args.get('count', '1') not in ['0', 'false', 'False']
+        total = count_historico(conn, grau, data_inicio, data_fim, q) if with_count else None
+
+        if cursor_mode:
+            # Pede mais uma linha para saber se existe página seguinte
+            sql, query_params = historico_page_query(where_sql, params, per_page + 1, after=after)
+            registros = conn.execute(sql, query_params).fetchall()
+            has_more = len(registros) > per_page
+            registros = registros[:per_page]
+            last = registros[-1] if registros else None
+
+            resultado = {
+                'total': total,
+                'per_page': per_page,
+                'total_pages': (total + per_page - 1) // per_page if total is not None else None,
+                'next_cursor': f"{last['data']},{last['hora']},{last['id']}" if has_more else None,
+                'registros': [dict(row) for row in registros]
+            }
+            return jsonify(resultado)
 
         # Registros paginados (com filtros)
-        registros = conn.execute(f'''
-            SELECT id, grau_satisfacao, data, hora, dia_semana
-            FROM feedback
-            {where_sql}
-            ORDER BY data DESC, hora DESC
-            LIMIT ? OFFSET ?
-        ''', tuple(params + [per_page, offset])).fetchall()
-        
-        conn.close()
+        sql, query_params = historico_page_query(where_sql, params, per_page, offset)
+        registros = conn.execute(sql, query_params).fetchall()
         
         resultado = {
             'total': total,
             'page': page,
             'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page,
+            'total_pages': (total + per_page - 1) // per_page if total is not None else None,
             'registros': [dict(row) for row in registros]
         }
         
@@ -674,136 +3226,124 @@ def export_csv():
         return jsonify({'error': 'Não autorizado'}), 401
     
     try:
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
+        data_inicio, data_fim = export_dates(request.args.get('data_inicio'), request.args.get('data_fim'))
         
         conn = get_db()
+        id_range = export_id_range(conn, request.args.get('since_id'))
+
+        # Ficheiro igual já gerado por um job de exportação (sem novos registos)
+        cached_path = export_cache_path(conn, 'xlsx', data_inicio, data_fim)
+        if id_range is None and os.path.exists(cached_path):
+            return send_file(
+                cached_path,
+                mimetype=EXPORT_FORMATS['xlsx'][0],
+                as_attachment=True,
+                download_name=f'feedback_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+            )
         
-        if data_inicio and data_fim:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                WHERE data BETWEEN ? AND ?
-                ORDER BY data, hora
-            ''', (data_inicio, data_fim)).fetchall()
-        else:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                ORDER BY data, hora
-            ''').fetchall()
-        
-        conn.close()
-        
-        # Criar workbook Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Feedback"
-        
-        # Cabeçalho com formatação
-        header = ['ID', 'Grau de Satisfação', 'Data', 'Hora', 'Dia da Semana']
-        ws.append(header)
-        
-        # Formatar cabeçalho
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-        
-        # Adicionar dados
-        grau_map = {
-            'muito_satisfeito': 'Muito Satisfeito',
-            'satisfeito': 'Satisfeito',
-            'insatisfeito': 'Insatisfeito'
-        }
-        
-        for row in registros:
-            ws.append([
-                row['id'],
-                grau_map.get(row['grau_satisfacao'], row['grau_satisfacao']),
-                row['data'],
-                row['hora'],
-                row['dia_semana']
-            ])
-        
-        # Ajustar largura das colunas
-        ws.column_dimensions['A'].width = 8
-        ws.column_dimensions['B'].width = 20
-        ws.column_dimensions['C'].width = 12
-        ws.column_dimensions['D'].width = 12
-        ws.column_dimensions['E'].width = 18
-        
-        # Salvar em memória
-        output = io.BytesIO()
-        wb.save(output)
+        # Gerar para um ficheiro temporário (em disco) em vez de um BytesIO
+        output = tempfile.TemporaryFile()
+        try:
+            write_xlsx_export(output, conn, data_inicio, data_fim, id_range=id_range)
+        except Exception:
+            output.close()
+            raise
         output.seek(0)
         
-        return send_file(
+        return with_next_since_id(send_file(
             output,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
             download_name=f'feedback_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        )
+        ), id_range, conn)
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/admin/export/csv-plain')
 def export_csv_plain():
-    """Exporta dados em CSV (texto). Mantém o /export/csv antigo como Excel."""
+    """Exporta dados em CSV (texto). Mantém o /export/csv antigo como Excel.
+
+    Com ?since_id=N só exporta os registos com id > N; o cabeçalho
+    X-Next-Since-Id traz o valor a usar no pedido seguinte.
+    """
     if not session.get('admin_logged_in'):
         return jsonify({'error': 'Não autorizado'}), 401
 
     try:
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
+        data_inicio, data_fim = export_dates(request.args.get('data_inicio'), request.args.get('data_fim'))
 
         conn = get_db()
-        if data_inicio and data_fim:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                WHERE data BETWEEN ? AND ?
-                ORDER BY data, hora
-            ''', (data_inicio, data_fim)).fetchall()
-        else:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                ORDER BY data, hora
-            ''').fetchall()
-        conn.close()
+        id_range = export_id_range(conn, request.args.get('since_id'))
+        return with_next_since_id(streaming_download(
+            generate_csv_export(conn, data_inicio, data_fim, id_range=id_range),
+            'text/csv; charset=utf-8',
+            'csv'
+        ), id_range, conn)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        grau_map = {
-            'muito_satisfeito': 'Muito Satisfeito',
-            'satisfeito': 'Satisfeito',
-            'insatisfeito': 'Insatisfeito'
-        }
 
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['id', 'grau_satisfacao', 'data', 'hora', 'dia_semana'])
-        for row in registros:
-            writer.writerow([
-                row['id'],
-                grau_map.get(row['grau_satisfacao'], row['grau_satisfacao']),
-                row['data'],
-                row['hora'],
-                row['dia_semana'],
-            ])
+@app.route('/api/admin/exports', methods=['POST'])
+def admin_create_export():
+    """Cria um job de exportação em background: {"format": "csv|xlsx|txt", "data_inicio", "data_fim"}."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    try:
+        data = request.get_json(silent=True) or {}
+        job = create_export_job(get_db(), data.get('format'), data.get('data_inicio'), data.get('data_fim'))
+        response = jsonify(job)
+        response.status_code = 200 if job['status'] == 'done' else 202
+        response.headers['Location'] = f"/api/admin/exports/{job['id']}"
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/admin/exports/<job_id>')
+def admin_export_status(job_id):
+    """Estado/progresso de um job de exportação."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    job = get_export_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Exportação não encontrada'}), 404
+    return jsonify(export_job_payload(job))
+
+
+@app.route('/api/admin/exports/<job_id>/download')
+def admin_export_download(job_id):
+    """Descarrega o ficheiro de um job concluído (suporta Range e If-None-Match)."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
 
-        csv_bytes = output.getvalue().encode('utf-8')
+    job = get_export_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Exportação não encontrada'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': 'Exportação ainda não concluída', 'status': job['status']}), 409
+
+    try:
+        suffix = f"_{job['dataInicio']}_{job['dataFim']}" if job['dataInicio'] else ''
         return send_file(
-            io.BytesIO(csv_bytes),
-            mimetype='text/csv; charset=utf-8',
+            job['path'],
+            mimetype=EXPORT_FORMATS[job['format']][0],
             as_attachment=True,
-            download_name=f'feedback_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+            download_name=f"feedback_export{suffix}.{job['format']}",
+            conditional=True,
+            max_age=0,
         )
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    except FileNotFoundError:
+        return jsonify({'error': 'Ficheiro expirou da cache; crie uma nova exportação'}), 410
 
 
 @app.route('/api/admin/system')
@@ -814,36 +3354,100 @@ def admin_system():
 
     try:
         conn = get_db()
-        total = conn.execute('SELECT COUNT(*) as total FROM feedback').fetchone()['total']
+        db_size = database_size()
+        firestore_available = bool(get_firebase_db())
+
+        # `time` e `cache` são informativos: não mudam o ETag
+        etag = feedback_etag(conn, 'system', DATABASE, db_size, _firebase_app_ready, firestore_available,
+                             session.get('admin_email'))
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag, private=True)
+
+        total = conn.execute('SELECT COALESCE(SUM(total), 0) as total FROM feedback_daily_counts').fetchone()['total']
         last_id_row = conn.execute('SELECT MAX(id) as last_id FROM feedback').fetchone()
         last_id = last_id_row['last_id'] if last_id_row else None
-        conn.close()
 
-        db_size = None
-        try:
-            if os.path.exists(DATABASE):
-                db_size = os.path.getsize(DATABASE)
-        except Exception:
-            db_size = None
+        payload = system_payload(total, last_id, db_size, firestore_available)
+        return with_etag(jsonify(payload), etag, private=True)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        return jsonify({
-            'time': datetime.now().isoformat(),
-            'python': sys.version.split(' ')[0],
-            'total': total,
-            'lastId': last_id,
-            'db': {
-                'path': DATABASE,
-                'sizeBytes': db_size,
-            },
-            'firebase': {
-                'initialized': bool(firebase_admin._apps),
-                'firestoreAvailable': bool(firebase_db),
-                'projectId': FIREBASE_WEB_CONFIG.get('projectId') or None,
-            },
-            'admin': {
-                'email': session.get('admin_email'),
-            }
-        })
+@app.route('/api/admin/dashboard')
+def admin_dashboard_snapshot():
+    """Estatísticas gerais + do dia + sistema numa só resposta (modo TV e dashboard)."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    try:
+        conn = get_db()
+        hoje = datetime.now().strftime('%Y-%m-%d')
+        db_size = database_size()
+        firestore_available = bool(get_firebase_db())
+
+        version = feedback_version(conn)
+        etag = feedback_etag(conn, 'dashboard', hoje, DATABASE, db_size, _firebase_app_ready,
+                             firestore_available, session.get('admin_email'), version=version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag, private=True)
+
+        counts = cached(('dashboard', version, hoje), lambda: dashboard_counts(conn, hoje))
+        stats = stats_payload(counts['totals'])
+
+        return with_etag(jsonify({
+            'date': hoje,
+            'stats': stats,
+            'daily': counts['today'],
+            'system': system_payload(stats['total'], counts['lastId'], db_size, firestore_available),
+            'liveStream': LIVE_STREAM_ENABLED,
+        }), etag, private=True)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/sync/status')
+def admin_sync_status():
+    """Estado da sincronização SQLite -> Firestore (requer admin)."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    try:
+        return jsonify(get_sync_status(get_db()))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/metrics')
+def admin_metrics():
+    """Latência por rota, consultas SQLite e chamadas ao Firestore (JSON ou ?format=prometheus)."""
+    authorization = request.headers.get('Authorization', '')
+    # Comparação em tempo constante (bytes: o cabeçalho pode trazer caracteres não ASCII)
+    token_ok = METRICS_TOKEN is not None and hmac.compare_digest(
+        authorization.encode('utf-8'), f'Bearer {METRICS_TOKEN}'.encode('utf-8'))
+    if not session.get('admin_logged_in') and not token_ok:
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    try:
+        output = request.args.get('format')
+        if output is None:
+            # O Prometheus pede text/plain (ou openmetrics); browsers e fetch() recebem JSON
+            accept = request.headers.get('Accept', '')
+            output = 'prometheus' if 'text/plain' in accept and 'application/json' not in accept else 'json'
+        if output == 'prometheus':
+            return Response(metrics_prometheus(), mimetype='text/plain; version=0.0.4')
+        return jsonify(metrics_payload())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/sync/reconcile', methods=['POST'])
+def admin_sync_reconcile():
+    """Reconciliação Firestore -> SQLite a pedido; {"full": true} relê toda a coleção (requer admin)."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    try:
+        client = get_firebase_db()
+        if client is None:
+            return jsonify({'error': 'Firestore não está disponível'}), 503
+        data = request.get_json(silent=True) or {}
+        return jsonify(reconcile_feedback(get_db(), client, full=bool(data.get('full'))))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -854,59 +3458,18 @@ def export_txt():
         return jsonify({'error': 'Não autorizado'}), 401
     
     try:
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
+        data_inicio, data_fim = export_dates(request.args.get('data_inicio'), request.args.get('data_fim'))
         
         conn = get_db()
-        
-        if data_inicio and data_fim:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                WHERE data BETWEEN ? AND ?
-                ORDER BY data, hora
-            ''', (data_inicio, data_fim)).fetchall()
-        else:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                ORDER BY data, hora
-            ''').fetchall()
-        
-        conn.close()
-        
-        # Criar TXT em memória
-        output = io.StringIO()
-        output.write('=' * 80 + '\n')
-        output.write('RELATÓRIO DE FEEDBACK DE SATISFAÇÃO\n')
-        output.write('=' * 80 + '\n\n')
-        
-        grau_map = {
-            'muito_satisfeito': 'Muito Satisfeito',
-            'satisfeito': 'Satisfeito',
-            'insatisfeito': 'Insatisfeito'
-        }
-        
-        for row in registros:
-            output.write(f"ID: {row['id']}\n")
-            output.write(f"Grau de Satisfação: {grau_map.get(row['grau_satisfacao'], row['grau_satisfacao'])}\n")
-            output.write(f"Data: {row['data']}\n")
-            output.write(f"Hora: {row['hora']}\n")
-            output.write(f"Dia da Semana: {row['dia_semana']}\n")
-            output.write('-' * 80 + '\n\n')
-        
-        output.write(f"\nTotal de registros: {len(registros)}\n")
-        output.write(f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
-        
-        # Preparar arquivo para download
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name=f'feedback_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
-        )
+        id_range = export_id_range(conn, request.args.get('since_id'))
+        return with_next_since_id(streaming_download(
+            generate_txt_export(conn, data_inicio, data_fim, id_range=id_range),
+            'text/plain; charset=utf-8',
+            'txt'
+        ), id_range, conn)
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -918,14 +3481,19 @@ def get_available_dates():
     
     try:
         conn = get_db()
+        etag = feedback_etag(conn, 'dates')
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag, private=True)
+
         dates = conn.execute('''
-            SELECT DISTINCT data
-            FROM feedback
+            SELECT data
+            FROM feedback_daily_counts
+            GROUP BY data
+            HAVING SUM(total) > 0
             ORDER BY data DESC
         ''').fetchall()
-        conn.close()
         
-        return jsonify([row['data'] for row in dates])
+        return with_etag(jsonify([row['data'] for row in dates]), etag, private=True)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ligação SQLite por pedido (antigo) vs ligação reutilizada por thread + WAL.
+
+Uso:
+    python3 benchmarks/bench_db.py [--requests 2000] [--threads 8] [--rows 10000]
+
+Cada modo usa uma base de dados temporária própria; o Firebase não é usado.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import g, has_app_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as feedback_app  # noqa: E402
+
+GRAUS = ['muito_satisfeito', 'satisfeito', 'insatisfeito']
+
+
+def legacy_get_db():
+    """Comportamento antigo: uma ligação nova (journal por omissão) por chamada.
+
+    Como no código antigo, cada ligação é fechada no fim do pedido (ver
+    close_legacy_connections); fora de um pedido fica em _legacy_loose até ao
+    fim do modo.
+    """
+    conn = sqlite3.connect(feedback_app.DATABASE)
+    conn.row_factory = sqlite3.Row
+    if has_app_context():
+        g.setdefault('legacy_connections', []).append(conn)
+    else:
+        _legacy_loose.append(conn)
+    return conn
+
+
+_legacy_loose = []
+
+
+@feedback_app.app.teardown_appcontext
+def close_legacy_connections(exc):
+    for conn in g.pop('legacy_connections', []):
+        conn.close()
+
+
+def seed(path, rows):
+    """Cria a tabela e insere `rows` feedbacks sintéticos."""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            grau_satisfacao TEXT NOT NULL,
+            data TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            dia_semana TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    start = datetime.now() - timedelta(days=365)
+    batch = []
+    for i in range(rows):
+        ts = start + timedelta(seconds=i * 30)
+        batch.append((GRAUS[i % 3], ts.strftime('%Y-%m-%d'), ts.strftime('%H:%M:%S'), 'Segunda-feira'))
+    conn.executemany(
+        'INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)',
+        batch
+    )
+    conn.commit()
+    conn.close()
+
+
+def run_mode(name, get_db_impl, args):
+    """Executa a carga mista (POST feedback + GET summary) e devolve pedidos/s."""
+    tmpdir = tempfile.mkdtemp(prefix='bench_db_')
+    path = os.path.join(tmpdir, 'feedback.db')
+    seed(path, args.rows)
+
+    original_db, original_get_db = feedback_app.DATABASE, feedback_app.get_db
+    feedback_app.DATABASE = path
+    feedback_app.get_db = get_db_impl
+    feedback_app.init_db()
+
+    def worker(n):
+        client = feedback_app.app.test_client()
+        for i in range(n):
+            if i % 2 == 0:
+                resp = client.post('/api/feedback', json={'grau_satisfacao': GRAUS[i % 3]})
+            else:
+                resp = client.get('/api/public/summary')
+            assert resp.status_code == 200, resp.get_data(as_text=True)
+
+    per_thread = args.requests // args.threads
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(worker, [per_thread] * args.threads))
+        elapsed = time.perf_counter() - started
+    finally:
+        feedback_app.DATABASE = original_db
+        feedback_app.get_db = original_get_db
+        while _legacy_loose:
+            _legacy_loose.pop().close()
+
+    total = per_thread * args.threads
+    rps = total / elapsed
+    print(f"{name:<28} {total:>7} pedidos  {elapsed:7.2f}s  {rps:9.1f} req/s")
+    return rps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    # O Firestore não deve entrar na medição
+    feedback_app.use_firebase_client(None)
+
+    print("=" * 60)
+    print(f"BENCHMARK SQLite ({args.rows} linhas, {args.threads} threads)")
+    print("=" * 60)
+    before = run_mode('Antes (ligação por pedido)', legacy_get_db, args)
+    after = run_mode('Depois (pool por thread+WAL)', feedback_app.get_db, args)
+    print(f"\nMelhoria: {after / before:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
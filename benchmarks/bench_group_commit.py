@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: POST /api/feedback com um commit por pedido vs group commit.
+
+Simula um pico de toques (N threads a enviar feedback em simultâneo) e mede
+toques/s e latência em cada modo, para cada valor de PRAGMA synchronous
+(com FULL cada commit faz fsync, que é o que o group commit amortiza).
+
+Uso:
+    python3 benchmarks/bench_group_commit.py [--taps 4000] [--threads 32] [--synchronous NORMAL FULL]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='bench_group_commit_'), 'import.db'))
+
+import app as feedback_app  # noqa: E402
+
+
+def run_mode(group_commit, synchronous, args):
+    """Corre `taps` POSTs em `threads` threads numa base nova; devolve (toques/s, p50 ms, p99 ms)."""
+    tmpdir = tempfile.mkdtemp(prefix='bench_group_commit_')
+    feedback_app.close_db_connection()
+    feedback_app.DATABASE = os.path.join(tmpdir, 'feedback.db')
+    feedback_app.SQLITE_PRAGMAS['synchronous'] = synchronous
+    feedback_app.FEEDBACK_GROUP_COMMIT = group_commit
+    feedback_app.init_db()
+
+    per_thread = args.taps // args.threads
+    latencies = []
+
+    def worker(_):
+        client = feedback_app.app.test_client()
+        local = []
+        for i in range(per_thread):
+            started = time.perf_counter()
+            resp = client.post('/api/feedback', json={'grau_satisfacao': feedback_app.GRAUS_SATISFACAO[i % 3]})
+            local.append(time.perf_counter() - started)
+            assert resp.status_code == 200, resp.get_data(as_text=True)
+        latencies.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(worker, range(args.threads)))
+    elapsed = time.perf_counter() - started
+
+    total = feedback_app.get_db().execute('SELECT COUNT(*) FROM feedback_compact').fetchone()[0]
+    assert total == per_thread * args.threads, total
+    latencies.sort()
+    return (
+        total / elapsed,
+        statistics.median(latencies) * 1000,
+        latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--taps', type=int, default=4000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--synchronous', nargs='+', default=['NORMAL', 'FULL'])
+    args = parser.parse_args()
+
+    # O Firestore não entra na medição
+    feedback_app.use_firebase_client(None)
+
+    print("=" * 72)
+    print(f"BENCHMARK GROUP COMMIT ({args.taps} toques, {args.threads} threads)")
+    print("=" * 72)
+    print(f"{'synchronous':<12} {'modo':<22} {'toques/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for synchronous in args.synchronous:
+        before = feedback_app.get_group_commit_stats()
+        results = {}
+        for name, group_commit in [('commit por pedido', False), ('group commit', True)]:
+            rps, p50, p99 = run_mode(group_commit, synchronous, args)
+            results[name] = rps
+            print(f"{synchronous:<12} {name:<22} {rps:>10.1f} {p50:>9.2f} {p99:>9.2f}")
+        stats = feedback_app.get_group_commit_stats()
+        commits = stats['commits'] - before['commits']
+        rows = stats['rows'] - before['rows']
+        print(f"{'':<12} {'':<22} {results['group commit'] / results['commit por pedido']:>9.2f}x "
+              f"({commits} commits, média {rows / max(commits, 1):.1f} linhas/commit)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tempo de arranque a frio de api/index.py (entrada do Vercel).
+
+Usa `python -X importtime` para medir o tempo cumulativo de importação de
+api.index e lista os módulos mais pesados. Com --compare REV mede também a
+versão de app.py/api/index.py num commit anterior (ex.: HEAD~1).
+
+Uso:
+    python3 benchmarks/bench_startup.py [--runs 5] [--compare HEAD~1]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(tree, runs):
+    """Corre `import api.index` em processos novos; devolve (mediana µs, top módulos)."""
+    totals = []
+    modules = {}
+    env = dict(os.environ, DATABASE_PATH=os.path.join(tempfile.mkdtemp(prefix='bench_startup_'), 'feedback.db'))
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import api.index'],
+            cwd=tree, env=env, capture_output=True, text=True, check=True
+        )
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            parts = [p.strip() for p in line[len('import time:'):].split('|')]
+            if not parts[1].isdigit():
+                continue
+            name = parts[2]
+            cumulative = int(parts[1])
+            if name.strip() == 'api.index':
+                totals.append(cumulative)
+            # Apenas pacotes de topo (sem indentação)
+            if not name.startswith(' '):
+                modules.setdefault(name, []).append(cumulative)
+
+    top = sorted(((statistics.median(v), k) for k, v in modules.items()), reverse=True)[:10]
+    return statistics.median(totals), top
+
+
+def export_tree(rev):
+    """Copia app.py e api/index.py de um commit para uma pasta temporária."""
+    tree = tempfile.mkdtemp(prefix='bench_startup_rev_')
+    os.makedirs(os.path.join(tree, 'api'))
+    for path in ['app.py', 'api/index.py']:
+        content = subprocess.run(['git', 'show', f'{rev}:{path}'], cwd=ROOT, capture_output=True, check=True).stdout
+        with open(os.path.join(tree, path), 'wb') as f:
+            f.write(content)
+    shutil.copytree(os.path.join(ROOT, 'templates'), os.path.join(tree, 'templates'))
+    return tree
+
+
+def report(label, tree, runs):
+    total, top = import_times(tree, runs)
+    print(f"\n{label}: import api.index = {total / 1000:.1f} ms (mediana de {runs})")
+    for cumulative, name in top:
+        print(f"    {cumulative / 1000:8.1f} ms  {name}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--compare', metavar='REV', help='commit a comparar (ex.: HEAD~1)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BENCHMARK ARRANQUE (python -X importtime)")
+    print("=" * 60)
+
+    after = report('Atual', ROOT, args.runs)
+    if args.compare:
+        tree = export_tree(args.compare)
+        try:
+            before = report(args.compare, tree, args.runs)
+        finally:
+            shutil.rmtree(tree, ignore_errors=True)
+        print(f"\nMelhoria: {before / after:.2f}x ({(before - after) / 1000:.1f} ms a menos)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark: esquema v5 (feedback com colunas de texto) vs v6 (feedback_compact + view).
+
+Cria uma base v5 com `rows` feedbacks sintéticos, copia-a e aplica a migração v6,
+faz VACUUM às duas e compara o tamanho do ficheiro e o tempo das leituras mais
+pesadas: exportação completa, uma página do histórico e a série por hora.
+
+Uso:
+    python3 benchmarks/bench_storage.py [--rows 1000000] [--repeat 3]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as feedback_app  # noqa: E402
+
+START = datetime(2020, 1, 1)
+
+
+def connect(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def apply_migrations(conn, up_to):
+    for number, migrate in feedback_app.MIGRATIONS:
+        if feedback_app.get_schema_version(conn) < number <= up_to:
+            conn.execute('BEGIN')
+            migrate(conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.execute('COMMIT')
+
+
+def seed_v5(path, rows):
+    """Base no esquema v5 com `rows` feedbacks (um a cada 30 s)."""
+    conn = connect(path)
+    apply_migrations(conn, 5)
+
+    def gen():
+        for i in range(rows):
+            when = START + timedelta(seconds=i * 30)
+            yield (feedback_app.GRAUS_SATISFACAO[i % 3], when.strftime('%Y-%m-%d'), when.strftime('%H:%M:%S'),
+                   feedback_app.DIAS_SEMANA[when.weekday()])
+
+    conn.execute('BEGIN')
+    conn.executemany('INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)', gen())
+    conn.execute('COMMIT')
+    conn.close()
+    return START + timedelta(seconds=(rows - 1) * 30)
+
+
+def file_size(conn):
+    conn.execute('VACUUM')
+    return conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+
+
+def timed(conn, sql, params, repeat):
+    """Mediana (ms) de `repeat` execuções, lendo todas as linhas."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _row in conn.execute(sql, params):
+            pass
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def queries_v5(end):
+    """Consultas equivalentes às atuais, escritas sobre as colunas de texto da v5."""
+    dia = (end - timedelta(days=30)).strftime('%Y-%m-%d')
+    fim = end.strftime('%Y-%m-%d')
+    inicio = (end - timedelta(days=7)).strftime('%Y-%m-%d')
+    return {
+        'exportação completa': ('SELECT id, grau_satisfacao, data, hora, dia_semana FROM feedback '
+                                'ORDER BY data, hora', ()),
+        'histórico (cursor)': ('SELECT id, grau_satisfacao, data, hora, dia_semana FROM feedback '
+                               'WHERE (data, hora, id) < (?, ?, ?) ORDER BY data DESC, hora DESC, id DESC LIMIT 50',
+                               (dia, '12:00:00', 1 << 62)),
+        'série por hora (7 dias)': ("SELECT data || ' ' || substr(hora, 1, 2) || ':00' AS bucket, grau_satisfacao, "
+                                    'COUNT(*) FROM feedback WHERE data BETWEEN ? AND ? '
+                                    'GROUP BY bucket, grau_satisfacao', (inicio, fim)),
+    }
+
+
+def queries_v6(end):
+    """As mesmas leituras com as funções de app.py (colunas ts/grau)."""
+    dia = (end - timedelta(days=30)).strftime('%Y-%m-%d')
+    inicio = (end - timedelta(days=7)).strftime('%Y-%m-%d')
+    fim = end.strftime('%Y-%m-%d')
+    after = feedback_app.parse_historico_cursor(f'{dia},12:00:00,{1 << 62}')
+    where_sql, params = feedback_app.build_historico_filters('', '', '', '', after)
+    table, expression, aggregate = feedback_app.SERIES_BUCKETS['hour']
+    return {
+        'exportação completa': feedback_app.export_query(),
+        'histórico (cursor)': feedback_app.historico_page_query(where_sql, params, 50, after=after),
+        'série por hora (7 dias)': (f'SELECT {expression} AS bucket, grau_satisfacao, {aggregate} FROM {table} '
+                                    'WHERE ts >= ? AND ts < ? GROUP BY bucket, grau_satisfacao',
+                                    (feedback_app.date_ts(inicio),
+                                     feedback_app.date_ts(fim) + feedback_app.DAY_SECONDS)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print(f"BENCHMARK ARMAZENAMENTO ({args.rows} linhas)")
+    print("=" * 72)
+    with tempfile.TemporaryDirectory(prefix='bench_storage_') as tmpdir:
+        v5_path = os.path.join(tmpdir, 'v5.db')
+        v6_path = os.path.join(tmpdir, 'v6.db')
+        end = seed_v5(v5_path, args.rows)
+        shutil.copyfile(v5_path, v6_path)
+
+        v6 = connect(v6_path)
+        started = time.perf_counter()
+        apply_migrations(v6, 6)
+        print(f"Migração v6: {time.perf_counter() - started:.2f} s")
+
+        v5 = connect(v5_path)
+        size_v5, size_v6 = file_size(v5), file_size(v6)
+        print(f"\n{'':<26} {'v5':>12} {'v6':>12} {'ganho':>8}")
+        print(f"{'tamanho (MB)':<26} {size_v5 / 1e6:>12.1f} {size_v6 / 1e6:>12.1f} {size_v5 / size_v6:>7.2f}x")
+
+        old, new = queries_v5(end), queries_v6(end)
+        for name in old:
+            t5 = timed(v5, *old[name], args.repeat)
+            t6 = timed(v6, *new[name], args.repeat)
+            print(f"{name + ' (ms)':<26} {t5:>12.1f} {t6:>12.1f} {t5 / t6:>7.2f}x")
+        v5.close()
+        v6.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: verificação de Firebase ID tokens (login admin), a frio e a quente.
+
+Gera um par de chaves RSA local e serve o certificado num servidor HTTP local
+(com Cache-Control: max-age e um atraso simulado de rede), por isso corre
+offline. Compara:
+
+- google-auth (o que auth.verify_id_token faz): pede e converte os
+  certificados em cada chamada; com cachecontrol (firebase_admin) o pedido
+  HTTP é evitado, mas o PEM continua a ser convertido em cada chamada;
+- verify_firebase_id_token a frio (instância nova: sem memória nem sync_state);
+- verify_firebase_id_token noutro worker da mesma base (certificados em sync_state);
+- verify_firebase_id_token a quente (chaves já convertidas em memória).
+
+Uso:
+    python3 benchmarks/bench_token_verify.py [--iterations 200] [--fetch-delay-ms 50]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='bench_token_'), 'feedback.db'))
+
+import app as feedback_app  # noqa: E402
+
+
+def make_signer():
+    """(PEM do certificado, função que assina um token válido)."""
+    import jwt
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'bench')])
+    now = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(now).not_valid_after(now + timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    project = feedback_app.FIREBASE_WEB_CONFIG['projectId']
+
+    def sign():
+        issued = int(time.time())
+        return jwt.encode({'iss': feedback_app.FIREBASE_TOKEN_ISSUER + project, 'aud': project, 'sub': 'bench',
+                           'iat': issued, 'exp': issued + 3600, 'auth_time': issued, 'email': 'a@b.pt'},
+                          key, algorithm='RS256', headers={'kid': 'k1'})
+
+    return cert.public_bytes(serialization.Encoding.PEM).decode('ascii'), sign
+
+
+def serve_certs(pem, delay):
+    body = json.dumps({'k1': pem}).encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Cache-Control', 'public, max-age=3600')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/certs'
+
+
+def measure(func, iterations, before=None):
+    samples = []
+    for _ in range(iterations):
+        if before:
+            before()
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def forget_everything():
+    """Simula uma instância nova: sem chaves em memória nem na base."""
+    feedback_app.reset_firebase_token_cache()
+    conn = feedback_app.get_db()
+    with conn:
+        conn.execute("DELETE FROM sync_state WHERE name = 'firebase_certs'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--fetch-delay-ms', type=float, default=50, help='latência simulada do GET dos certificados')
+    args = parser.parse_args()
+
+    import google.auth.transport.requests
+    import google.oauth2.id_token
+    from firebase_admin._token_gen import CertificateFetchRequest
+
+    feedback_app.init_db()
+    pem, sign = make_signer()
+    server, url = serve_certs(pem, args.fetch_delay_ms / 1000)
+    feedback_app.FIREBASE_CERTS_URL = url
+    token = sign()
+    project = feedback_app.FIREBASE_WEB_CONFIG['projectId']
+
+    plain_request = google.auth.transport.requests.Request()
+    cached_request = CertificateFetchRequest()
+
+    cases = [
+        ('google-auth (sem cache)', lambda: google.oauth2.id_token.verify_token(
+            token, plain_request, audience=project, certs_url=url), None),
+        ('google-auth + cachecontrol', lambda: google.oauth2.id_token.verify_token(
+            token, cached_request, audience=project, certs_url=url), None),
+        ('cache local, a frio', lambda: feedback_app.verify_firebase_id_token(token), forget_everything),
+        ('cache local, via sync_state', lambda: feedback_app.verify_firebase_id_token(token),
+         feedback_app.reset_firebase_token_cache),
+        ('cache local, a quente', lambda: feedback_app.verify_firebase_id_token(token), None),
+    ]
+
+    print("=" * 72)
+    print(f"BENCHMARK VERIFICAÇÃO DE ID TOKENS ({args.iterations} iterações, GET +{args.fetch_delay_ms:.0f} ms)")
+    print("=" * 72)
+    print(f"{'caso':<30} {'p50 ms':>10} {'p99 ms':>10}")
+    with feedback_app.app.app_context():
+        for name, func, before in cases:
+            func()  # aquece (ligações HTTP, imports, cache)
+            p50, p99 = measure(func, args.iterations, before)
+            print(f"{name:<30} {p50:>10.3f} {p99:>10.3f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark: exportação Excel com Workbook normal (antigo) vs modo write-only.
+
+Mede o tempo e o pico de memória (RSS) de cada modo num processo separado.
+
+Uso:
+    python3 benchmarks/bench_xlsx.py [--rows 100000 1000000]
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+GRAUS = ['muito_satisfeito', 'satisfeito', 'insatisfeito']
+
+
+def seed(path, rows):
+    """Cria uma base de dados com `rows` feedbacks sintéticos."""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            grau_satisfacao TEXT NOT NULL,
+            data TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            dia_semana TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    start = datetime(2020, 1, 1)
+
+    def gen():
+        for i in range(rows):
+            ts = start + timedelta(seconds=i * 30)
+            yield GRAUS[i % 3], ts.strftime('%Y-%m-%d'), ts.strftime('%H:%M:%S'), 'Segunda-feira'
+
+    conn.executemany('INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)', gen())
+    conn.commit()
+    conn.close()
+
+
+def legacy_export(conn):
+    """Implementação antiga: fetchall + Workbook normal + BytesIO."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill
+
+    import app as feedback_app
+    sql, params = feedback_app.export_query()
+    registros = conn.execute(sql, params).fetchall()
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Feedback"
+    ws.append(['ID', 'Grau de Satisfação', 'Data', 'Hora', 'Dia da Semana'])
+    for cell in ws[1]:
+        cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+        cell.font = Font(bold=True, color="FFFFFF")
+    for row in registros:
+        ws.append([row['id'], row['grau_satisfacao'], row['data'], row['hora'], row['dia_semana']])
+    output = io.BytesIO()
+    wb.save(output)
+    return output.tell()
+
+
+def streaming_export(conn):
+    """Implementação atual (app.write_xlsx_export) para um ficheiro temporário."""
+    import app as feedback_app
+    with tempfile.TemporaryFile() as output:
+        feedback_app.write_xlsx_export(output, conn)
+        return output.tell()
+
+
+def child(mode, path):
+    """Executado no subprocesso: corre um modo e imprime o resultado em JSON."""
+    import app as feedback_app  # noqa: F401  (mesmas importações nos dois modos)
+
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    size = legacy_export(conn) if mode == 'legacy' else streaming_export(conn)
+    elapsed = time.perf_counter() - started
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'mode': mode,
+        'seconds': round(elapsed, 3),
+        'peakRssMB': round(peak_rss / 1024, 1),
+        'deltaRssMB': round((peak_rss - base_rss) / 1024, 1),
+        'fileBytes': size,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'DB'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    print("=" * 72)
+    print("BENCHMARK EXPORTAÇÃO XLSX")
+    print("=" * 72)
+    print(f"{'linhas':>9}  {'modo':<10} {'tempo (s)':>10} {'pico RSS (MB)':>14} {'Δ RSS (MB)':>11}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory(prefix='bench_xlsx_') as tmpdir:
+            path = os.path.join(tmpdir, 'feedback.db')
+            seed(path, rows)
+            env = dict(os.environ, DATABASE_PATH=path)
+            for mode in ['legacy', 'write_only']:
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--child', mode, path],
+                    capture_output=True, text=True, env=env, check=True
+                ).stdout.strip().splitlines()[-1]
+                r = json.loads(out)
+                print(f"{rows:>9}  {mode:<10} {r['seconds']:>10.2f} {r['peakRssMB']:>14.1f} {r['deltaRssMB']:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
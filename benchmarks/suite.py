@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Benchmark: suite de carga reprodutível para a aplicação Flask.
+
+Para cada tamanho em --rows cria uma base SQLite temporária com feedbacks
+sintéticos (último ano) e mede cada cenário com N threads: escrita
+(/api/feedback e /api/feedback/batch), resumo público, endpoints de
+estatísticas, histórico em páginas profundas (OFFSET e cursor) e as três
+exportações. O Firestore é substituído por um stub local (as escritas passam
+pelo outbox e pelo worker como em produção, sem rede).
+
+Os pedidos vão para o test client do Flask ou, com --server, para um servidor
+WSGI local (werkzeug, multi-thread) por HTTP. O resultado (pedidos/s,
+latência p50/p95/p99, pico de memória) é impresso e, com --output, gravado em
+JSON para comparar commits (--compare).
+
+Uso:
+    python3 benchmarks/suite.py [--rows 10000 1000000 10000000] [--requests 400] [--threads 8]
+                                [--server] [--scenarios summary historico_cursor]
+                                [--output resultados.json] [--compare base.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Base temporária antes de importar a app (o import aplica as migrações)
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='bench_suite_'), 'import.db'))
+
+import app as feedback_app  # noqa: E402
+
+GRAUS = feedback_app.GRAUS_SATISFACAO
+
+
+# Stub do Firestore
+# Implementa o que a app usa: batch().set()/commit() (outbox) e as consultas
+# paginadas da reconciliação (que aqui devolvem sempre zero documentos).
+class StubQuery:
+    def where(self, *args, **kwargs):
+        return self
+
+    def order_by(self, *args, **kwargs):
+        return self
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args, **kwargs):
+        return self
+
+    def start_after(self, *args, **kwargs):
+        return self
+
+    def stream(self):
+        return iter(())
+
+    def document(self, doc_id):
+        return doc_id
+
+
+class StubBatch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = 0
+
+    def set(self, ref, payload):
+        self.writes += 1
+
+    def commit(self):
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        with self.client.lock:
+            self.client.commits += 1
+            self.client.writes += self.writes
+
+
+class StubFirestore:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.commits = 0
+        self.writes = 0
+
+    def collection(self, name):
+        return StubQuery()
+
+    def batch(self):
+        return StubBatch(self)
+
+
+def seed(path, rows):
+    """Cria a base (migrações da app) com `rows` feedbacks espalhados pelo último ano."""
+    feedback_app.close_db_connection()
+    feedback_app.DATABASE = path
+    feedback_app.init_db()
+    conn = feedback_app.get_db()
+    end = feedback_app.feedback_ts(datetime.now())
+    step = max(1, (365 * feedback_app.DAY_SECONDS) // max(rows, 1))
+    start = end - step * rows
+    with conn:
+        conn.execute('''
+            WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i < ? - 1)
+            INSERT INTO feedback_compact (ts, grau) SELECT ? + i * ?, i % 3 FROM seq
+        ''', (rows, start, step))
+    feedback_app.invalidate_cache()
+    return conn
+
+
+def deep_cursor(conn):
+    """Cursor perto do fim do histórico (página profunda em modo keyset)."""
+    row = conn.execute('SELECT data, hora, id FROM feedback ORDER BY ts, id LIMIT 1 OFFSET 100').fetchone()
+    return f"{row['data']},{row['hora']},{row['id']}" if row else ''
+
+
+def scenarios(rows, conn, args):
+    """Cenários: nome -> (nº de pedidos, função i -> (método, caminho, corpo JSON))."""
+    hoje = datetime.now().strftime('%Y-%m-%d')
+    inicio = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    deep_page = max(1, rows // 50 - 1)
+    cursor = deep_cursor(conn)
+    n, exports = args.requests, args.export_requests
+    batch = [{'grau_satisfacao': GRAUS[i % 3]} for i in range(100)]
+    periodos = '&'.join(f'periodo={(datetime.now() - timedelta(days=7 * (k + 1))).strftime("%Y-%m-%d")},'
+                        f'{(datetime.now() - timedelta(days=7 * k + 1)).strftime("%Y-%m-%d")}' for k in range(8))
+    return {
+        'feedback_post': (n, lambda i: ('POST', '/api/feedback', {'grau_satisfacao': GRAUS[i % 3]})),
+        'feedback_batch_100': (max(1, n // 10), lambda i: ('POST', '/api/feedback/batch', {'events': batch})),
+        'summary': (n, lambda i: ('GET', '/api/public/summary', None)),
+        'mixed_post_summary': (n, lambda i: ('POST', '/api/feedback', {'grau_satisfacao': GRAUS[i % 3]})
+                               if i % 5 == 0 else ('GET', '/api/public/summary', None)),
+        'stats': (n, lambda i: ('GET', '/api/admin/stats', None)),
+        'stats_daily': (n, lambda i: ('GET', f'/api/admin/stats/daily?data={hoje}', None)),
+        'stats_series_day': (n, lambda i: ('GET', f'/api/admin/stats/series?bucket=day&from={inicio}&to={hoje}',
+                                           None)),
+        'stats_series_hour': (n, lambda i: ('GET', f'/api/admin/stats/series?bucket=hour&from={inicio}&to={hoje}',
+                                            None)),
+        'stats_periods_8': (n, lambda i: ('GET', f'/api/admin/stats/periods?{periodos}', None)),
+        'dashboard': (n, lambda i: ('GET', '/api/admin/dashboard', None)),
+        'historico_first': (n, lambda i: ('GET', '/api/admin/historico?page=1', None)),
+        'historico_offset_deep': (n, lambda i: ('GET', f'/api/admin/historico?page={deep_page}', None)),
+        'historico_cursor_deep': (n, lambda i: ('GET', f'/api/admin/historico?after={cursor}&count=0', None)),
+        'export_xlsx': (exports, lambda i: ('GET', '/api/admin/export/xlsx', None)),
+        'export_csv': (exports, lambda i: ('GET', '/api/admin/export/csv-plain', None)),
+        'export_txt': (exports, lambda i: ('GET', '/api/admin/export/txt', None)),
+    }
+
+
+class TestClientTransport:
+    """Pedidos pelo test client do Flask (um cliente por thread, sessão admin)."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def client(self):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = feedback_app.app.test_client()
+            with client.session_transaction() as sess:
+                sess['admin_logged_in'] = True
+        return client
+
+    def request(self, method, path, body, headers):
+        resp = self.client().open(path, method=method, json=body, headers=headers)
+        size = len(resp.get_data())
+        resp.close()
+        return resp.status_code, size
+
+    def close(self):
+        pass
+
+
+class ServerTransport:
+    """Pedidos HTTP a um servidor WSGI local (werkzeug, um thread por pedido)."""
+
+    def __init__(self):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, feedback_app.app, threaded=True, request_handler=QuietHandler)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        serializer = feedback_app.app.session_interface.get_signing_serializer(feedback_app.app)
+        self.cookie = f"{feedback_app.app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'admin_logged_in': True})}"
+
+    def request(self, method, path, body, headers):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=600)
+        try:
+            headers = dict(headers, Cookie=self.cookie)
+            data = None
+            if body is not None:
+                data = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            conn.request(method, path, body=data, headers=headers)
+            resp = conn.getresponse()
+            size = 0
+            while True:
+                chunk = resp.read(65536)
+                if not chunk:
+                    break
+                size += len(chunk)
+            return resp.status, size
+        finally:
+            conn.close()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_scenario(transport, total, build, threads, headers):
+    """Corre `total` pedidos em `threads` threads; devolve as métricas do cenário."""
+    latencies = [None] * total
+    errors = []
+    rss_before = peak_rss_mb()
+
+    def one(i):
+        method, path, body = build(i)
+        started = time.perf_counter()
+        status, size = transport.request(method, path, body, headers)
+        latencies[i] = time.perf_counter() - started
+        if status >= 400:
+            errors.append(status)
+        return size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        sizes = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+
+    def pct(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        'requests': total,
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'rps': round(total / elapsed, 1),
+        'p50Ms': pct(0.50),
+        'p95Ms': pct(0.95),
+        'p99Ms': pct(0.99),
+        'meanMs': round(statistics.mean(latencies) * 1000, 3),
+        'bytesPerResponse': int(statistics.mean(sizes)),
+        'peakRssMB': peak_rss_mb(),
+        'peakRssDeltaMB': round(peak_rss_mb() - rss_before, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, meta, baseline):
+    base_meta = baseline.get('meta', {})
+    print(f"\nComparação com {base_meta.get('revision')} ({base_meta.get('time')})")
+    for key in ['mode', 'threads', 'gzip']:
+        if base_meta.get(key) != meta[key]:
+            print(f"  ⚠ {key} diferente: {base_meta.get(key)} vs {meta[key]}")
+    print(f"{'linhas':>9}  {'cenário':<24} {'base req/s':>11} {'req/s':>9} {'Δ':>7} {'base p95':>9} {'p95':>9}")
+    for rows, by_name in results.items():
+        for name, r in by_name.items():
+            base = baseline.get('results', {}).get(rows, {}).get(name)
+            if not base:
+                continue
+            print(f"{rows:>9}  {name:<24} {base['rps']:>11.1f} {r['rps']:>9.1f} "
+                  f"{r['rps'] / base['rps']:>6.2f}x {base['p95Ms']:>9.2f} {r['p95Ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000])
+    parser.add_argument('--requests', type=int, default=400, help='pedidos por cenário')
+    parser.add_argument('--export-requests', type=int, default=2, help='pedidos por cenário de exportação')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--server', action='store_true', help='usar um servidor WSGI local em vez do test client')
+    parser.add_argument('--gzip', action='store_true', help='enviar Accept-Encoding: gzip')
+    parser.add_argument('--firestore-latency-ms', type=float, default=0.0, help='latência simulada do commit')
+    parser.add_argument('--scenarios', nargs='+', help='só estes cenários')
+    parser.add_argument('--output', help='grava os resultados em JSON')
+    parser.add_argument('--compare', help='JSON de uma execução anterior')
+    args = parser.parse_args()
+
+    stub = StubFirestore(args.firestore_latency_ms / 1000)
+    feedback_app.use_firebase_client(stub)
+    headers = {'Accept-Encoding': 'gzip'} if args.gzip else {}
+
+    meta = {
+        'revision': git_revision(),
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'mode': 'server' if args.server else 'test_client',
+        'threads': args.threads,
+        'requests': args.requests,
+        'gzip': args.gzip,
+    }
+    print("=" * 96)
+    print(f"BENCHMARK SUITE ({meta['mode']}, {args.threads} threads, revisão {meta['revision']})")
+    print("=" * 96)
+
+    results = {}
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory(prefix='bench_suite_') as tmpdir:
+            started = time.perf_counter()
+            conn = seed(os.path.join(tmpdir, 'feedback.db'), rows)
+            print(f"\n{rows} linhas (seed: {time.perf_counter() - started:.1f}s)")
+            print(f"  {'cenário':<24} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                  f"{'erros':>6} {'pico RSS MB':>12}")
+
+            transport = ServerTransport() if args.server else TestClientTransport()
+            try:
+                results[str(rows)] = {}
+                for name, (total, build) in scenarios(rows, conn, args).items():
+                    if args.scenarios and name not in args.scenarios:
+                        continue
+                    r = run_scenario(transport, total, build, args.threads, headers)
+                    results[str(rows)][name] = r
+                    print(f"  {name:<24} {r['rps']:>9.1f} {r['p50Ms']:>9.2f} {r['p95Ms']:>9.2f} "
+                          f"{r['p99Ms']:>9.2f} {r['errors']:>6} {r['peakRssMB']:>12.1f}")
+            finally:
+                transport.close()
+                feedback_app.close_db_connection()
+
+    meta['firestoreStub'] = {'commits': stub.commits, 'writes': stub.writes}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados gravados em {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(results, meta, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
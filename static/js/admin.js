@@ -2,7 +2,10 @@
 let barChart = null;
 let pieChart = null;
 let comparisonChart = null;
+let trendChart = null;
 let currentPage = 1;
+// Paginação por cursor: historyCursors[n] = cursor para carregar a página n + 1
+let historyCursors = [''];
 let historyFilters = {
     q: '',
     grau: '',
@@ -14,9 +17,7 @@ let autoRefreshTimer = null;
 
 // Inicializar dashboard
 document.addEventListener('DOMContentLoaded', () => {
-    loadSystemInfo();
-    loadGeneralStats();
-    loadDailyStats();
+    loadDashboard();
     loadHistory();
     loadAvailableDates();
     setupEventListeners();
@@ -38,6 +39,10 @@ function setupEventListeners() {
         }
     });
     
+    // Tendência (série temporal)
+    const trendBucket = document.getElementById('trend-bucket');
+    if (trendBucket) trendBucket.addEventListener('change', () => loadTrend(true));
+
     // Exportação CSV
     document.getElementById('export-csv').addEventListener('click', exportCSV);
 
@@ -53,16 +58,15 @@ function setupEventListeners() {
 
     // Sistema
     const btnRefreshSystem = document.getElementById('btn-refresh-system');
-    if (btnRefreshSystem) btnRefreshSystem.addEventListener('click', loadSystemInfo);
+    if (btnRefreshSystem) btnRefreshSystem.addEventListener('click', loadDashboard);
 
     const autoRefresh = document.getElementById('auto-refresh');
     if (autoRefresh) {
         autoRefresh.addEventListener('change', (e) => {
             if (e.target.checked) {
                 autoRefreshTimer = setInterval(() => {
-                    loadSystemInfo();
-                    loadGeneralStats();
-                    loadDailyStats();
+                    loadDashboard();
+                    if (liveConnected) return;
                     loadHistory(currentPage);
                 }, 30000);
             } else {
@@ -100,38 +104,64 @@ function setupEventListeners() {
     }
 }
 
-async function loadSystemInfo() {
+// Pedidos condicionais: guarda o último ETag/corpo por URL e envia If-None-Match
+const etagCache = new Map();
+
+async function fetchJSONConditional(url) {
+    const cached = etagCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    const resp = await fetch(url, { cache: 'no-store', headers });
+    if (resp.status === 304 && cached) return { data: cached.data, changed: false };
+    const data = await resp.json().catch(() => ({}));
+    if (!resp.ok) throw new Error(data.error || `HTTP ${resp.status}`);
+    const etag = resp.headers.get('ETag');
+    if (etag) etagCache.set(url, { etag, data });
+    return { data, changed: true };
+}
+
+// Estatísticas gerais + do dia + sistema num só pedido (/api/admin/dashboard)
+async function loadDashboard() {
     try {
-        const resp = await fetch('/api/admin/system', { cache: 'no-store' });
-        const data = await resp.json();
-        if (!resp.ok) return;
-
-        const timeEl = document.getElementById('sys-time');
-        const pyEl = document.getElementById('sys-python');
-        const totalEl = document.getElementById('sys-total');
-        const dbEl = document.getElementById('sys-db');
-        const fbEl = document.getElementById('sys-firebase');
-        const projEl = document.getElementById('sys-project');
-        const lastIdEl = document.getElementById('sys-last-id');
-
-        if (timeEl) timeEl.textContent = new Date(data.time).toLocaleString();
-        if (pyEl) pyEl.textContent = `Python ${data.python}`;
-        if (totalEl) totalEl.textContent = String(data.total ?? '—');
-
-        if (dbEl) {
-            const size = data?.db?.sizeBytes;
-            const sizeStr = (typeof size === 'number') ? formatBytes(size) : '—';
-            dbEl.textContent = `${data?.db?.path || ''} · ${sizeStr}`.trim();
-        }
+        const { data, changed } = await fetchJSONConditional('/api/admin/dashboard');
+        // 304: nada mudou desde o último pedido
+        if (!changed) return;
 
-        if (fbEl) fbEl.textContent = data?.firebase?.firestoreAvailable ? 'Online' : 'Offline';
-        if (projEl) projEl.textContent = data?.firebase?.projectId ? `Projeto: ${data.firebase.projectId}` : '—';
-        if (lastIdEl) lastIdEl.textContent = (data.lastId === null || data.lastId === undefined) ? '—' : String(data.lastId);
+        renderSystemInfo(data.system);
+        renderGeneralStats(data.stats);
+        if (data.liveStream) connectLiveFeed();
+        // Novos dados: atualizar também a tendência
+        loadTrend();
+        // A análise temporal só mostra "hoje" se não estiver selecionada outra data
+        if (document.getElementById('btn-hoje')?.classList.contains('active')) renderDailyStats(data.daily);
     } catch (e) {
-        console.error('Erro ao carregar sistema:', e);
+        console.error('Erro ao carregar dashboard:', e);
     }
 }
 
+function renderSystemInfo(data) {
+    const timeEl = document.getElementById('sys-time');
+    const pyEl = document.getElementById('sys-python');
+    const totalEl = document.getElementById('sys-total');
+    const dbEl = document.getElementById('sys-db');
+    const fbEl = document.getElementById('sys-firebase');
+    const projEl = document.getElementById('sys-project');
+    const lastIdEl = document.getElementById('sys-last-id');
+
+    if (timeEl) timeEl.textContent = new Date(data.time).toLocaleString();
+    if (pyEl) pyEl.textContent = `Python ${data.python}`;
+    if (totalEl) totalEl.textContent = String(data.total ?? '—');
+
+    if (dbEl) {
+        const size = data?.db?.sizeBytes;
+        const sizeStr = (typeof size === 'number') ? formatBytes(size) : '—';
+        dbEl.textContent = `${data?.db?.path || ''} · ${sizeStr}`.trim();
+    }
+
+    if (fbEl) fbEl.textContent = data?.firebase?.firestoreAvailable ? 'Online' : 'Offline';
+    if (projEl) projEl.textContent = data?.firebase?.projectId ? `Projeto: ${data.firebase.projectId}` : '—';
+    if (lastIdEl) lastIdEl.textContent = (data.lastId === null || data.lastId === undefined) ? '—' : String(data.lastId);
+}
+
 function formatBytes(bytes) {
     if (!bytes && bytes !== 0) return '—';
     const units = ['B', 'KB', 'MB', 'GB'];
@@ -144,29 +174,22 @@ function formatBytes(bytes) {
     return `${b.toFixed(i === 0 ? 0 : 1)} ${units[i]}`;
 }
 
-// Carregar estatísticas gerais
-async function loadGeneralStats() {
-    try {
-        const response = await fetch('/api/admin/stats');
-        const data = await response.json();
-        
-        // Atualizar cards
-        document.getElementById('total-muito-satisfeito').textContent = data.muito_satisfeito;
-        document.getElementById('percent-muito-satisfeito').textContent = data.percentagens.muito_satisfeito + '%';
-        
-        document.getElementById('total-satisfeito').textContent = data.satisfeito;
-        document.getElementById('percent-satisfeito').textContent = data.percentagens.satisfeito + '%';
-        
-        document.getElementById('total-insatisfeito').textContent = data.insatisfeito;
-        document.getElementById('percent-insatisfeito').textContent = data.percentagens.insatisfeito + '%';
-        
-        document.getElementById('total-geral').textContent = data.total;
-        
-        // Criar gráficos
-        createCharts(data);
-    } catch (error) {
-        console.error('Erro ao carregar estatísticas:', error);
-    }
+// Mostrar estatísticas gerais
+function renderGeneralStats(data) {
+    // Atualizar cards
+    document.getElementById('total-muito-satisfeito').textContent = data.muito_satisfeito;
+    document.getElementById('percent-muito-satisfeito').textContent = data.percentagens.muito_satisfeito + '%';
+    
+    document.getElementById('total-satisfeito').textContent = data.satisfeito;
+    document.getElementById('percent-satisfeito').textContent = data.percentagens.satisfeito + '%';
+    
+    document.getElementById('total-insatisfeito').textContent = data.insatisfeito;
+    document.getElementById('percent-insatisfeito').textContent = data.percentagens.insatisfeito + '%';
+    
+    document.getElementById('total-geral').textContent = data.total;
+    
+    // Criar gráficos
+    createCharts(data);
 }
 
 // Criar gráficos
@@ -261,33 +284,97 @@ function createCharts(data) {
 async function loadDailyStats(date = null) {
     try {
         const url = date ? `/api/admin/stats/daily?data=${date}` : '/api/admin/stats/daily';
-        const response = await fetch(url);
-        const data = await response.json();
-        
-        const statsContainer = document.getElementById('temporal-stats');
-        statsContainer.innerHTML = `
-            <div class="temporal-stat-item">
-                <h4>😊 Muito Satisfeito</h4>
-                <p>${data.muito_satisfeito}</p>
-            </div>
-            <div class="temporal-stat-item">
-                <h4>🙂 Satisfeito</h4>
-                <p>${data.satisfeito}</p>
-            </div>
-            <div class="temporal-stat-item">
-                <h4>😞 Insatisfeito</h4>
-                <p>${data.insatisfeito}</p>
-            </div>
-            <div class="temporal-stat-item">
-                <h4>📊 Total do Dia</h4>
-                <p>${data.muito_satisfeito + data.satisfeito + data.insatisfeito}</p>
-            </div>
-        `;
+        // Sempre redesenhado: o corpo em cache pode ser de outra data já mostrada antes
+        const { data } = await fetchJSONConditional(url);
+        renderDailyStats(data);
     } catch (error) {
         console.error('Erro ao carregar estatísticas diárias:', error);
     }
 }
 
+function renderDailyStats(data) {
+    const statsContainer = document.getElementById('temporal-stats');
+    statsContainer.innerHTML = `
+        <div class="temporal-stat-item">
+            <h4>😊 Muito Satisfeito</h4>
+            <p>${data.muito_satisfeito}</p>
+        </div>
+        <div class="temporal-stat-item">
+            <h4>🙂 Satisfeito</h4>
+            <p>${data.satisfeito}</p>
+        </div>
+        <div class="temporal-stat-item">
+            <h4>😞 Insatisfeito</h4>
+            <p>${data.insatisfeito}</p>
+        </div>
+        <div class="temporal-stat-item">
+            <h4>📊 Total do Dia</h4>
+            <p>${data.muito_satisfeito + data.satisfeito + data.insatisfeito}</p>
+        </div>
+    `;
+}
+
+// Tendência: intervalo (em dias) mostrado para cada tipo de bucket
+const TREND_DAYS = { day: 30, week: 84, weekday: 84, hour: 2 };
+
+function isoDate(date) {
+    const pad = (n) => String(n).padStart(2, '0');
+    return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())}`;
+}
+
+// Carregar série temporal (/api/admin/stats/series) e desenhar o gráfico de tendência
+async function loadTrend(force = false) {
+    const canvas = document.getElementById('trendChart');
+    if (!canvas) return;
+    try {
+        const bucket = document.getElementById('trend-bucket')?.value || 'day';
+        const to = new Date();
+        const from = new Date(to);
+        from.setDate(from.getDate() - TREND_DAYS[bucket] + 1);
+        const params = new URLSearchParams({ bucket, from: isoDate(from), to: isoDate(to) });
+
+        const { data, changed } = await fetchJSONConditional(`/api/admin/stats/series?${params.toString()}`);
+        if (!changed && !force && trendChart) return;
+
+        const labels = ['Muito Satisfeito', 'Satisfeito', 'Insatisfeito'];
+        const colors = ['#4caf50', '#2196f3', '#f44336'];
+        const datasets = ['muito_satisfeito', 'satisfeito', 'insatisfeito'].map((grau, i) => ({
+            label: labels[i],
+            data: data.series[grau],
+            backgroundColor: colors[i],
+            borderColor: colors[i],
+            borderWidth: 2
+        }));
+
+        if (trendChart) trendChart.destroy();
+        trendChart = new Chart(canvas.getContext('2d'), {
+            type: 'bar',
+            data: { labels: data.labels, datasets },
+            options: {
+                responsive: true,
+                maintainAspectRatio: true,
+                plugins: {
+                    legend: {
+                        position: 'bottom'
+                    }
+                },
+                scales: {
+                    x: { stacked: true },
+                    y: {
+                        stacked: true,
+                        beginAtZero: true,
+                        ticks: {
+                            stepSize: 1
+                        }
+                    }
+                }
+            }
+        });
+    } catch (error) {
+        console.error('Erro ao carregar tendência:', error);
+    }
+}
+
 // Carregar datas disponíveis
 async function loadAvailableDates() {
     try {
@@ -311,8 +398,13 @@ async function loadAvailableDates() {
 // Carregar histórico
 async function loadHistory(page = 1) {
     try {
+        // Filtros mudaram (ou página 1): recomeçar a lista de cursores
+        if (page === 1) historyCursors = [''];
+        const cursor = historyCursors[page - 1];
+        if (cursor === undefined) return;
+
         const params = new URLSearchParams();
-        params.set('page', String(page));
+        params.set('after', cursor);
         params.set('per_page', '50');
         if (historyFilters.q) params.set('q', historyFilters.q);
         if (historyFilters.grau) params.set('grau', historyFilters.grau);
@@ -357,8 +449,12 @@ async function loadHistory(page = 1) {
             `;
         }).join('');
         
+        // Guardar o cursor da página seguinte
+        historyCursors = historyCursors.slice(0, page);
+        if (data.next_cursor) historyCursors[page] = data.next_cursor;
+
         // Atualizar paginação
-        updatePagination(data);
+        updatePagination({ ...data, page });
         currentPage = page;
         
     } catch (error) {
@@ -386,7 +482,7 @@ function updatePagination(data) {
             ← Anterior
         </button>
         <span>Página ${data.page} de ${data.total_pages}</span>
-        <button ${data.page >= data.total_pages ? 'disabled' : ''} onclick="loadHistory(${data.page + 1})">
+        <button ${!data.next_cursor ? 'disabled' : ''} onclick="loadHistory(${data.page + 1})">
             Próxima →
         </button>
     `;
@@ -559,9 +655,39 @@ function formatDate(dateString) {
     return `${day}/${month}/${year}`;
 }
 
-// Auto-refresh a cada 30 segundos
+// Feed em tempo real (SSE): recarrega os dados afetados quando chega um novo feedback
+let liveConnected = false;
+let liveLastId = null;
+
+// Só se o servidor o suportar (`liveStream` no dashboard)
+let liveSource = null;
+
+function connectLiveFeed() {
+    if (liveSource || !('EventSource' in window)) return;
+    const source = liveSource = new EventSource('/api/stream');
+    source.addEventListener('open', () => { liveConnected = true; });
+    source.addEventListener('error', () => { liveConnected = false; });
+    source.addEventListener('summary', (e) => {
+        let data;
+        try {
+            data = JSON.parse(e.data);
+        } catch (err) {
+            return;
+        }
+        // O primeiro evento é o estado atual (já carregado no arranque)
+        const isNew = liveLastId !== null && data.lastId !== liveLastId;
+        liveLastId = data.lastId;
+        if (!isNew) return;
+
+        loadDashboard();
+        // Só a primeira página do histórico muda com novos registos
+        if (currentPage === 1) loadHistory(1);
+    });
+}
+
+// Auto-refresh a cada 30 segundos (fallback quando o SSE não está ligado)
 setInterval(() => {
-    loadGeneralStats();
-    loadDailyStats();
+    if (liveConnected) return;
+    loadDashboard();
     loadHistory(currentPage);
 }, 30000);
@@ -126,38 +126,55 @@ function saveQueue(queue) {
     } catch (e) {}
 }
 
+// Chave de idempotência: o servidor ignora reenvios do mesmo evento
+function newClientKey() {
+    if (window.crypto && typeof crypto.randomUUID === 'function') return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 function enqueueFeedback(grau_satisfacao) {
     const queue = loadQueue();
-    queue.push({ grau_satisfacao, createdAt: new Date().toISOString() });
+    queue.push({ grau_satisfacao, createdAt: new Date().toISOString(), clientKey: newClientKey() });
     saveQueue(queue);
     updateOnlineStatus();
 }
 
+// Máximo de eventos por pedido (FEEDBACK_BATCH_MAX no servidor)
+const FLUSH_BATCH_SIZE = 500;
+
 let flushing = false;
 async function flushQueue() {
     if (flushing) return;
     if (!navigator.onLine) return;
-    const queue = loadQueue();
+    let queue = loadQueue();
     if (!queue.length) return;
 
     flushing = true;
     try {
+        // Itens antigos (sem chave): atribuir e guardar antes de enviar, para o reenvio ser idempotente
+        if (queue.some(item => !item.clientKey)) {
+            queue = queue.map(item => item.clientKey ? item : { ...item, clientKey: newClientKey() });
+            saveQueue(queue);
+        }
+
         while (queue.length) {
-            const item = queue[0];
-            const response = await fetch('/api/feedback', {
+            const batch = queue.slice(0, FLUSH_BATCH_SIZE);
+            const response = await fetch('/api/feedback/batch', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ grau_satisfacao: item.grau_satisfacao })
+                body: JSON.stringify({ events: batch })
             });
             if (!response.ok) {
                 // para e tenta mais tarde
                 break;
             }
-            queue.shift();
+            // Inseridos, duplicados e rejeitados saem todos da fila
+            const sent = new Set(batch.map(item => item.clientKey));
+            queue = loadQueue().filter(item => !sent.has(item.clientKey));
             saveQueue(queue);
             updateOnlineStatus();
-            await fetchSummary();
         }
+        await fetchSummary();
     } catch (e) {
         // ignora
     } finally {
@@ -165,29 +182,62 @@ async function flushQueue() {
     }
 }
 
+function hasSummary() {
+    return !!(sumToday || sumTotal || sumLastId || sumFirebase);
+}
+
+// ETag do último resumo: o servidor responde 304 (sem corpo) se nada mudou
+let summaryEtag = null;
+
 async function fetchSummary() {
-    if (!sumToday && !sumTotal && !sumLastId && !sumFirebase) return;
+    if (!hasSummary()) return;
     try {
-        const resp = await fetch('/api/public/summary', { cache: 'no-store' });
+        const headers = summaryEtag ? { 'If-None-Match': summaryEtag } : {};
+        const resp = await fetch('/api/public/summary', { cache: 'no-store', headers });
+        if (resp.status === 304) return;
         const data = await resp.json();
         if (!resp.ok) return;
-
-        if (sumToday) sumToday.textContent = String(data.todayTotal ?? '—');
-        if (sumTotal) sumTotal.textContent = String(data.total ?? '—');
-        if (sumLastId) sumLastId.textContent = (data.lastId === null || data.lastId === undefined) ? '—' : String(data.lastId);
-        if (sumFirebase) sumFirebase.textContent = data.firebaseAvailable ? 'Online' : 'Offline';
-
-        if (sumTodayBreakdown && data.today) {
-            const ms = data.today.muito_satisfeito ?? 0;
-            const s = data.today.satisfeito ?? 0;
-            const i = data.today.insatisfeito ?? 0;
-            sumTodayBreakdown.textContent = `😊 ${ms}  ·  🙂 ${s}  ·  😞 ${i}`;
-        }
+        summaryEtag = resp.headers.get('ETag');
+        renderSummary(data);
+        if (data.liveStream) connectLiveFeed();
     } catch (e) {
         // ignora
     }
 }
 
+function renderSummary(data) {
+    if (sumToday) sumToday.textContent = String(data.todayTotal ?? '—');
+    if (sumTotal) sumTotal.textContent = String(data.total ?? '—');
+    if (sumLastId) sumLastId.textContent = (data.lastId === null || data.lastId === undefined) ? '—' : String(data.lastId);
+    if (sumFirebase) sumFirebase.textContent = data.firebaseAvailable ? 'Online' : 'Offline';
+
+    if (sumTodayBreakdown && data.today) {
+        const ms = data.today.muito_satisfeito ?? 0;
+        const s = data.today.satisfeito ?? 0;
+        const i = data.today.insatisfeito ?? 0;
+        sumTodayBreakdown.textContent = `😊 ${ms}  ·  🙂 ${s}  ·  😞 ${i}`;
+    }
+}
+
+// Feed em tempo real (SSE), só se o servidor o suportar (`liveStream` no resumo);
+// enquanto estiver ligado não é preciso fazer polling
+let liveConnected = false;
+let liveSource = null;
+
+function connectLiveFeed() {
+    if (liveSource || !hasSummary() || !('EventSource' in window)) return;
+    const source = liveSource = new EventSource('/api/stream');
+    source.addEventListener('open', () => { liveConnected = true; });
+    source.addEventListener('error', () => { liveConnected = false; });
+    source.addEventListener('summary', (e) => {
+        try {
+            renderSummary(JSON.parse(e.data));
+        } catch (err) {
+            // ignora
+        }
+    });
+}
+
 // Estado online/offline
 function updateOnlineStatus() {
     if (!statusPill) return;
@@ -211,9 +261,11 @@ window.addEventListener('online', () => {
     fetchSummary();
 });
 
-// Carregar resumo ao iniciar e periodicamente
+// Carregar resumo ao iniciar (liga o SSE se disponível); polling quando o SSE não está ligado
 fetchSummary();
-setInterval(fetchSummary, 30000);
+setInterval(() => {
+    if (!liveConnected) fetchSummary();
+}, 30000);
 
 // Adicionar event listeners aos botões
 feedbackButtons.forEach(button => {
@@ -47,11 +47,19 @@ async function tryWakeLock() {
     }
 }
 
+// Pedidos condicionais: guarda o último ETag/corpo por URL e envia If-None-Match
+const etagCache = new Map();
+
 async function fetchJSON(url) {
-    const resp = await fetch(url, { cache: 'no-store' });
+    const cached = etagCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    const resp = await fetch(url, { cache: 'no-store', headers });
+    if (resp.status === 304 && cached) return { data: cached.data, changed: false };
     const data = await resp.json().catch(() => ({}));
     if (!resp.ok) throw new Error(data.error || `HTTP ${resp.status}`);
-    return data;
+    const etag = resp.headers.get('ETag');
+    if (etag) etagCache.set(url, { etag, data });
+    return { data, changed: true };
 }
 
 function ensureCharts(stats) {
@@ -149,20 +157,51 @@ function formatBytes(bytes) {
 
 async function refreshAll() {
     try {
-        const [stats, daily, sys] = await Promise.all([
-            fetchJSON('/api/admin/stats'),
-            fetchJSON('/api/admin/stats/daily'),
-            fetchJSON('/api/admin/system')
-        ]);
-
-        ensureCharts(stats);
-        renderToday(daily);
-        renderSystem(sys);
+        // Estatísticas gerais + do dia + sistema num só pedido
+        const { data, changed } = await fetchJSON('/api/admin/dashboard');
+
+        // 304: os dados não mudaram, não é preciso redesenhar
+        if (changed) {
+            ensureCharts(data.stats);
+            renderToday(data.daily);
+            renderSystem(data.system);
+            if (data.liveStream) connectLiveFeed();
+        } else {
+            setStatus(true, `Atualizado: ${new Date().toLocaleTimeString()}`);
+        }
     } catch (e) {
         setStatus(false, `Erro: ${e.message}`);
     }
 }
 
+// Feed em tempo real (SSE): atualiza gráficos e KPIs a cada novo feedback
+let liveConnected = false;
+
+function renderLive(data) {
+    if (data.totals) ensureCharts(data.totals);
+    if (data.today) renderToday(data.today);
+    setText('kpi-total', String(data.total ?? '—'));
+    setText('kpi-last-id', (data.lastId === null || data.lastId === undefined) ? '—' : String(data.lastId));
+    setStatus(true, `Ao vivo: ${new Date().toLocaleTimeString()}`);
+}
+
+// Só se o servidor o suportar (`liveStream` no dashboard)
+let liveSource = null;
+
+function connectLiveFeed() {
+    if (liveSource || !('EventSource' in window)) return;
+    const source = liveSource = new EventSource('/api/stream');
+    source.addEventListener('open', () => { liveConnected = true; });
+    source.addEventListener('error', () => { liveConnected = false; });
+    source.addEventListener('summary', (e) => {
+        try {
+            renderLive(JSON.parse(e.data));
+        } catch (err) {
+            // ignora
+        }
+    });
+}
+
 function setupActions() {
     const fsBtn = $('tv-fullscreen');
     const refreshBtn = $('tv-refresh');
@@ -210,4 +249,11 @@ tickClock();
 setInterval(tickClock, 1000);
 tryWakeLock();
 refreshAll();
-setInterval(refreshAll, 15000);
+// Polling rápido só como fallback; com o SSE ligado basta atualizar a info de sistema
+let lastFullRefresh = Date.now();
+setInterval(() => {
+    if (!liveConnected || Date.now() - lastFullRefresh >= 300000) {
+        lastFullRefresh = Date.now();
+        refreshAll();
+    }
+}, 15000);
@@ -0,0 +1,1380 @@
+#!/usr/bin/env python3
+"""
+Testes do esquema SQLite: migrações (PRAGMA user_version) e planos de execução.
+
+Cada consulta "quente" tem de usar um índice (EXPLAIN QUERY PLAN) e não pode
+precisar de ordenar numa B-tree temporária.
+
+    python3 -m pytest -q test_db.py
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Base de dados temporária com todas as migrações aplicadas."""
+    original = app.DATABASE
+    app.DATABASE = str(tmp_path / 'feedback.db')
+    try:
+        app.init_db()
+        yield app.get_db()
+    finally:
+        app.close_db_connection()
+        app.DATABASE = original
+
+
+def query_plan(conn, sql, params=()):
+    """Devolve o EXPLAIN QUERY PLAN como uma única string."""
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    return ' | '.join(row['detail'] for row in rows)
+
+
+def assert_uses_index(conn, sql, params=(), index=None):
+    plan = query_plan(conn, sql, params)
+    assert 'USING' in plan and 'INDEX' in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
+    if index:
+        assert index in plan, plan
+
+
+def test_migrations_set_user_version(conn):
+    """As migrações ficam registadas em user_version e não voltam a correr."""
+    assert app.get_schema_version(conn) == app.SCHEMA_VERSION
+    app.init_db()
+    assert app.get_schema_version(conn) == app.SCHEMA_VERSION
+
+    tables = {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'feedback_compact', 'sync_outbox', 'feedback_daily_counts', 'sync_state'} <= tables
+    views = {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'view'")}
+    assert 'feedback' in views
+
+
+def test_get_db_reuses_one_wal_connection_per_thread(conn):
+    """get_db devolve a mesma ligação (WAL) no mesmo thread, outra noutro thread; close_db_connection fecha-a."""
+    import threading
+
+    assert app.get_db() is conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    with app.app.app_context():
+        assert app.get_db() is conn
+    # O fim do app context não fecha a ligação do thread
+    assert conn.execute('SELECT 1').fetchone()[0] == 1
+
+    other = []
+
+    def in_thread():
+        other.append((app.get_db(), app.get_db()))
+        app.close_db_connection()
+
+    thread = threading.Thread(target=in_thread)
+    thread.start()
+    thread.join()
+    assert other[0][0] is other[0][1] and other[0][0] is not conn
+
+    app.close_db_connection()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+    reopened = app.get_db()
+    assert reopened is not conn and reopened.execute('SELECT COUNT(*) FROM feedback').fetchone()[0] == 0
+
+
+def test_database_id_changes_when_database_is_recreated(conn, tmp_path):
+    """Cada base tem o seu database_id (ids e since_id não passam de uma base para outra)."""
+    first = app.get_sync_value(conn, 'database_id')
+    app.init_db()
+    assert app.get_sync_value(conn, 'database_id') == first
+
+    app.close_db_connection()
+    os.remove(app.DATABASE)
+    app.init_db()
+    second = app.get_sync_value(app.get_db(), 'database_id')
+    assert first and second and first != second
+
+
+def test_migrations_upgrade_legacy_database(tmp_path):
+    """Uma base antiga (só com a tabela feedback, user_version = 0) é migrada com backfill."""
+    path = str(tmp_path / 'legacy.db')
+    legacy = sqlite3.connect(path)
+    legacy.execute('''
+        CREATE TABLE feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            grau_satisfacao TEXT NOT NULL,
+            data TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            dia_semana TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    legacy.executemany(
+        'INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)',
+        [('satisfeito', '2024-01-01', '10:00:00', 'Segunda-feira')] * 3
+    )
+    legacy.commit()
+    legacy.close()
+
+    original = app.DATABASE
+    app.DATABASE = path
+    try:
+        app.init_db()
+        conn = app.get_db()
+        assert app.get_schema_version(conn) == app.SCHEMA_VERSION
+        assert app.count_feedback_by_grau(conn, '2024-01-01')['satisfeito'] == 3
+    finally:
+        app.close_db_connection()
+        app.DATABASE = original
+
+
+def test_feedback_view_insert_generates_key_and_utc_timestamp(conn):
+    """INSERT na view: client_key gerado (a reconciliação não duplica) e timestamp em UTC."""
+    conn.execute("INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) "
+                 "VALUES ('satisfeito', '2024-06-01', '12:30:00', 'Sábado')")
+    conn.commit()
+    row = conn.execute('SELECT * FROM feedback ORDER BY id DESC LIMIT 1').fetchone()
+    assert row['client_key'] and len(row['client_key']) == 32
+    local = datetime(2024, 6, 1, 12, 30)
+    assert row['timestamp'] == local.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    assert (row['data'], row['hora']) == ('2024-06-01', '12:30:00')
+
+
+@pytest.mark.parametrize('grau, data_inicio, data_fim, index', [
+    ('', '', '', 'idx_feedback_ts'),
+    ('', '2024-01-01', '2024-01-31', 'idx_feedback_ts'),
+    ('', '2024-01-01', '', 'idx_feedback_ts'),
+    ('satisfeito', '', '', 'idx_feedback_grau_ts'),
+    ('satisfeito', '2024-01-01', '2024-01-31', 'idx_feedback_grau_ts'),
+])
+def test_historico_uses_index(conn, grau, data_inicio, data_fim, index):
+    where_sql, params = app.build_historico_filters(grau, data_inicio, data_fim, '')
+    sql, query_params = app.historico_page_query(where_sql, params, 50, offset=0)
+    assert_uses_index(conn, sql, query_params, index)
+
+    # Modo cursor (keyset): o cursor limita a pesquisa no próprio índice (SEARCH, não SCAN)
+    after = app.parse_historico_cursor('2024-01-15,10:00:00,123')
+    where_sql, params = app.build_historico_filters(grau, data_inicio, data_fim, '', after)
+    sql, query_params = app.historico_page_query(where_sql, params, 50, after=after)
+    assert_uses_index(conn, sql, query_params, index)
+    assert query_plan(conn, sql, query_params).startswith('SEARCH'), query_plan(conn, sql, query_params)
+
+
+def test_historico_keyset_pagination_walks_all_rows(conn):
+    """Percorrer o histórico por cursor devolve todas as linhas, sem repetições, pela ordem do OFFSET."""
+    rows = [
+        (app.GRAUS_SATISFACAO[i % 3], f'2024-01-{1 + i % 5:02d}', '10:00:00', 'Segunda-feira')
+        for i in range(23)
+    ]
+    conn.executemany('INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+
+    sql, params = app.historico_page_query('', [], 100)
+    expected = [row['id'] for row in conn.execute(sql, params)]
+
+    seen, after = [], None
+    while True:
+        where_sql, params = app.build_historico_filters('', '', '', '', after)
+        sql, params = app.historico_page_query(where_sql, params, 5, after=after)
+        page = conn.execute(sql, params).fetchall()
+        if not page:
+            break
+        seen.extend(row['id'] for row in page)
+        after = app.parse_historico_cursor(f"{page[-1]['data']},{page[-1]['hora']},{page[-1]['id']}")
+
+    assert seen == expected
+    assert app.count_historico(conn, '', '', '', '') == 23
+    assert app.count_historico(conn, 'satisfeito', '2024-01-01', '2024-01-02', '') == \
+        sum(1 for r in rows if r[0] == 'satisfeito' and r[1] <= '2024-01-02')
+
+
+@pytest.mark.parametrize('data_inicio, data_fim', [(None, None), ('2024-01-01', '2024-01-31')])
+def test_export_uses_index(conn, data_inicio, data_fim):
+    sql, params = app.export_query(data_inicio, data_fim)
+    assert_uses_index(conn, sql, params, 'idx_feedback_ts')
+
+
+@pytest.mark.parametrize('data_inicio, data_fim', [(None, None), ('2024-01-01', '2024-01-31')])
+def test_delta_export_uses_primary_key(conn, data_inicio, data_fim):
+    """Exportação incremental (since_id): intervalo na chave primária, sem ordenar."""
+    sql, params = app.export_query(data_inicio, data_fim, (100, 200))
+    plan = query_plan(conn, sql, params)
+    assert plan.startswith('SEARCH') and 'INTEGER PRIMARY KEY' in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_feedback_view_over_compact_storage(conn):
+    """A view `feedback` devolve as colunas antigas e aceita INSERT/DELETE (rollup incluído)."""
+    conn.execute("INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) "
+                 "VALUES ('insatisfeito', '2024-03-03', '23:59:59', 'Domingo')")
+    conn.execute('INSERT INTO feedback_compact (ts, grau) VALUES (?, ?)',
+                 (app.feedback_ts(app.datetime(2024, 3, 4, 8, 5, 0)), app.GRAU_CODES['satisfeito']))
+    conn.commit()
+
+    rows = conn.execute('SELECT grau_satisfacao, data, hora, dia_semana FROM feedback ORDER BY id').fetchall()
+    assert [tuple(r) for r in rows] == [
+        ('insatisfeito', '2024-03-03', '23:59:59', 'Domingo'),
+        ('satisfeito', '2024-03-04', '08:05:00', 'Segunda-feira'),
+    ]
+    assert app.count_feedback_by_grau(conn, '2024-03-04')['satisfeito'] == 1
+
+    conn.execute("DELETE FROM feedback WHERE data = '2024-03-04'")
+    conn.commit()
+    assert app.count_feedback_by_grau(conn, '2024-03-04')['satisfeito'] == 0
+    assert app.count_historico(conn, '', '2024-03-03', '2024-03-03', '') == 1
+
+
+def test_daily_counts_use_primary_key(conn):
+    plan = query_plan(conn, 'SELECT grau_satisfacao, total FROM feedback_daily_counts WHERE data BETWEEN ? AND ?',
+                      ('2024-01-01', '2024-01-31'))
+    assert 'USING PRIMARY KEY' in plan, plan
+
+
+def test_feedback_batch_is_idempotent(conn):
+    """O lote usa o `createdAt` do cliente e ignora `clientKey` repetidas (no lote ou já gravadas)."""
+    events = [
+        {'grau_satisfacao': 'satisfeito', 'createdAt': '2024-03-04T09:15:00', 'clientKey': 'a'},
+        {'grau_satisfacao': 'insatisfeito', 'createdAt': '2024-03-04T09:16:00', 'clientKey': 'b'},
+        {'grau_satisfacao': 'insatisfeito', 'createdAt': '2024-03-04T09:16:00', 'clientKey': 'b'},
+        {'grau_satisfacao': 'nao_existe', 'clientKey': 'c'},
+    ]
+    rows, duplicates, rejected = app.insert_feedback_batch(conn, events, sync_enabled=True)
+    assert [r['hora'] for r in rows] == ['09:15:00', '09:16:00']
+    assert rows[0]['dia_semana'] == 'Segunda-feira'
+    assert (duplicates, [r['index'] for r in rejected]) == (1, [3])
+
+    stored = conn.execute('SELECT id, client_key FROM feedback ORDER BY id').fetchall()
+    assert [(r['id'], r['client_key']) for r in stored] == [(rows[0]['id'], 'a'), (rows[1]['id'], 'b')]
+    outbox = [r['doc_id'] for r in conn.execute('SELECT doc_id FROM sync_outbox ORDER BY id')]
+    assert outbox == ['feedback_a', 'feedback_b']
+
+    # Reenvio (ex.: resposta perdida): nada é duplicado
+    rows, duplicates, rejected = app.insert_feedback_batch(conn, events[:2])
+    assert (rows, duplicates) == ([], 2)
+    assert app.count_feedback_by_grau(conn, '2024-03-04') == {
+        'muito_satisfeito': 0, 'satisfeito': 1, 'insatisfeito': 1}
+
+
+def test_feedback_batch_max_size_within_sqlite_variable_limit(conn):
+    """Um lote de FEEDBACK_BATCH_MAX chaves funciona com o limite antigo de 999 variáveis do SQLite."""
+    conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    events = [{'grau_satisfacao': 'satisfeito', 'clientKey': f'k{i}'} for i in range(app.FEEDBACK_BATCH_MAX)]
+    rows, duplicates, _ = app.insert_feedback_batch(conn, events)
+    assert (len(rows), duplicates) == (app.FEEDBACK_BATCH_MAX, 0)
+
+    rows, duplicates, _ = app.insert_feedback_batch(conn, events)
+    assert (rows, duplicates) == ([], app.FEEDBACK_BATCH_MAX)
+
+
+def test_public_summary_cache_invalidated_on_write(conn):
+    """O resumo público fica em cache até ao próximo feedback (contadores de hits/misses)."""
+    app.invalidate_cache()
+    client = app.app.test_client()
+    before = app.get_cache_stats()
+
+    first = client.get('/api/public/summary').get_json()
+    assert client.get('/api/public/summary').get_json() == first
+    stats = app.get_cache_stats()
+    assert (stats['misses'] - before['misses'], stats['hits'] - before['hits']) == (1, 1)
+
+    assert client.post('/api/feedback', json={'grau_satisfacao': 'satisfeito'}).status_code == 200
+    after = client.get('/api/public/summary').get_json()
+    assert after['total'] == first['total'] + 1
+    assert after['todayTotal'] == first['todayTotal'] + 1
+
+
+def test_cache_lru_eviction(monkeypatch):
+    monkeypatch.setattr(app, 'CACHE_MAX_ENTRIES', 2)
+    app.invalidate_cache()
+    for key in ['a', 'b', 'a', 'c']:  # 'a' é reutilizado, logo 'b' é o menos recente
+        app.cached(key, lambda: key)
+    assert list(app._cache) == ['a', 'c']
+
+
+@pytest.mark.parametrize('url', [
+    '/api/public/summary', '/api/admin/stats', '/api/admin/stats/daily', '/api/admin/system', '/api/admin/dates',
+    '/api/admin/dashboard',
+])
+def test_polling_endpoints_answer_304(conn, url):
+    """Com If-None-Match igual ao ETag atual a resposta é 304; um novo feedback muda o ETag."""
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers['ETag']
+    again = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert (again.status_code, again.data) == (304, b'')
+
+    client.post('/api/feedback', json={'grau_satisfacao': 'satisfeito'})
+    changed = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
+
+
+@pytest.mark.parametrize('url', [
+    '/api/public/summary', '/api/admin/stats', '/api/admin/stats/daily', '/api/admin/dashboard',
+    '/api/admin/stats/series', '/api/admin/stats/periods?periodo=2000-01-01,2100-01-01',
+])
+def test_cached_endpoints_see_writes_from_other_processes(conn, url):
+    """Uma escrita noutra ligação (outro worker) não invalida a cache local, mas muda a versão."""
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+    client.post('/api/feedback', json={'grau_satisfacao': 'satisfeito'})
+
+    first = client.get(url)
+    assert first.status_code == 200
+
+    agora = datetime.now()
+    other = sqlite3.connect(app.DATABASE)
+    other.execute('INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)',
+                  ('insatisfeito', agora.strftime('%Y-%m-%d'), agora.strftime('%H:%M:%S'), 'Segunda-feira'))
+    other.commit()
+    other.close()
+
+    changed = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
+    assert changed.get_json() != first.get_json()
+    again = client.get(url, headers={'If-None-Match': changed.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_dashboard_matches_individual_endpoints(conn):
+    """/api/admin/dashboard devolve o mesmo que stats + stats/daily + system."""
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+    for grau in ['satisfeito', 'satisfeito', 'insatisfeito']:
+        client.post('/api/feedback', json={'grau_satisfacao': grau})
+    conn.execute("INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) "
+                 "VALUES ('muito_satisfeito', '2020-01-01', '10:00:00', 'Quarta-feira')")
+    conn.commit()
+    app.invalidate_cache()
+
+    dashboard = client.get('/api/admin/dashboard').get_json()
+    assert dashboard['stats'] == client.get('/api/admin/stats').get_json()
+    assert dashboard['daily'] == client.get('/api/admin/stats/daily').get_json()
+    system = client.get('/api/admin/system').get_json()
+    for key in ['total', 'lastId', 'db']:
+        assert dashboard['system'][key] == system[key]
+
+
+def sse_event(chunk):
+    """Dados (JSON) do evento `summary` de um bloco SSE."""
+    data = [line for line in chunk.splitlines() if line.startswith('data: ')]
+    return json.loads(data[0][len('data: '):])
+
+
+def test_live_updates_first_event_new_row_and_heartbeat(conn, monkeypatch):
+    """iter_live_updates: estado atual, novo registo (publish ou MAX(id) de outro processo), ping e fim."""
+    monkeypatch.setattr(app, 'SSE_POLL_SECONDS', 0.01)
+    monkeypatch.setattr(app, 'SSE_KEEPALIVE_SECONDS', 0.05)
+    first_id = app.record_feedback(conn, 'satisfeito')
+    subscribers = app._live_subscribers
+
+    updates = app.iter_live_updates(conn, include_totals=True)
+    first = next(updates)
+    assert first.startswith(f'retry: {app.SSE_RETRY_MS}\n\n') and f'id: {first_id}\n' in first
+    assert sse_event(first)['lastId'] == first_id and 'totals' in sse_event(first)
+    assert app._live_subscribers == subscribers + 1
+
+    # Mesmo processo: record_feedback publica o resumo
+    new_id = app.record_feedback(conn, 'insatisfeito')
+    event = sse_event(next(updates))
+    assert event['lastId'] == new_id and event['today']['insatisfeito'] == 1
+
+    # Outro processo: só se vê pelo MAX(id) ao fim de SSE_POLL_SECONDS
+    other = sqlite3.connect(app.DATABASE)
+    agora = datetime.now()
+    other.execute('INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)',
+                  ('satisfeito', agora.strftime('%Y-%m-%d'), agora.strftime('%H:%M:%S'), 'Segunda-feira'))
+    other.commit()
+    other.close()
+    assert sse_event(next(updates))['lastId'] == new_id + 1
+
+    # Sem novidades: keepalive, e a ligação termina ao fim de SSE_MAX_SECONDS
+    assert next(updates) == ': ping\n\n'
+    monkeypatch.setattr(app, 'SSE_MAX_SECONDS', 0)
+    with pytest.raises(StopIteration):
+        next(updates)
+    assert app._live_subscribers == subscribers
+
+
+def test_publish_live_update_only_with_listeners(conn, monkeypatch):
+    """Sem ligações abertas não há resumo calculado; um listener recebe o snapshot publicado."""
+    calls = []
+    monkeypatch.setattr(app, 'live_snapshot', lambda c: calls.append(1) or {'lastId': 1})
+    version = app._live_version
+    app.publish_live_update(conn)
+    assert (calls, app._live_version) == ([], version)
+
+    received = []
+    app.add_live_listener(received.append)
+    try:
+        app.publish_live_update(conn)
+    finally:
+        app.remove_live_listener(received.append)
+    assert received == [{'lastId': 1}] and app._live_version == version + 1
+
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_live_stream_flag(conn, monkeypatch, enabled):
+    """WSGI: /api/stream só existe com LIVE_STREAM; o resumo e o dashboard dizem-no aos ecrãs."""
+    monkeypatch.setattr(app, 'LIVE_STREAM_ENABLED', enabled)
+    monkeypatch.setattr(app, 'SSE_MAX_SECONDS', 0)
+    app.invalidate_cache()
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+
+    assert client.get('/api/public/summary').get_json()['liveStream'] is enabled
+    assert client.get('/api/admin/dashboard').get_json()['liveStream'] is enabled
+    resp = client.get('/api/stream')
+    assert resp.status_code == (200 if enabled else 404)
+    if enabled:
+        assert resp.mimetype == 'text/event-stream' and 'event: summary' in resp.get_data(as_text=True)
+
+
+def test_feedback_series_buckets(conn):
+    """Séries densas (com zeros) por dia, semana, dia da semana e hora."""
+    rows = [
+        ('satisfeito', '2024-01-01', '09:10:00', 'Segunda-feira'),
+        ('satisfeito', '2024-01-01', '09:50:00', 'Segunda-feira'),
+        ('insatisfeito', '2024-01-03', '18:00:00', 'Quarta-feira'),
+        ('muito_satisfeito', '2024-01-08', '10:00:00', 'Segunda-feira'),
+    ]
+    conn.executemany('INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+
+    day = app.feedback_series(conn, 'day', '2024-01-01', '2024-01-08')
+    assert len(day['labels']) == 8 and day['labels'][0] == '2024-01-01'
+    assert day['series']['satisfeito'][:3] == [2, 0, 0]
+    assert day['total'] == [2, 0, 1, 0, 0, 0, 0, 1]
+
+    week = app.feedback_series(conn, 'week', '2024-01-01', '2024-01-08')
+    assert week['labels'] == ['2024-01-01', '2024-01-08']
+    assert week['total'] == [3, 1]
+
+    weekday = app.feedback_series(conn, 'weekday', '2024-01-01', '2024-01-08')
+    assert weekday['labels'][0] == 'Segunda-feira'
+    assert weekday['total'] == [3, 0, 1, 0, 0, 0, 0]
+
+    hour = app.feedback_series(conn, 'hour', '2024-01-01', '2024-01-01')
+    assert len(hour['labels']) == 24 and hour['labels'][9] == '2024-01-01 09:00'
+    assert hour['series']['satisfeito'][9] == 2 and sum(hour['total']) == 2
+
+
+def test_compare_periods_single_query(conn):
+    """N períodos (sobrepostos ou não) numa consulta: os mesmos totais que período a período."""
+    rows = [(app.GRAUS_SATISFACAO[i % 3], f'2024-01-{1 + i % 28:02d}', '10:00:00', 'x') for i in range(100)]
+    conn.executemany('INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+
+    periodos = [('2024-01-01', '2024-01-07'), ('2024-01-08', '2024-01-14'), ('2024-01-01', '2024-01-31')]
+    assert app.count_feedback_by_periods(conn, periodos) == \
+        [app.count_feedback_by_grau(conn, inicio, fim) for inicio, fim in periodos]
+
+    resultado = app.compare_periods(conn, periodos)
+    assert resultado[0]['variacao'] is None
+    assert resultado[2]['total'] == 100
+    assert resultado[1]['variacao']['satisfeito'] == app.variacao_percentual(
+        resultado[0]['satisfeito'], resultado[1]['satisfeito'])
+
+    plan = query_plan(conn, '''
+        WITH periodos(idx, inicio, fim) AS (VALUES (0, ?, ?))
+        SELECT p.idx, c.grau_satisfacao, SUM(c.total)
+        FROM periodos p JOIN feedback_daily_counts c ON c.data BETWEEN p.inicio AND p.fim
+        GROUP BY p.idx, c.grau_satisfacao
+    ''', ('2024-01-01', '2024-01-07'))
+    assert 'USING PRIMARY KEY' in plan, plan
+
+
+def test_responses_are_compressed(conn):
+    """JSON grande e exportações em streaming vêm em gzip; respostas pequenas não."""
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+    app.insert_feedback_batch(conn, [{'grau_satisfacao': 'satisfeito'}] * 200)
+
+    small = client.get('/api/admin/stats', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+    assert 'Accept-Encoding' in small.headers['Vary']
+
+    page = client.get('/api/admin/historico', headers={'Accept-Encoding': 'gzip'})
+    assert page.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(page.data)) == client.get('/api/admin/historico').get_json()
+
+    # Corpo comprimido -> ETag fraco; revalidar com ele (ou com o forte) dá 304
+    url = '/api/admin/stats/series?bucket=hour'
+    identity = client.get(url)
+    zipped = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert zipped.headers['ETag'] == 'W/' + identity.headers['ETag']
+    again = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']})
+    assert again.status_code == 304 and again.headers['ETag'] == zipped.headers['ETag']
+    again = client.get(url, headers={'If-None-Match': identity.headers['ETag']})
+    assert again.status_code == 304 and again.headers['ETag'] == identity.headers['ETag']
+
+    export = client.get('/api/admin/export/txt', headers={'Accept-Encoding': 'gzip'})
+    assert export.headers['Content-Encoding'] == 'gzip' and 'Content-Length' not in export.headers
+    plain = client.get('/api/admin/export/txt').data
+    assert gzip.decompress(export.data)[:-60] == plain[:-60]  # rodapé com a hora de geração
+    assert len(export.data) < len(plain) / 10
+
+
+class FakeFirestoreDoc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeFirestoreQuery:
+    """Subconjunto de Query usado pela reconciliação (where/order_by/select/limit/start_after)."""
+
+    def __init__(self, docs, field='__name__', since=None, limit=None, after=None, fields=None):
+        self.docs, self.field, self.since, self._limit, self.after, self.fields = docs, field, since, limit, after, fields
+
+    def _copy(self, **changes):
+        state = dict(docs=self.docs, field=self.field, since=self.since, limit=self._limit,
+                     after=self.after, fields=self.fields)
+        state.update(changes)
+        return FakeFirestoreQuery(**state)
+
+    def where(self, field, op, value):
+        assert (field, op) == ('updatedAt', '>')
+        return self._copy(since=value)
+
+    def order_by(self, field):
+        return self._copy(field=field)
+
+    def select(self, fields):
+        return self._copy(fields=fields)
+
+    def limit(self, n):
+        return self._copy(limit=n)
+
+    def start_after(self, doc):
+        return self._copy(after=doc)
+
+    def _key(self, doc_id):
+        return doc_id if self.field == '__name__' else self.docs[doc_id]['updatedAt']
+
+    def stream(self):
+        ids = [i for i in self.docs if self.since is None or self.docs[i].get('updatedAt', 0) > self.since]
+        ids.sort(key=self._key)
+        if self.after is not None:
+            ids = [i for i in ids if self._key(i) > self._key(self.after.id)]
+        for doc_id in ids[:self._limit]:
+            yield FakeFirestoreDoc(doc_id, {k: v for k, v in self.docs[doc_id].items() if k in self.fields})
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+
+    def collection(self, name):
+        assert name == 'feedback'
+        return FakeFirestoreQuery(self.docs)
+
+
+def test_reconcile_hydrates_empty_database(conn, monkeypatch):
+    """Base local vazia: a primeira passagem traz tudo; as seguintes só o que mudou, sem duplicar."""
+    monkeypatch.setattr(app, 'RECONCILE_PAGE_SIZE', 2)
+    monkeypatch.setattr(app, 'RECONCILE_OVERLAP_SECONDS', 0)
+    client = FakeFirestore()
+    # Documento antigo (sem client_key/updatedAt) + documentos novos
+    client.docs['feedback_1'] = {'grau_satisfacao': 'satisfeito', 'data': '2024-01-01', 'hora': '10:00:00'}
+    for i, grau in enumerate(['insatisfeito', 'muito_satisfeito', 'satisfeito']):
+        client.docs[f'feedback_k{i}'] = {'grau_satisfacao': grau, 'data': '2024-01-02', 'hora': f'1{i}:00:00',
+                                         'client_key': f'k{i}', 'updatedAt': 100.0 + i}
+
+    assert app.reconcile_feedback(conn, client) == {'scanned': 4, 'inserted': 4, 'full': True}
+    assert app.count_feedback_by_grau(conn, '2024-01-02') == {
+        'muito_satisfeito': 1, 'satisfeito': 1, 'insatisfeito': 1}
+    assert app.get_sync_value(conn, 'feedback_hwm') == '102.0'
+
+    client.docs['feedback_k9'] = {'grau_satisfacao': 'satisfeito', 'data': '2024-01-03', 'hora': '09:00:00',
+                                  'client_key': 'k9', 'updatedAt': 200.0}
+    assert app.reconcile_feedback(conn, client) == {'scanned': 1, 'inserted': 1, 'full': False}
+    assert app.reconcile_feedback(conn, client, full=True)['inserted'] == 0
+    assert app.count_historico(conn, '', '', '', '') == 5
+
+
+def test_metrics_json_and_prometheus(conn):
+    """/api/admin/metrics conta pedidos e consultas por rota, em JSON e no formato do Prometheus."""
+    app.reset_metrics()
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+    for _ in range(3):
+        client.post('/api/feedback', json={'grau_satisfacao': 'satisfeito'})
+
+    routes = {(r['method'], r['route']): r for r in client.get('/api/admin/metrics').get_json()['routes']}
+    feedback = routes[('POST', '/api/feedback')]
+    assert feedback['count'] == 3 and feedback['errors'] == 0
+    assert feedback['sqlite']['queriesPerRequest'] >= 1
+    assert 0 < feedback['p50Ms'] <= feedback['p95Ms'] <= feedback['p99Ms']
+
+    text = client.get('/api/admin/metrics?format=prometheus').data.decode()
+    assert 'feedback_http_request_duration_seconds_count{method="POST",route="/api/feedback"} 3' in text
+    assert 'feedback_http_request_duration_seconds_bucket{method="POST",route="/api/feedback",le="+Inf"} 3' in text
+    assert app.app.test_client().get('/api/admin/metrics').status_code == 401
+
+
+def test_metrics_bearer_token(conn, monkeypatch):
+    """Sem sessão admin, /api/admin/metrics aceita só o METRICS_TOKEN exato."""
+    monkeypatch.setattr(app, 'METRICS_TOKEN', 's3gredo')
+    client = app.app.test_client()
+    assert client.get('/api/admin/metrics', headers={'Authorization': 'Bearer s3gredo'}).status_code == 200
+    for value in ['Bearer s3gred', 'Bearer s3gredo ', 's3gredo', 'Bearer sègredo']:
+        assert client.get('/api/admin/metrics', headers={'Authorization': value}).status_code == 401, value
+
+
+def test_group_commit_assigns_ids(conn, monkeypatch):
+    """Com group commit, pedidos concorrentes partilham commits e cada um recebe o seu id."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    monkeypatch.setattr(app, 'FEEDBACK_GROUP_COMMIT', True)
+    monkeypatch.setattr(app, 'GROUP_COMMIT_MAX_DELAY_MS', 20)
+    before = app.get_group_commit_stats()
+
+    def tap(i):
+        return app.app.test_client().post(
+            '/api/feedback', json={'grau_satisfacao': app.GRAUS_SATISFACAO[i % 3]}).get_json()['id']
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        ids = list(pool.map(tap, range(40)))
+
+    stats = app.get_group_commit_stats()
+    assert sorted(ids) == [row['id'] for row in conn.execute('SELECT id FROM feedback ORDER BY id')]
+    assert stats['rows'] - before['rows'] == 40
+    assert stats['commits'] - before['commits'] < 40
+
+
+def test_group_commit_timeout_cancels_only_unwritten_rows(conn, monkeypatch):
+    """Timeout: um pedido ainda na fila é cancelado (erro, nada gravado); um lote já em escrita é esperado."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    monkeypatch.setattr(app, 'FEEDBACK_GROUP_COMMIT', True)
+    monkeypatch.setattr(app, 'GROUP_COMMIT_TIMEOUT_SECONDS', 0.1)
+    writing = threading.Event()
+    insert_rows = app.insert_feedback_rows
+
+    def slow_insert(*args, **kwargs):
+        writing.set()
+        time.sleep(0.4)
+        return insert_rows(*args, **kwargs)
+
+    monkeypatch.setattr(app, 'insert_feedback_rows', slow_insert)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        slow = pool.submit(lambda: app.record_feedback(app.get_db(), 'satisfeito'))
+        assert writing.wait(5)
+        with pytest.raises(app.FutureTimeoutError):
+            app.record_feedback(conn, 'insatisfeito')  # fica na fila atrás do lote lento
+        feedback_id = slow.result(5)
+
+    time.sleep(0.5)  # o pedido cancelado não chega a ser gravado pelo lote seguinte
+    rows = conn.execute('SELECT id, grau_satisfacao FROM feedback').fetchall()
+    assert [tuple(row) for row in rows] == [(feedback_id, 'satisfeito')]
+
+
+def test_group_commit_thread_survives_errors(conn, monkeypatch):
+    """Um erro antes ou depois da escrita falha só esse lote; a thread escritora continua viva."""
+    failures = ['setup', 'publish']
+
+    def flaky(name, original):
+        def wrapper(*args, **kwargs):
+            if failures and failures[0] == name:
+                failures.pop(0)
+                raise RuntimeError(name)
+            return original(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(app, 'firebase_configured', flaky('setup', app.firebase_configured))
+    monkeypatch.setattr(app, 'publish_live_update', flaky('publish', app.publish_live_update))
+    now = datetime.now()
+
+    def submit():
+        return app.submit_group_commit(app.feedback_row('satisfeito', now, app.new_feedback_key()), app.feedback_ts(now))
+
+    with pytest.raises(RuntimeError, match='setup'):
+        submit().result(5)
+    thread = app._group_commit_thread
+    first = submit().result(5)  # grava, mas publish_live_update falha depois do commit
+    second = submit().result(5)
+    assert app._group_commit_thread is thread and thread.is_alive()
+    assert failures == [] and second > first
+    assert [row['id'] for row in conn.execute('SELECT id FROM feedback')] == [first, second]
+
+
+async def asgi_call(asgi_app, method, path, body=b'', headers=()):
+    """Um pedido à app ASGI (no event loop atual); devolve (status, cabeçalhos, corpo)."""
+    import asyncio
+
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'http_version': '1.1', 'method': method, 'path': path,
+        'root_path': '', 'query_string': b'', 'scheme': 'http',
+        'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+    }
+    await asgi_app(scope, receive, send)
+    start = sent[0]
+    return (start['status'], {k.decode(): v.decode() for k, v in start['headers']},
+            b''.join(m.get('body', b'') for m in sent[1:]))
+
+
+def asgi_request(asgi_app, method, path, body=b'', headers=()):
+    """Chama a app ASGI com asyncio; devolve (status, cabeçalhos, corpo)."""
+    import asyncio
+
+    return asyncio.run(asgi_call(asgi_app, method, path, body, headers))
+
+
+def test_asgi_native_routes(conn):
+    """api/asgi.py: rotas nativas (feedback, resumo com 304) iguais às da app Flask."""
+    from api import asgi
+
+    status, _, body = asgi_request(asgi.app, 'POST', '/api/feedback', b'{"grau_satisfacao": "satisfeito"}',
+                                   [('content-type', 'application/json')])
+    assert status == 200
+    feedback_id = json.loads(body)['id']
+    assert conn.execute('SELECT grau_satisfacao FROM feedback WHERE id = ?', (feedback_id,)).fetchone()[0] == 'satisfeito'
+
+    status, _, body = asgi_request(asgi.app, 'POST', '/api/feedback', b'{"grau_satisfacao": "x"}')
+    assert status == 400
+
+    status, headers, body = asgi_request(asgi.app, 'GET', '/api/public/summary')
+    assert status == 200 and json.loads(body)['lastId'] == feedback_id
+    flask_response = app.app.test_client().get('/api/public/summary')
+    assert headers['etag'] == flask_response.headers['ETag']
+    assert json.loads(body) == flask_response.get_json()
+
+    assert headers['vary'] == flask_response.headers['Vary']
+
+    status, _, body = asgi_request(asgi.app, 'GET', '/api/public/summary', headers=[('if-none-match', headers['etag'])])
+    assert status == 304 and body == b''
+
+
+def test_asgi_native_routes_compressed_like_flask(conn, monkeypatch):
+    """Acima de COMPRESS_MIN_BYTES a rota nativa comprime e enfraquece o ETag como o compress_response."""
+    from api import asgi
+
+    monkeypatch.setattr(app, 'COMPRESS_MIN_BYTES', 0)
+    monkeypatch.setattr(app, '_brotli', None)
+    monkeypatch.setattr(app, '_brotli_checked', True)
+    app.record_feedback(conn, 'satisfeito')
+
+    status, headers, body = asgi_request(asgi.app, 'GET', '/api/public/summary', headers=[('accept-encoding', 'gzip')])
+    flask_response = app.app.test_client().get('/api/public/summary', headers={'Accept-Encoding': 'gzip'})
+    assert status == 200
+    assert headers['content-encoding'] == flask_response.headers['Content-Encoding'] == 'gzip'
+    assert headers['etag'] == flask_response.headers['ETag'] and headers['etag'].startswith('W/')
+    assert json.loads(gzip.decompress(body)) == json.loads(gzip.decompress(flask_response.data))
+
+    status, _, body = asgi_request(asgi.app, 'GET', '/api/public/summary',
+                                   headers=[('accept-encoding', 'gzip'), ('if-none-match', headers['etag'])])
+    assert status == 304 and body == b''
+
+
+def test_asgi_wsgi_bridge(conn):
+    """As rotas sem versão nativa passam pela app Flask através do asgiref."""
+    pytest.importorskip('asgiref')
+    from api import asgi
+
+    status, headers, body = asgi_request(asgi.app, 'GET', '/api/health')
+    assert status == 200 and json.loads(body)
+
+    # Exportação em streaming (admin): os blocos e o close() da resposta Flask passam pela ponte
+    app.record_feedback(conn, 'satisfeito')
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+    cookie = f"{app.app.config['SESSION_COOKIE_NAME']}={client.get_cookie(app.app.config['SESSION_COOKIE_NAME']).value}"
+    status, headers, body = asgi_request(asgi.app, 'GET', '/api/admin/export/csv-plain', headers=[('cookie', cookie)])
+    assert status == 200 and headers['content-type'].startswith('text/csv')
+    assert body == client.get('/api/admin/export/csv-plain').data
+
+
+def test_asgi_group_commit_not_limited_by_db_pool(conn, monkeypatch):
+    """Com FEEDBACK_GROUP_COMMIT os pedidos ASGI esperam no event loop: um lote junta mais do que ASGI_DB_THREADS."""
+    import asyncio
+
+    from api import asgi
+
+    monkeypatch.setattr(app, 'FEEDBACK_GROUP_COMMIT', True)
+    monkeypatch.setattr(app, 'GROUP_COMMIT_MAX_DELAY_MS', 50)
+    before = app.get_group_commit_stats()
+
+    async def taps():
+        return await asyncio.gather(*[
+            asgi_call(asgi.app, 'POST', '/api/feedback', b'{"grau_satisfacao": "satisfeito"}') for _ in range(40)
+        ])
+
+    responses = asyncio.run(taps())
+    ids = [json.loads(body)['id'] for status, _, body in responses if status == 200]
+    stats = app.get_group_commit_stats()
+    assert sorted(ids) == [row['id'] for row in conn.execute('SELECT id FROM feedback ORDER BY id')]
+    assert stats['rows'] - before['rows'] == 40
+    assert stats['commits'] - before['commits'] < 40 / asgi.ASGI_DB_THREADS
+
+
+def test_asgi_is_admin_ignores_malformed_cookies(conn):
+    """Um cookie malformado de outro site não dá 500; a sessão admin continua a ser reconhecida."""
+    from api import asgi
+
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+    name = app.app.config['SESSION_COOKIE_NAME']
+    session_cookie = client.get_cookie(name).value
+
+    def scope(cookie):
+        return {'headers': [(b'cookie', cookie.encode('latin-1'))]}
+
+    assert asgi.is_admin(scope('x=1; {=2')) is False
+    assert asgi.is_admin(scope(f'x=1; b(=2; {name}={session_cookie}')) is True
+
+
+@pytest.fixture
+def firebase_signer(conn, monkeypatch):
+    """Par de chaves RSA local no lugar dos certificados da Google (sem rede)."""
+    import jwt
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'teste')])
+    now = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(now).not_valid_after(now + timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    pem = cert.public_bytes(serialization.Encoding.PEM).decode('ascii')
+
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return {'kid1': pem}, 3600
+
+    monkeypatch.setattr(app, 'fetch_firebase_certs', fetch)
+    app.reset_firebase_token_cache()
+    project = app.FIREBASE_WEB_CONFIG['projectId']
+
+    def sign(kid='kid1', **claims):
+        issued = int(time.time())
+        payload = {'iss': app.FIREBASE_TOKEN_ISSUER + project, 'aud': project, 'sub': 'uid-1',
+                   'iat': issued, 'exp': issued + 3600, 'auth_time': issued}
+        payload.update(claims)
+        return jwt.encode(payload, key, algorithm='RS256', headers={'kid': kid})
+
+    yield sign, fetches
+    app.reset_firebase_token_cache()
+
+
+def test_cold_start_does_not_import_firebase_or_openpyxl(tmp_path):
+    """Importar api/index.py e servir as rotas públicas não carrega o firebase_admin nem o openpyxl."""
+    import subprocess
+
+    script = (
+        'import sys\n'
+        'from api.index import app\n'
+        'client = app.test_client()\n'
+        "assert client.get('/').status_code == 200\n"
+        "assert client.get('/api/public/summary').status_code == 200\n"
+        "print(sorted(name for name in ('firebase_admin', 'google.cloud.firestore', 'openpyxl') if name in sys.modules))\n"
+    )
+    env = dict(os.environ, DATABASE_PATH=str(tmp_path / 'feedback.db'))
+    for name in ('FIREBASE_SERVICE_ACCOUNT_JSON', 'FIREBASE_SERVICE_ACCOUNT_FILE', 'GOOGLE_APPLICATION_CREDENTIALS'):
+        env.pop(name, None)
+    result = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == '[]'
+
+
+def test_firebase_initialized_once_under_concurrency(monkeypatch):
+    """Vários threads a pedir o cliente ao mesmo tempo: uma só initialize_app e um só firestore.client()."""
+    import threading
+    import types
+
+    calls = {'initialize_app': 0, 'client': 0}
+    started = threading.Barrier(8)
+
+    def initialize_app(cred, options):
+        calls['initialize_app'] += 1
+        time.sleep(0.05)
+        firebase_admin._apps['[DEFAULT]'] = cred
+
+    def client():
+        calls['client'] += 1
+        return object()
+
+    firebase_admin = types.ModuleType('firebase_admin')
+    firebase_admin._apps = {}
+    firebase_admin.initialize_app = initialize_app
+    firebase_admin.credentials = types.SimpleNamespace(Certificate=lambda value: ('cert', value))
+    firebase_admin.firestore = types.SimpleNamespace(client=client)
+    monkeypatch.setitem(sys.modules, 'firebase_admin', firebase_admin)
+    monkeypatch.setitem(sys.modules, 'firebase_admin.credentials', firebase_admin.credentials)
+    monkeypatch.setitem(sys.modules, 'firebase_admin.firestore', firebase_admin.firestore)
+    for name, value in [('firebase_db', None), ('firebase_init_error', None), ('_firebase_app_ready', False),
+                        ('_firebase_init_attempted', False), ('_firebase_credentials', ('json', '{}')),
+                        ('_firebase_credentials_resolved', True)]:
+        monkeypatch.setattr(app, name, value)
+
+    clients = []
+
+    def worker():
+        started.wait()
+        clients.append(app.get_firebase_db())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == {'initialize_app': 1, 'client': 1}
+    assert len(clients) == 8 and clients[0] is not None and all(c is clients[0] for c in clients)
+
+
+def test_firebase_token_verification_caches_certs(conn, firebase_signer):
+    """As chaves são pedidas uma vez (max-age) e partilhadas via sync_state; tokens inválidos dão ValueError."""
+    sign, fetches = firebase_signer
+
+    assert app.verify_firebase_id_token(sign(email='a@b.pt'))['uid'] == 'uid-1'
+    app.verify_firebase_id_token(sign())
+    assert len(fetches) == 1
+
+    # Outro processo (memória vazia) reutiliza os certificados guardados na base
+    app.reset_firebase_token_cache()
+    app.verify_firebase_id_token(sign())
+    assert len(fetches) == 1
+
+    past = int(time.time()) - 7200
+    for token in [sign(iat=past, exp=past + 60), sign(aud='outro-projeto'), sign(kid='desconhecido'),
+                  sign()[:-4] + 'AAAA', 'não-é-um-jwt']:
+        with pytest.raises(ValueError):
+            app.verify_firebase_id_token(token)
+    # kid desconhecido logo após a leitura não volta a pedir os certificados
+    assert len(fetches) == 1
+
+
+def test_firebase_certs_min_ttl_and_fetch_outside_lock(conn, firebase_signer, monkeypatch):
+    """Sem max-age as chaves ficam FIREBASE_CERTS_MIN_TTL_SECONDS; o GET não bloqueia quem já tem a chave."""
+    import threading
+
+    sign, fetches = firebase_signer
+    pem_fetch = app.fetch_firebase_certs
+    monkeypatch.setattr(app, 'fetch_firebase_certs', lambda: (pem_fetch()[0], 0))
+    for _ in range(3):
+        app.verify_firebase_id_token(sign())
+    assert len(fetches) == 1
+
+    # Chaves expiradas (em memória e na base) e um GET lento noutro thread
+    started, release = threading.Event(), threading.Event()
+
+    def slow_fetch():
+        started.set()
+        release.wait(5)
+        return pem_fetch()
+
+    monkeypatch.setattr(app, 'fetch_firebase_certs', slow_fetch)
+    app._firebase_certs['expires'] = 0.0
+    with conn:
+        conn.execute("DELETE FROM sync_state WHERE name = 'firebase_certs'")
+    refresher = threading.Thread(target=app.verify_firebase_id_token, args=(sign(),))
+    refresher.start()
+    try:
+        assert started.wait(5)
+        assert app.verify_firebase_id_token(sign())['uid'] == 'uid-1'  # chaves antigas, sem esperar
+        assert app._firebase_certs_lock.acquire(blocking=False)
+        app._firebase_certs_lock.release()
+    finally:
+        release.set()
+        refresher.join(5)
+    assert len(fetches) == 2 and app._firebase_certs['expires'] > time.time()
+
+
+def test_admin_login_firebase_caches_get_user(conn, firebase_signer, monkeypatch):
+    """Login com token sem email: auth.get_user só é chamado uma vez dentro do TTL."""
+    from firebase_admin import auth
+
+    sign, _ = firebase_signer
+    calls = []
+
+    def get_user(uid):
+        calls.append(uid)
+        return type('User', (), {'email': 'admin@exemplo.pt'})()
+
+    monkeypatch.delenv('FIREBASE_AUTH_EMULATOR_HOST', raising=False)
+    monkeypatch.setattr(app, 'ensure_firebase_app', lambda: True)
+    monkeypatch.setattr(auth, 'get_user', get_user)
+
+    for _ in range(2):
+        client = app.app.test_client()
+        resp = client.post('/api/admin/login/firebase', json={'idToken': sign()})
+        assert resp.status_code == 200 and resp.get_json()['email'] == 'admin@exemplo.pt'
+        assert client.get('/api/admin/me').get_json()['loggedIn']
+    assert calls == ['uid-1']
+
+    resp = app.app.test_client().post('/api/admin/login/firebase', json={'idToken': sign(aud='outro')})
+    assert resp.status_code == 401
+
+
+def test_export_jobs_cache_and_range(conn, tmp_path, monkeypatch):
+    """Job de exportação em background: progresso, download com Range e cache por versão dos dados."""
+    monkeypatch.setattr(app, 'EXPORT_CACHE_DIR', str(tmp_path / 'exports'))
+    for i in range(30):
+        app.app.test_client().post('/api/feedback', json={'grau_satisfacao': app.GRAUS_SATISFACAO[i % 3]})
+
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+
+    assert client.post('/api/admin/exports', json={'format': 'pdf'}).status_code == 400
+
+    def wait_done(job):
+        deadline = time.time() + 10
+        while job['status'] in ('queued', 'running') and time.time() < deadline:
+            time.sleep(0.01)
+            job = client.get(f"/api/admin/exports/{job['id']}").get_json()
+        assert job['status'] == 'done', job
+        return job
+
+    resp = client.post('/api/admin/exports', json={'format': 'csv'})
+    assert resp.status_code in (200, 202) and resp.headers['Location'].endswith(resp.get_json()['id'])
+    job = wait_done(resp.get_json())
+    assert job['rows'] == job['totalRows'] == 30 and job['progress'] == 1.0 and not job['cached']
+
+    full = client.get(job['downloadUrl'])
+    assert full.status_code == 200 and full.data.count(b'\n') == 31
+    assert full.data == client.get('/api/admin/export/csv-plain').data
+    partial = client.get(job['downloadUrl'], headers={'Range': 'bytes=0-9'})
+    assert partial.status_code == 206 and partial.data == full.data[:10]
+
+    # Pedido igual: vem da cache (mesmo ficheiro), sem novo job no pool
+    again = client.post('/api/admin/exports', json={'format': 'csv'}).get_json()
+    assert again['status'] == 'done' and client.get(again['downloadUrl']).data == full.data
+
+    # Um novo registo muda a versão dos dados: novo ficheiro
+    app.app.test_client().post('/api/feedback', json={'grau_satisfacao': 'satisfeito'})
+    job = wait_done(client.post('/api/admin/exports', json={'format': 'csv'}).get_json())
+    assert job['totalRows'] == 31 and not job['cached']
+
+    job = wait_done(client.post('/api/admin/exports', json={'format': 'xlsx'}).get_json())
+    assert client.get(job['downloadUrl']).data[:2] == b'PK'
+
+
+def test_export_job_inline_on_serverless(conn, tmp_path, monkeypatch):
+    """EXPORT_JOBS_INLINE (Vercel): o POST gera o ficheiro no próprio pedido, sem pool."""
+    monkeypatch.setattr(app, 'EXPORT_CACHE_DIR', str(tmp_path / 'exports'))
+    monkeypatch.setattr(app, 'EXPORT_JOBS_INLINE', True)
+    monkeypatch.setattr(app, '_export_pool', None)
+    app.insert_feedback_batch(conn, [{'grau_satisfacao': 'satisfeito'}] * 5)
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+
+    resp = client.post('/api/admin/exports', json={'format': 'csv'})
+    job = resp.get_json()
+    assert resp.status_code == 200 and job['status'] == 'done' and job['rows'] == 5
+    assert app._export_pool is None
+    assert client.get(job['downloadUrl']).data == client.get('/api/admin/export/csv-plain').data
+
+
+def test_delta_export_since_id(conn):
+    """?since_id devolve só os registos novos e X-Next-Since-Id encadeia o pedido seguinte."""
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+
+    def tap():
+        return app.app.test_client().post('/api/feedback', json={'grau_satisfacao': 'satisfeito'}).get_json()['id']
+
+    ids = [tap() for _ in range(5)]
+    full = client.get('/api/admin/export/csv-plain')
+    assert 'X-Next-Since-Id' not in full.headers
+
+    first = client.get('/api/admin/export/csv-plain?since_id=0')
+    assert first.headers['X-Next-Since-Id'] == str(ids[-1])
+    assert first.data == full.data
+    database_id = first.headers['X-Database-Id']
+    assert len(database_id) == 32 and database_id == app.get_sync_value(conn, 'database_id')
+
+    new_ids = [tap() for _ in range(2)]
+    delta = client.get(f"/api/admin/export/csv-plain?since_id={first.headers['X-Next-Since-Id']}")
+    lines = delta.get_data(as_text=True).splitlines()
+    assert [int(line.split(',')[0]) for line in lines[1:]] == new_ids
+    assert delta.headers['X-Next-Since-Id'] == str(new_ids[-1])
+
+    empty = client.get(f"/api/admin/export/txt?since_id={new_ids[-1]}")
+    assert empty.headers['X-Next-Since-Id'] == str(new_ids[-1])
+    assert empty.headers['X-Database-Id'] == database_id
+    assert 'Total de registros: 0' in empty.get_data(as_text=True)
+    assert client.get('/api/admin/export/csv-plain?since_id=-1').status_code == 400
+
+
+def seed_export_rows(conn, count=10):
+    """`count` registos em dias/horas diferentes, inseridos fora da ordem cronológica."""
+    start = datetime(2024, 3, 1, 8, 0)
+    events = [
+        {'grau_satisfacao': app.GRAUS_SATISFACAO[i % 3], 'createdAt': (start + timedelta(days=i % 5, minutes=i)).isoformat()}
+        for i in reversed(range(count))
+    ]
+    app.insert_feedback_batch(conn, events)
+
+
+def legacy_export_rows(conn, data_inicio=None, data_fim=None):
+    # Como antes do streaming: fetchall() de tudo
+    sql, params = app.export_query(data_inicio, data_fim)
+    return conn.execute(sql, params).fetchall()
+
+
+def legacy_csv_export(conn, data_inicio=None, data_fim=None):
+    """CSV gerado como antes do streaming (fetchall + StringIO)."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['id', 'grau_satisfacao', 'data', 'hora', 'dia_semana'])
+    for row in legacy_export_rows(conn, data_inicio, data_fim):
+        writer.writerow([
+            row['id'],
+            app.GRAU_LABELS.get(row['grau_satisfacao'], row['grau_satisfacao']),
+            row['data'],
+            row['hora'],
+            row['dia_semana'],
+        ])
+    return output.getvalue().encode('utf-8')
+
+
+def legacy_txt_export(conn, data_inicio=None, data_fim=None):
+    """TXT gerado como antes do streaming, sem a linha final "Gerado em"."""
+    registros = legacy_export_rows(conn, data_inicio, data_fim)
+    output = io.StringIO()
+    output.write('=' * 80 + '\n')
+    output.write('RELATÓRIO DE FEEDBACK DE SATISFAÇÃO\n')
+    output.write('=' * 80 + '\n\n')
+    for row in registros:
+        output.write(f"ID: {row['id']}\n")
+        output.write(f"Grau de Satisfação: {app.GRAU_LABELS.get(row['grau_satisfacao'], row['grau_satisfacao'])}\n")
+        output.write(f"Data: {row['data']}\n")
+        output.write(f"Hora: {row['hora']}\n")
+        output.write(f"Dia da Semana: {row['dia_semana']}\n")
+        output.write('-' * 80 + '\n\n')
+    output.write(f"\nTotal de registros: {len(registros)}\n")
+    return output.getvalue().encode('utf-8')
+
+
+@pytest.mark.parametrize('query, dates', [
+    ('', (None, None)),
+    ('?data_inicio=2024-03-02&data_fim=2024-03-03', ('2024-03-02', '2024-03-03')),
+])
+def test_streamed_exports_match_legacy_output(conn, monkeypatch, query, dates):
+    """CSV/TXT em streaming (vários blocos de EXPORT_CHUNK_SIZE) têm o mesmo conteúdo que o export antigo."""
+    monkeypatch.setattr(app, 'EXPORT_CHUNK_SIZE', 3)
+    seed_export_rows(conn)
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+
+    resp = client.get(f'/api/admin/export/csv-plain{query}')
+    assert resp.status_code == 200 and resp.is_streamed
+    assert resp.headers['Content-Disposition'].startswith('attachment; filename=feedback_export_')
+    assert resp.data == legacy_csv_export(conn, *dates)
+    assert len(resp.data.splitlines()) > 1
+
+    resp = client.get(f'/api/admin/export/txt{query}')
+    assert resp.status_code == 200 and resp.is_streamed
+    body, generated = resp.data.rsplit(b'Gerado em: ', 1)
+    assert body == legacy_txt_export(conn, *dates)
+    assert datetime.strptime(generated.decode('utf-8').strip(), '%d/%m/%Y %H:%M:%S')
+
+
+def test_iter_export_rows_reads_in_chunks(conn, monkeypatch):
+    """iter_export_rows devolve blocos de EXPORT_CHUNK_SIZE linhas, pela ordem da consulta, e reporta o progresso."""
+    monkeypatch.setattr(app, 'EXPORT_CHUNK_SIZE', 4)
+    seed_export_rows(conn)
+    progress = []
+
+    chunks = list(app.iter_export_rows(conn, progress=progress.append))
+    assert [len(rows) for rows in chunks] == [4, 4, 2] == progress
+    assert [row['id'] for rows in chunks for row in rows] == [row['id'] for row in legacy_export_rows(conn)]
+
+    # Um gerador abandonado a meio fecha o cursor (a ligação continua utilizável)
+    rows = app.iter_export_rows(conn)
+    next(rows)
+    rows.close()
+    assert conn.execute('SELECT COUNT(*) FROM feedback').fetchone()[0] == 10
+
+
+@pytest.mark.parametrize('route', ['csv', 'xlsx'])
+def test_xlsx_export_rows_and_header(conn, tmp_path, monkeypatch, route):
+    """O Excel write-only tem o cabeçalho formatado, as larguras e as mesmas linhas da consulta, em ordem."""
+    from openpyxl import load_workbook
+
+    monkeypatch.setattr(app, 'EXPORT_CHUNK_SIZE', 3)
+    monkeypatch.setattr(app, 'EXPORT_CACHE_DIR', str(tmp_path))
+    seed_export_rows(conn)
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+
+    resp = client.get(f'/api/admin/export/{route}?data_inicio=2024-03-02&data_fim=2024-03-04')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    ws = load_workbook(io.BytesIO(resp.data))['Feedback']
+
+    rows = list(ws.iter_rows(values_only=True))
+    assert rows[0] == ('ID', 'Grau de Satisfação', 'Data', 'Hora', 'Dia da Semana')
+    assert rows[1:] == [
+        (row['id'], app.GRAU_LABELS[row['grau_satisfacao']], row['data'], row['hora'], row['dia_semana'])
+        for row in legacy_export_rows(conn, '2024-03-02', '2024-03-04')
+    ]
+    assert len(rows) - 1 == 6
+
+    assert all(cell.font.b and cell.fill.fgColor.rgb.endswith('4472C4') for cell in ws[1])
+    assert {column: ws.column_dimensions[column].width for column in app.XLSX_COLUMN_WIDTHS} == app.XLSX_COLUMN_WIDTHS
+
+
+@pytest.mark.filterwarnings('error::pytest.PytestUnraisableExceptionWarning')
+@pytest.mark.parametrize('route', ['csv-plain', 'txt', 'xlsx'])
+@pytest.mark.parametrize('query', ['data_inicio=foo&data_fim=bar', 'data_inicio=2024-13-01&data_fim=2024-01-31'])
+def test_export_invalid_dates_rejected_before_streaming(conn, route, query):
+    """Datas inválidas dão 400 antes de a resposta começar (e não um download cortado a meio)."""
+    app.insert_feedback_batch(conn, [{'grau_satisfacao': 'satisfeito'}] * 3)
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+
+    resp = client.get(f'/api/admin/export/{route}?{query}')
+    assert resp.status_code == 400 and resp.get_json() == {'error': 'Datas inválidas'}
+    # Só uma das datas: o filtro é ignorado, como antes
+    assert client.get(f'/api/admin/export/{route}?data_inicio=foo').status_code == 200
+
+
+class StubBatch:
+    def __init__(self, client):
+        self.client, self.writes = client, []
+
+    def set(self, ref, payload):
+        self.writes.append((ref, payload))
+
+    def commit(self):
+        if self.client.fail:
+            raise RuntimeError('Firestore indisponível')
+        self.client.commits.append(len(self.writes))
+        self.client.docs.update(self.writes)
+
+
+class StubFirestoreWrites:
+    """Cliente Firestore mínimo para o outbox: collection().document() + batch()."""
+
+    def __init__(self):
+        self.docs, self.commits, self.fail = {}, [], False
+
+    def collection(self, name):
+        return type('Collection', (), {'document': lambda _self, doc_id: f'{name}/{doc_id}'})()
+
+    def batch(self):
+        return StubBatch(self)
+
+
+@pytest.fixture
+def firestore_stub(conn, monkeypatch):
+    """Firestore falso; o worker em background não arranca (os testes drenam à mão)."""
+    client = StubFirestoreWrites()
+    monkeypatch.setattr(app, 'start_sync_worker', lambda: None)
+    monkeypatch.setattr(app, '_sync_state', dict(app._sync_state, synced=0, batches=0, failures=0,
+                                                 consecutiveFailures=0, nextRetryAt=None))
+    monkeypatch.setattr(app, '_sync_retry_after', 0.0)
+    app.use_firebase_client(client)
+    yield client
+    app.use_firebase_client(None)
+
+
+def test_sync_outbox_drains_in_batches(conn, firestore_stub, monkeypatch):
+    """O outbox é enviado em lotes de SYNC_BATCH_SIZE e apagado após cada commit."""
+    monkeypatch.setattr(app, 'SYNC_BATCH_SIZE', 2)
+    with conn:
+        when = datetime(2024, 1, 1, 10)
+        app.insert_feedback_rows(conn, [(app.feedback_row('satisfeito', when, f'k{i}'), app.feedback_ts(when))
+                                        for i in range(5)], True)
+
+    sent = []
+    while True:
+        count, delay = app.sync_outbox_once(conn, firestore_stub)
+        assert delay == 0
+        if not count:
+            break
+        sent.append(count)
+
+    assert sent == firestore_stub.commits == [2, 2, 1]
+    assert sorted(firestore_stub.docs) == [f'feedback/feedback_k{i}' for i in range(5)]
+    assert all('updatedAt' in payload for payload in firestore_stub.docs.values())
+    assert conn.execute('SELECT COUNT(*) FROM sync_outbox').fetchone()[0] == 0
+    assert app._sync_state['synced'] == 5 and app._sync_state['batches'] == 3
+
+
+def test_sync_outbox_backoff_and_retry(conn, firestore_stub, monkeypatch):
+    """Falhas mantêm o lote no outbox (attempts/last_error) com espera exponencial; depois reenvia."""
+    monkeypatch.setattr(app, 'SYNC_BACKOFF_BASE_SECONDS', 1)
+    monkeypatch.setattr(app, 'SYNC_BACKOFF_MAX_SECONDS', 3)
+    with conn:
+        when = datetime(2024, 1, 1, 10)
+        app.insert_feedback_rows(conn, [(app.feedback_row('insatisfeito', when, 'k1'), app.feedback_ts(when))], True)
+
+    firestore_stub.fail = True
+    delays = [app.sync_outbox_once(conn, firestore_stub)[1] for _ in range(3)]
+    assert delays == [1, 2, 3]
+    row = conn.execute('SELECT attempts, last_error FROM sync_outbox').fetchone()
+    assert row['attempts'] == 3 and 'indisponível' in row['last_error']
+
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+    status = client.get('/api/admin/sync/status').get_json()
+    assert status['pending'] == 1 and status['consecutiveFailures'] == 3 and status['maxAttempts'] == 3
+    assert status['nextRetryAt'] and 'indisponível' in status['lastError']
+
+    firestore_stub.fail = False
+    assert app.sync_outbox_once(conn, firestore_stub) == (1, 0)
+    status = client.get('/api/admin/sync/status').get_json()
+    assert status['pending'] == 0 and status['consecutiveFailures'] == 0 and status['nextRetryAt'] is None
+    assert list(firestore_stub.docs) == ['feedback/feedback_k1']
+
+
+def test_sync_outbox_drained_at_end_of_request(conn, firestore_stub, monkeypatch):
+    """Serverless (SYNC_DRAIN_ON_REQUEST): o pedido que escreveu envia o outbox ao fechar a resposta."""
+    monkeypatch.setattr(app, 'SYNC_DRAIN_ON_REQUEST', True)
+    resp = app.app.test_client().post('/api/feedback', json={'grau_satisfacao': 'satisfeito'})
+    resp.close()
+    assert resp.status_code == 200
+    assert conn.execute('SELECT COUNT(*) FROM sync_outbox').fetchone()[0] == 0
+    assert firestore_stub.commits == [1]
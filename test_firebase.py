@@ -62,7 +62,7 @@ def test_firebase():
     try:
         import app
         
-        if app.firebase_db is None:
+        if app.get_firebase_db() is None:
             print("⚠ Firebase não está inicializado")
             return False
         
@@ -70,7 +70,7 @@ def test_firebase():
         
         # Tentar ler dados
         try:
-            docs = app.firebase_db.collection('feedback').limit(1).stream()
+            docs = app.get_firebase_db().collection('feedback').limit(1).stream()
             count = 0
             for doc in docs:
                 count += 1
@@ -94,21 +94,18 @@ def test_create_feedback():
     try:
         import sqlite3
         from datetime import datetime
+        import app
         
         # Dados de teste
         grau_satisfacao = "muito_satisfeito"
         now = datetime.now()
-        data_str = now.strftime('%Y-%m-%d')
-        hora_str = now.strftime('%H:%M:%S')
-        dias_semana = ['Segunda-feira', 'Terça-feira', 'Quarta-feira', 
-                       'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
-        dia_semana = dias_semana[now.weekday()]
+        client_key = app.new_feedback_key()
         
-        # Guardar no SQLite
+        # Guardar no SQLite (na tabela: um INSERT na view `feedback` não devolve o id)
         conn = sqlite3.connect('feedback.db')
         cursor = conn.execute(
-            'INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)',
-            (grau_satisfacao, data_str, hora_str, dia_semana)
+            'INSERT INTO feedback_compact (ts, grau, client_key) VALUES (?, ?, ?)',
+            (app.feedback_ts(now), app.GRAU_CODES[grau_satisfacao], client_key)
         )
         conn.commit()
         feedback_id = cursor.lastrowid
@@ -116,17 +113,10 @@ def test_create_feedback():
         
         print(f"✓ Feedback criado no SQLite (ID: {feedback_id})")
         
-        # Tentar guardar no Firebase
-        import app
-        if app.firebase_db:
-            feedback_data = {
-                'grau_satisfacao': grau_satisfacao,
-                'data': data_str,
-                'hora': hora_str,
-                'dia_semana': dia_semana,
-                'timestamp': now.isoformat()
-            }
-            app.firebase_db.collection('feedback').document(f'feedback_{feedback_id}').set(feedback_data)
+        # Tentar guardar no Firebase (mesmo documento que o outbox usaria)
+        if app.get_firebase_db():
+            feedback_data = app.feedback_row(grau_satisfacao, now, client_key)
+            app.get_firebase_db().collection('feedback').document(app.feedback_doc_id(client_key)).set(feedback_data)
             print(f"✓ Feedback sincronizado com Firebase")
         else:
             print("⚠ Firebase não está disponível, apenas SQLite foi usado")